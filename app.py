@@ -1,5 +1,7 @@
 import os
+import sys
 import uuid
+import csv
 import json
 import yaml
 import glob
@@ -7,22 +9,56 @@ import random
 import re
 import time
 import base64
+import hashlib
+import codecs
+import logging
+import sqlite3
 import shutil
+import collections
+import gzip
 import zipfile
+import zlib
+import unicodedata
 import tarfile
+import tempfile
 import threading
+import argparse
+import asyncio
+import functools
+import contextlib
+import subprocess
+import contextvars
+import signal
 from io import BytesIO
+from xml.sax.saxutils import escape as xml_escape
+from dataclasses import dataclass
 from email.message import EmailMessage
 from datetime import datetime, timedelta, timezone
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from dotenv import load_dotenv
 from docx import Document
-from openpyxl import Workbook
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    import fcntl  # Copy-on-write clones for custodian copies (Linux only)
+except ImportError:
+    fcntl = None
+
+try:
+    import zstandard  # Optional: --container-compression zstd
+except ImportError:
+    zstandard = None
 
 # --- Configuration and Setup ---
 load_dotenv()
 
+# Per-request and per-file chatter goes through this logger; configure_logging() sends it to
+# the run's log file and only the important part of it to the console.
+log = logging.getLogger('synth_data')
+
+CHAT_FORMATS = ['slack', 'teams', 'webex', 'all']
+
 def select_config_file():
     """Scans for .yaml files and prompts the user to select one."""
     try:
@@ -208,6 +244,298 @@ def get_scenario_filter_preference():
         except ValueError:
             print("Invalid input. Please enter a number.")
 
+def parse_cli_args(argv=None):
+    """Parses command-line options. Anything not given on the command line is asked interactively."""
+    parser = argparse.ArgumentParser(description="Synthetic E-Discovery Dataset Generator")
+    parser.add_argument('--engine', choices=['thread', 'async', 'batch'], default='thread',
+                        help="Generation engine: 'thread' (worker pool), 'async' (asyncio over AsyncAzureOpenAI) or 'batch' (rounds through the Batch API)")
+    parser.add_argument('--max-inflight', type=int, default=200,
+                        help="Maximum concurrent LLM requests for the async engine and the local batch stand-in (default: 200)")
+    parser.add_argument('--batch-size', type=int, default=50000,
+                        help="Requests per batch file for --engine batch; larger rounds are split (default: 50000)")
+    parser.add_argument('--batch-poll-seconds', type=float, default=60,
+                        help="Seconds between batch status checks (default: 60)")
+    parser.add_argument('--batch-dir', default='.batch',
+                        help="Directory for batch request/result files (default: .batch)")
+    parser.add_argument('--batch-local', action='store_true',
+                        help="Process batch files with the regular chat endpoint instead of the Batch API")
+    parser.add_argument('--rpm', type=int, default=int(os.getenv("AZURE_OPENAI_RPM", 0)) or None,
+                        help="Deployment requests-per-minute quota for the shared rate limiter (env: AZURE_OPENAI_RPM)")
+    parser.add_argument('--tpm', type=int, default=int(os.getenv("AZURE_OPENAI_TPM", 0)) or None,
+                        help="Deployment tokens-per-minute quota for the shared rate limiter (env: AZURE_OPENAI_TPM)")
+    parser.add_argument('--quota-utilization', type=float, default=0.95,
+                        help="Fraction of the RPM/TPM quota to use (default: 0.95)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run from the journal in its output directory")
+    parser.add_argument('--backend', choices=['azure', 'mock'], default='azure',
+                        help="LLM backend: 'azure' (Azure OpenAI) or 'mock' (offline, deterministic responses for load testing)")
+    parser.add_argument('--mock-latency-ms', type=float, default=800,
+                        help="Median latency of mock responses in ms; 0 for full speed (default: 800)")
+    parser.add_argument('--mock-latency-sigma', type=float, default=0.5,
+                        help="Spread of the log-normal mock latency distribution (default: 0.5)")
+    parser.add_argument('--mock-error-rate', type=float, default=0.0,
+                        help="Fraction of mock requests that fail with a server error (default: 0)")
+    parser.add_argument('--mock-429-rate', type=float, default=0.0,
+                        help="Fraction of mock requests that fail with a 429 rate-limit error (default: 0)")
+    parser.add_argument('--mock-seed', type=int, default=0,
+                        help="Seed for mock response content and fault injection (default: 0)")
+    parser.add_argument('--response-cache', metavar='PATH',
+                        help="SQLite file for caching LLM responses across runs (disabled when omitted)")
+    parser.add_argument('--cache-max-mb', type=int, default=1024,
+                        help="Evict least recently used cache entries beyond this size (default: 1024)")
+    parser.add_argument('--cache-max-age-days', type=int, default=30,
+                        help="Drop cache entries older than this many days (default: 30)")
+    parser.add_argument('--progress', choices=['auto', 'live', 'plain'], default='auto',
+                        help="Console progress: 'live' (one status line redrawn in place), 'plain' (a status line every 30s) or 'auto' (live on a terminal)")
+    parser.add_argument('--log-file', metavar='PATH',
+                        help=f"Where the per-request generation log goes (default: {LOG_FILENAME} in the output directory)")
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO',
+                        help="Lowest level written to the log file; DEBUG adds every request and file (default: INFO)")
+
+    # Job options (skip the interactive prompts when --config or --jobs is given)
+    parser.add_argument('--config', metavar='YAML',
+                        help="Scenario configuration file to generate from (non-interactive mode)")
+    parser.add_argument('--count', type=int,
+                        help="Total number of items to generate (required with --config)")
+    parser.add_argument('--model',
+                        help="Model/deployment name to use (default: AZURE_OPENAI_MODEL from .env)")
+    parser.add_argument('--chat-format', choices=CHAT_FORMATS, default='slack',
+                        help="Chat output format (default: slack)")
+    parser.add_argument('--log-size-mb', type=int, default=50,
+                        help="Size of stress-test log attachments in MB (default: 50)")
+    parser.add_argument('--container', action='store_true',
+                        help="Wrap the output in a nested container (TarGz -> Zip -> Files)")
+    parser.add_argument('--container-compression', choices=['gzip', 'zstd', 'none'], default='gzip',
+                        help="Outer layer of the nested container: gzip (.tar.gz, default), zstd (.tar.zst, needs the zstandard package) or none (.tar)")
+    parser.add_argument('--container-mode', choices=['end', 'incremental', 'incremental-delete'], default='end',
+                        help="When the container is built: 'end' (after generation, default), 'incremental' (custodian zips grow as jobs finish) "
+                             "or 'incremental-delete' (also deletes the loose files once archived)")
+    parser.add_argument('--container-workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help="Custodian folders zipped in parallel when building the container (default: min(4, CPUs))")
+    parser.add_argument('--protocol', action='store_true',
+                        help="Generate the INVESTIGATION_PROTOCOL.md document")
+    parser.add_argument('--scenario-filter',
+                        help="Investigation type(s) to generate, comma separated (e.g. antitrust,safety_fraud)")
+    parser.add_argument('--output-dir',
+                        help="Override the config's output_directory")
+    parser.add_argument('--slack-merge-existing', action='store_true',
+                        help="Add to a Slack export already in the output directory instead of replacing it")
+    parser.add_argument('--trim-context', action='store_true',
+                        help="Send each scenario only the personnel its prompts reference instead of the whole roster")
+    parser.add_argument('--jobs', metavar='YAML',
+                        help="Batch job spec listing several datasets to generate in one invocation")
+    parser.add_argument('--concurrent-jobs', action='store_true',
+                        help="Run the jobs of a --jobs spec at the same time instead of back-to-back")
+    parser.add_argument('--custodian-copies', choices=['hardlink', 'copy'], default='hardlink',
+                        help="How duplicate emails reach each custodian folder: 'hardlink' (written once, default) or 'copy' (independent files)")
+    parser.add_argument('--attachment-workers', type=int, default=8,
+                        help="Threads answering an email's attachment requests concurrently in the thread engine (default: 8)")
+    parser.add_argument('--render-processes', type=int, default=min(4, os.cpu_count() or 1),
+                        help="Processes rendering PDF/DOCX/XLSX attachments; 0 renders in the worker thread (default: min(4, CPUs))")
+    parser.add_argument('--xlsx-rows', type=int, default=19,
+                        help="Data rows in generated spreadsheet attachments; 100000+ makes large-sheet stress artifacts (default: 19)")
+    parser.add_argument('--pdf-uncompressed', action='store_true',
+                        help="Write PDF page content uncompressed (readable in a text editor) instead of Flate-compressed")
+    parser.add_argument('--seed', type=int,
+                        help="Master seed: the same seed reproduces the same scenario order, timestamps, IDs and attachments (LLM text aside)")
+    parser.add_argument('--reference-date',
+                        help="Date (YYYY-MM-DD) generated timestamps count back from instead of today; seeded runs default to today's midnight")
+    parser.add_argument('--max-workers', type=int, default=10,
+                        help="Concurrent scenario jobs for the thread engine, shared by all jobs (default: 10)")
+    parser.add_argument('--shards', type=int,
+                        help="Split each job into N shards run as separate processes, then merge them into the output directory")
+    parser.add_argument('--shard', metavar='K/N',
+                        help="Generate only shard K of N (e.g. one per machine on a shared filesystem); combine them with --merge-shards")
+    parser.add_argument('--merge-shards', action='store_true',
+                        help="Merge the finished shards under <output>/shards into the output directory and write the report")
+
+    args = parser.parse_args(argv)
+    if args.config and args.jobs:
+        parser.error("--config and --jobs cannot be combined")
+    if args.config and not args.count and not args.merge_shards:
+        parser.error("--count is required with --config")
+    if args.count is not None and args.count <= 0:
+        parser.error("--count must be a positive number")
+    if args.container_compression == 'zstd' and zstandard is None:
+        parser.error("--container-compression zstd needs the zstandard package (pip install zstandard)")
+    if args.xlsx_rows < 0:
+        parser.error("--xlsx-rows cannot be negative")
+    if args.container_workers < 1:
+        parser.error("--container-workers must be at least 1")
+    if not is_valid_log_size_mb(args.log_size_mb):
+        parser.error("--log-size-mb must be a positive number")
+    if args.reference_date:
+        try:
+            datetime.strptime(args.reference_date, "%Y-%m-%d")
+        except ValueError:
+            parser.error("--reference-date must be a date in YYYY-MM-DD form")
+    if args.attachment_workers <= 0:
+        parser.error("--attachment-workers must be a positive number")
+    if args.render_processes < 0:
+        parser.error("--render-processes cannot be negative")
+    if not 1 <= args.batch_size <= 100000:
+        parser.error("--batch-size must be between 1 and 100000")
+    if (args.shards or args.shard or args.merge_shards) and not (args.config or args.jobs):
+        parser.error("--shards, --shard and --merge-shards need --config or --jobs")
+    if sum(1 for option in (args.shards, args.shard, args.merge_shards) if option) > 1:
+        parser.error("--shards, --shard and --merge-shards cannot be combined")
+    if args.shards is not None and args.shards < 1:
+        parser.error("--shards must be a positive number")
+    if args.shard and not parse_shard_spec(args.shard):
+        parser.error("--shard must be K/N with 1 <= K <= N (e.g. 2/4)")
+    return args
+
+def parse_scenario_filter(value):
+    """Normalizes a scenario filter from the CLI ('a,b') or a job spec (string or list)."""
+    if value is None or isinstance(value, list):
+        return value
+    filters = [f.strip() for f in str(value).split(',') if f.strip()]
+    return filters[0] if len(filters) == 1 else filters
+
+def is_valid_log_size_mb(value):
+    """True for a usable stress-log size: a positive whole number of MB, as --log-size-mb takes."""
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+def build_job(config_path, target_item_count, chat_format='slack', log_size_mb=50, create_container=False,
+              generate_protocol=False, scenario_filter=None, output_directory=None, slack_merge_existing=False, seed=None,
+              trim_context=False):
+    """
+    Describes one dataset to generate - everything the interactive prompts used to ask for.
+    scenario_filter / output_directory override the config's general_settings when set.
+    slack_merge_existing adds to a Slack export already in the output directory instead of replacing it.
+    seed fixes the job's random stream; when omitted it is derived from --seed (see assign_job_seeds).
+    trim_context sends each scenario only the personnel it references instead of the full roster.
+    """
+    return {
+        'config_path': config_path,
+        'target_item_count': target_item_count,
+        'chat_format': chat_format,
+        'log_size_mb': log_size_mb,
+        'create_container': create_container,
+        'generate_protocol': generate_protocol,
+        'scenario_filter': parse_scenario_filter(scenario_filter),
+        'output_directory': output_directory,
+        'slack_merge_existing': slack_merge_existing,
+        'seed': seed,
+        'trim_context': trim_context,
+    }
+
+def assign_job_seeds(jobs, master_seed):
+    """Derives a seed for every job without one from the master seed, its position and its config."""
+    for index, job in enumerate(jobs):
+        if job['seed'] is None:
+            job['seed'] = derive_seed(master_seed, index, os.path.basename(job['config_path']))
+
+def job_from_cli_args(args):
+    """Builds the single job described by --config and friends."""
+    return build_job(args.config, args.count, args.chat_format, args.log_size_mb, args.container,
+                     args.protocol, args.scenario_filter, args.output_dir, args.slack_merge_existing, None, args.trim_context)
+
+def load_job_spec(spec_path):
+    """
+    Loads a batch job spec so several datasets can be generated in one invocation.
+
+    Example:
+        model: gpt-4              # optional, same as --model
+        concurrent: false         # optional, same as --concurrent-jobs
+        defaults:                 # optional, applied to every job
+          chat_format: all
+          log_size_mb: 5
+        jobs:
+          - config: config-acme-antitrust.yaml
+            count: 500
+          - config: config-acme.yaml
+            count: 200
+            scenario_filter: [antitrust, safety_fraud]
+            output_directory: output_acme_mixed
+            container: true
+            protocol: true
+            seed: 42              # optional, fixes this job's random stream
+
+    Returns:
+        tuple: (jobs, settings) where settings holds 'model' and 'concurrent', or (None, None) on error
+    """
+    spec = load_config(spec_path)
+    if not spec:
+        return None, None
+    if not isinstance(spec, dict) or not isinstance(spec.get('jobs'), list) or not spec['jobs']:
+        print(f"Error: Job spec '{spec_path}' must contain a non-empty 'jobs' list.")
+        return None, None
+
+    known_keys = {'config', 'count', 'chat_format', 'log_size_mb', 'container', 'protocol', 'scenario_filter', 'output_directory', 'slack_merge_existing', 'seed', 'trim_context'}
+    defaults = spec.get('defaults') or {}
+    jobs = []
+    for index, entry in enumerate(spec['jobs'], start=1):
+        job_spec = {**defaults, **(entry or {})}
+        unknown = set(job_spec) - known_keys
+        if unknown:
+            print(f"Error: Job #{index} in '{spec_path}' has unknown key(s): {', '.join(sorted(unknown))}")
+            return None, None
+        if not job_spec.get('config'):
+            print(f"Error: Job #{index} in '{spec_path}' is missing 'config'.")
+            return None, None
+        count = job_spec.get('count')
+        if not isinstance(count, int) or count <= 0:
+            print(f"Error: Job #{index} in '{spec_path}' needs a positive integer 'count'.")
+            return None, None
+        chat_format = job_spec.get('chat_format', 'slack')
+        if chat_format not in CHAT_FORMATS:
+            print(f"Error: Job #{index} in '{spec_path}' has invalid chat_format '{chat_format}' (valid: {', '.join(CHAT_FORMATS)}).")
+            return None, None
+        log_size_mb = job_spec.get('log_size_mb', 50)
+        if not is_valid_log_size_mb(log_size_mb):
+            print(f"Error: Job #{index} ({job_spec['config']}) in '{spec_path}' needs a positive integer 'log_size_mb', not {log_size_mb!r}.")
+            return None, None
+        jobs.append(build_job(job_spec['config'], count, chat_format, log_size_mb,
+                              bool(job_spec.get('container', False)), bool(job_spec.get('protocol', False)),
+                              job_spec.get('scenario_filter'), job_spec.get('output_directory'),
+                              bool(job_spec.get('slack_merge_existing', False)), job_spec.get('seed'),
+                              bool(job_spec.get('trim_context', False))))
+
+    settings = {'model': spec.get('model'), 'concurrent': bool(spec.get('concurrent', False))}
+    return jobs, settings
+
+def prompt_for_job():
+    """
+    Interactive mode: asks the original questions and returns (job, selected_model).
+    selected_model is None when the .env default should be used.
+    """
+    selected_config_file = select_config_file()
+    if not selected_config_file: return None, None
+    target_item_count = get_target_email_count()
+
+    # --- Prompt for Model Selection ---
+    selected_model = get_model_preference()
+
+    # --- Prompt for Chat Format ---
+    chat_format_pref = get_chat_format_preference()
+
+    # --- Prompt for Log Size (Stress Test) ---
+    log_size_mb = get_log_size_preference()
+
+    # --- Prompt for Nested Container (Stress Test) ---
+    create_container = get_container_preference()
+
+    # --- Prompt for Protocol Document Generation ---
+    generate_protocol = get_protocol_preference()
+
+    # Check if user selected config-acme.yaml and prompt for scenario filter
+    scenario_filter = None
+    if selected_config_file == 'config-acme.yaml':
+        print("\n" + "="*80)
+        print("You selected config-acme.yaml (Master Configuration with All Scenarios)")
+        print("="*80)
+        print("\nThis config contains ALL investigation types mixed together.")
+        print("For realistic investigation testing, you should focus on ONE investigation type.")
+
+        scenario_filter = get_scenario_filter_preference()
+
+        print("\nApplying filter to dataset generation...")
+
+    job = build_job(selected_config_file, target_item_count, chat_format_pref, log_size_mb,
+                    create_container, generate_protocol, scenario_filter)
+    return job, selected_model
+
 def load_config(config_path):
     """Loads the selected YAML configuration file."""
     try:
@@ -284,6 +612,37 @@ def build_context_block(profiles):
         for person in company['personnel']: context += f"- {person['name']}, {person['title']} ({person['email']})\n"
     return context
 
+def get_scenario_personnel_text(scenario):
+    """All text a scenario can put into a prompt: its prompt templates and prompt_variables values."""
+    parts = []
+    for prompt in scenario.get('prompts', []):
+        parts.extend(prompt['prompt_templates'] if isinstance(prompt, dict) and 'prompt_templates' in prompt else [str(prompt)])
+    for values in (scenario.get('prompt_variables') or {}).values():
+        parts.extend(str(value) for value in (values if isinstance(values, list) else [values]))
+    return "\n".join(parts)
+
+def build_scenario_context_block(profiles, scenario):
+    """
+    Context block with only the personnel a scenario can reference (by full name, first and
+    last name, or email; naming a company brings in all its staff). Falls back to the full
+    block when nobody is found.
+    """
+    text = get_scenario_personnel_text(scenario)
+    trimmed = []
+    for company in profiles:
+        if company['name'] in text:
+            trimmed.append(company)
+            continue
+        people = []
+        for person in company['personnel']:
+            name_parts = person['name'].split()
+            short_name = f"{name_parts[0]} {name_parts[-1]}" if len(name_parts) > 2 else person['name']
+            if person['name'] in text or short_name in text or person['email'] in text:
+                people.append(person)
+        if people:
+            trimmed.append({**company, 'personnel': people})
+    return build_context_block(trimmed) if trimmed else build_context_block(profiles)
+
 def build_personnel_map(profiles):
     """Maps emails/names to full profiles for easy lookup."""
     personnel_map = {}
@@ -299,8 +658,8 @@ def add_prompt_variation(prompt, variation_level='medium'):
     fillers = {'low': ['', ''],'medium': ['', '', 'a brief', 'a concise', 'a professional'],'high': ['', '', 'a brief', 'a concise', 'a professional', 'an appropriate', 'a clear', 'a well-written']}
     for starter in ['Draft', 'Write', 'Compose', 'Create']:
         if prompt.startswith(starter):
-            new_starter = random.choice(starters.get(variation_level, starters['medium']))
-            filler = random.choice(fillers.get(variation_level, fillers['medium']))
+            new_starter = rng.choice(starters.get(variation_level, starters['medium']))
+            filler = rng.choice(fillers.get(variation_level, fillers['medium']))
             prompt = prompt.replace(starter, f"{new_starter} {filler}" if filler else new_starter, 1)
             break
     return prompt
@@ -308,7 +667,7 @@ def add_prompt_variation(prompt, variation_level='medium'):
 def get_randomized_prompt(prompt_template, variables, personnel_map, run_count=1):
     """Replaces placeholders in a prompt with random choices, ensuring sender != recipient."""
     if isinstance(prompt_template, dict) and 'prompt_templates' in prompt_template:
-        prompt = random.choice(prompt_template['prompt_templates'])
+        prompt = rng.choice(prompt_template['prompt_templates'])
     else:
         prompt = prompt_template
 
@@ -325,7 +684,7 @@ def get_randomized_prompt(prompt_template, variables, personnel_map, run_count=1
         pool = local_vars['employee_pool']
         # Try up to 10 times to find a pair that aren't the same person
         for _ in range(10):
-            sender_name, recipient_name = random.sample(pool, 2)
+            sender_name, recipient_name = rng.sample(pool, 2)
             
             # Resolve names to emails to check identity (handles aliases like "T. Brooks" vs "Taylor Brooks")
             sender_email = personnel_map.get(sender_name, {}).get('email')
@@ -345,7 +704,7 @@ def get_randomized_prompt(prompt_template, variables, personnel_map, run_count=1
         if key != 'employee_pool': # We handled this manually above
             placeholder = f"{{{key}}}"
             if placeholder in prompt: 
-                prompt = prompt.replace(placeholder, random.choice(values))
+                prompt = prompt.replace(placeholder, rng.choice(values))
                 
     return prompt
 
@@ -359,20 +718,188 @@ def get_sender_name_from_prompt(prompt, personnel_map):
         if name in prompt: return name
     return None
 
-try:
-    client = AzureOpenAI(azure_endpoint=os.getenv("AZURE_ENDPOINT"), api_key=os.getenv("AZURE_API_KEY"), api_version=os.getenv("AZURE_API_VERSION"))
-    # Model will be set after user selection - default from .env for now
-    DEFAULT_MODEL = os.getenv("ANTHROPIC_DEFAULT_HAIKU_MODEL") or os.getenv("AZURE_OPENAI_MODEL")
-    AZURE_MODEL_NAME = DEFAULT_MODEL  # Will be overridden by user selection
-except Exception as e:
-    print(f"Error: Failed to configure AzureOpenAI client. Check .env file. Details: {e}")
-    exit()
+# Model will be set after user selection - default from .env for now
+DEFAULT_MODEL = os.getenv("ANTHROPIC_DEFAULT_HAIKU_MODEL") or os.getenv("AZURE_OPENAI_MODEL")
+AZURE_MODEL_NAME = DEFAULT_MODEL  # Will be overridden by user selection
+
+# --- Reproducible Randomness ---
+# Every randomized decision about the dataset's structure (prompt variables, timestamps,
+# near-duplicates, attachments, reactions, IDs) draws from `rng`, which resolves to the
+# random.Random of the scenario job running in the current context. Job RNGs are derived
+# from the master seed, so a given --seed reproduces the same structure however the
+# workers are scheduled. Retry jitter and the mock backend keep their own generators.
+
+MASTER_SEED = None       # Set from --seed, or drawn fresh for each invocation
+REFERENCE_NOW = None     # Fixed "now" for generated dates (--reference-date, or midnight when seeded)
+
+job_rng = contextvars.ContextVar('job_rng', default=None)
+
+class JobRandom:
+    """Proxy for the current context's job RNG; falls back to the global generator outside a job."""
+    def __getattr__(self, name):
+        return getattr(job_rng.get() or random, name)
+
+rng = JobRandom()
+
+def derive_seed(*parts):
+    """Stable 64-bit seed from the master seed and any identifying parts (job, scenario, occurrence)."""
+    material = "\x1f".join(str(part) for part in parts)
+    return int.from_bytes(hashlib.sha256(material.encode('utf-8')).digest()[:8], 'big')
+
+def seed_job_rng(seed):
+    """Gives the current context its own RNG (one per scenario job, background step or render)."""
+    job_rng.set(random.Random(seed))
+
+def new_uuid():
+    """uuid4-style identifier drawn from the job RNG."""
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+def generation_now(tz=None):
+    """The "current" time used for generated content."""
+    if REFERENCE_NOW:
+        return REFERENCE_NOW.replace(tzinfo=tz) if tz else REFERENCE_NOW
+    return datetime.now(tz)
 
 # --- Rate Limiting and Retry Logic ---
 
+class RateLimiter:
+    """
+    Process-wide token bucket for both requests-per-minute and tokens-per-minute.
+
+    Callers reserve capacity before each call (one request plus an estimated token count)
+    and sleep only as long as the buckets need to refill. Buckets may go negative, which
+    queues later callers behind earlier reservations instead of letting them race.
+    Once a response arrives the estimate is corrected with the actual `usage`, and the
+    `Retry-After` / `x-ratelimit-remaining-*` headers pull the local view back in line with
+    the service. Azure evaluates quotas over short windows, so burst capacity is capped at
+    ten seconds' worth of quota.
+    """
+    BURST_SECONDS = 10
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, utilization=0.95):
+        self.tokens_per_minute = tokens_per_minute
+        self.request_rate = requests_per_minute * utilization / 60 if requests_per_minute else None
+        self.token_rate = tokens_per_minute * utilization / 60 if tokens_per_minute else None
+        self._request_level = self.request_rate * self.BURST_SECONDS if self.request_rate else 0.0
+        self._token_level = self.token_rate * self.BURST_SECONDS if self.token_rate else 0.0
+        self._blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.request_rate:
+            self._request_level = min(self.request_rate * self.BURST_SECONDS, self._request_level + elapsed * self.request_rate)
+        if self.token_rate:
+            self._token_level = min(self.token_rate * self.BURST_SECONDS, self._token_level + elapsed * self.token_rate)
+
+    def reserve(self, estimated_tokens):
+        """Debits one request and estimated_tokens; returns how many seconds the caller must wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = self._blocked_until - now
+            if self.request_rate:
+                self._request_level -= 1
+                if self._request_level < 0:
+                    wait = max(wait, -self._request_level / self.request_rate)
+            if self.token_rate:
+                self._token_level -= estimated_tokens
+                if self._token_level < 0:
+                    wait = max(wait, -self._token_level / self.token_rate)
+        if wait <= 0:
+            return 0.0
+        # Jitter so callers released by the same refill don't hit the API in lockstep
+        return wait + random.uniform(0, min(1.0, wait * 0.1))
+
+    def acquire(self, estimated_tokens):
+        """Blocks the calling thread until the reservation is covered."""
+        wait = self.reserve(estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def async_acquire(self, estimated_tokens):
+        """Coroutine version of acquire()."""
+        wait = self.reserve(estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Corrects the token bucket once the response reports its real usage."""
+        if self.token_rate and actual_tokens is not None:
+            with self._lock:
+                self._token_level += estimated_tokens - actual_tokens
+
+    def pause(self, seconds):
+        """Holds every caller back for `seconds` (e.g. after a 429 with Retry-After)."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """Applies Retry-After and x-ratelimit-remaining-* response headers."""
+        if not headers:
+            return
+        retry_after = get_retry_after_seconds(headers)
+        if retry_after:
+            self.pause(retry_after)
+        with self._lock:
+            remaining_requests = headers.get('x-ratelimit-remaining-requests')
+            remaining_tokens = headers.get('x-ratelimit-remaining-tokens')
+            try:
+                if self.request_rate and remaining_requests is not None:
+                    self._request_level = min(self._request_level, float(remaining_requests))
+                if self.token_rate and remaining_tokens is not None:
+                    self._token_level = min(self._token_level, float(remaining_tokens))
+            except ValueError:
+                pass
+
+# Shared limiter for every LLM call in the process; None means no client-side limiting
+rate_limiter = None
+
+def configure_rate_limiter(requests_per_minute=None, tokens_per_minute=None, utilization=0.95):
+    """Installs the process-wide rate limiter (no-op when neither quota is given)."""
+    global rate_limiter
+    if requests_per_minute or tokens_per_minute:
+        rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute, utilization)
+        print(f"Rate limiter: {requests_per_minute or 'unlimited'} RPM / {tokens_per_minute or 'unlimited'} TPM at {utilization:.0%} utilization.")
+    else:
+        rate_limiter = None
+    return rate_limiter
+
+def get_retry_after_seconds(headers):
+    """Reads retry-after-ms / Retry-After from response headers; returns seconds or None."""
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        return None
+    return None
+
+def is_rate_limit_error(error):
+    """Returns True if an exception looks like a 429 / quota error from Azure OpenAI."""
+    error_str = str(error)
+    return "429" in error_str or "rate_limit" in error_str.lower() or "quota" in error_str.lower()
+
+def get_rate_limit_backoff(error, attempt):
+    """
+    Seconds to wait before retrying a 429: the server's Retry-After when present,
+    otherwise exponential backoff (2, 4, 8, 16, 32), plus up to 50% jitter so
+    concurrent workers don't retry in synchronized waves.
+    """
+    response = getattr(error, 'response', None)
+    base_wait = get_retry_after_seconds(getattr(response, 'headers', None)) or 2 ** (attempt + 1)
+    if rate_limiter:
+        rate_limiter.pause(base_wait)
+    return base_wait * random.uniform(1.0, 1.5)
+
 def call_llm_with_retry(func, *args, max_retries=5, **kwargs):
     """
-    Wrapper to call LLM functions with exponential backoff retry logic for 429 errors.
+    Wrapper to call LLM functions with backoff retry logic for 429 errors.
 
     Args:
         func: The LLM function to call
@@ -390,17 +917,14 @@ def call_llm_with_retry(func, *args, max_retries=5, **kwargs):
         try:
             return func(*args, **kwargs)
         except Exception as e:
-            error_str = str(e)
-
             # Check if it's a 429 rate limit error
-            if "429" in error_str or "rate_limit" in error_str.lower() or "quota" in error_str.lower():
+            if is_rate_limit_error(e):
                 if attempt < max_retries - 1:
-                    # Exponential backoff: 2^attempt seconds (2, 4, 8, 16, 32)
-                    wait_time = 2 ** (attempt + 1)
-                    print(f"    [Rate Limit] 429 error detected. Retrying in {wait_time}s (attempt {attempt + 1}/{max_retries})...")
+                    wait_time = get_rate_limit_backoff(e, attempt)
+                    log.warning(f"    [Rate Limit] 429 error detected. Retrying in {wait_time:.1f}s (attempt {attempt + 1}/{max_retries})...")
                     time.sleep(wait_time)
                 else:
-                    print(f"    [Rate Limit] Max retries ({max_retries}) reached. Giving up.")
+                    log.warning(f"    [Rate Limit] Max retries ({max_retries}) reached. Giving up.")
                     raise
             else:
                 # For non-429 errors, raise immediately
@@ -409,10 +933,982 @@ def call_llm_with_retry(func, *args, max_retries=5, **kwargs):
     # Should never reach here, but just in case
     raise Exception(f"Failed after {max_retries} retries")
 
+async def async_call_llm_with_retry(func, *args, max_retries=5, **kwargs):
+    """Coroutine version of call_llm_with_retry(); func must return an awaitable."""
+    for attempt in range(max_retries):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            if is_rate_limit_error(e):
+                if attempt < max_retries - 1:
+                    wait_time = get_rate_limit_backoff(e, attempt)
+                    log.warning(f"    [Rate Limit] 429 error detected. Retrying in {wait_time:.1f}s (attempt {attempt + 1}/{max_retries})...")
+                    await asyncio.sleep(wait_time)
+                else:
+                    log.warning(f"    [Rate Limit] Max retries ({max_retries}) reached. Giving up.")
+                    raise
+            else:
+                raise
+
+    raise Exception(f"Failed after {max_retries} retries")
+
+# --- Progress Dashboard ---
+
+# How often --progress plain logs a status line (live mode redraws every half second)
+PLAIN_STATUS_INTERVAL = 30
+LOG_FILENAME = 'generation.log'
+
+class StatusLineStream:
+    """
+    Stand-in for sys.stdout that keeps the live status line at the bottom of the terminal.
+    Anything else printed clears the line first and it is redrawn once the output ends
+    with a newline, so reports and errors scroll above it.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.status = ''
+        self._line_open = False
+        self._lock = threading.RLock()
+
+    def _draw(self):
+        width = shutil.get_terminal_size().columns - 1
+        self.stream.write('\r\x1b[K' + self.status[:width])
+        self.stream.flush()
+
+    def write(self, text):
+        with self._lock:
+            if self.status and not self._line_open:
+                self.stream.write('\r\x1b[K')
+            self.stream.write(text)
+            if text:
+                self._line_open = not text.endswith('\n')
+            if self.status and not self._line_open:
+                self._draw()
+        return len(text)
+
+    def set_status(self, status):
+        with self._lock:
+            self.status = status
+            if not self._line_open:
+                self._draw()
+
+    def clear(self):
+        with self._lock:
+            if self.status and not self._line_open:
+                self.stream.write('\r\x1b[K')
+                self.stream.flush()
+            self.status = ''
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class ProgressDashboard:
+    """
+    Run-wide counters behind the status line: items against the target, throughput and ETA,
+    tokens per minute against the TPM quota, LLM calls in flight, retry rate and per-type
+    counts. Rates cover the last WINDOW_SECONDS so they track the current pace; item counts
+    start from what resumed jobs already had.
+    """
+    WINDOW_SECONDS = 60
+
+    def __init__(self, target_item_count, live=True, job_count=1):
+        self.target_item_count = target_item_count
+        self.live = live
+        self.jobs_left = job_count
+        self.started = time.monotonic()
+        self.runs = []
+        self.resumed_items = 0
+        self.items = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self._recent_items = collections.deque()   # (monotonic time, items)
+        self._recent_tokens = collections.deque()  # (monotonic time, tokens)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stream = None
+
+    def add_run(self, run):
+        with self._lock:
+            self.runs.append(run)
+            self.resumed_items += run['generated_item_count']
+
+    def llm_started(self, count=1):
+        with self._lock:
+            self.in_flight += count
+
+    def llm_finished(self, count=1):
+        with self._lock:
+            self.in_flight -= count
+
+    def record_call(self, tokens, retries, rate_limited):
+        with self._lock:
+            self.calls += 1
+            self.retries += retries
+            self.rate_limited += rate_limited
+            if tokens:
+                self._recent_tokens.append((time.monotonic(), tokens))
+
+    def record_items(self, count):
+        if count > 0:
+            with self._lock:
+                self.items += count
+                self._recent_items.append((time.monotonic(), count))
+
+    def status_line(self):
+        """Formats the current counters as one line."""
+        now = time.monotonic()
+        with self._lock:
+            for recent in (self._recent_items, self._recent_tokens):
+                while recent and recent[0][0] < now - self.WINDOW_SECONDS:
+                    recent.popleft()
+            window = max(1.0, min(self.WINDOW_SECONDS, now - self.started))
+            items_per_second = sum(count for _, count in self._recent_items) / window
+            tokens_per_minute = sum(tokens for _, tokens in self._recent_tokens) * 60 / window
+            done = self.resumed_items + self.items
+            in_flight, calls, retries, rate_limited = self.in_flight, self.calls, self.retries, self.rate_limited
+            runs = list(self.runs)
+
+        totals = {}
+        for run in runs:
+            for key, value in run['stats'].counts(('emails', 'rsmf_chats', 'calendar_events', 'attachments')).items():
+                totals[key] = totals.get(key, 0) + value
+
+        quota = ''
+        if rate_limiter and rate_limiter.tokens_per_minute:
+            quota = f"/{rate_limiter.tokens_per_minute / 1000:,.0f}k ({tokens_per_minute / rate_limiter.tokens_per_minute:.0%})"
+        if done >= self.target_item_count:
+            eta = 'done'
+        elif items_per_second > 0:
+            eta = format_duration((self.target_item_count - done) / items_per_second)
+        else:
+            eta = '--'
+        retry_rate = f"{retries / calls:.1%}" if calls else '--'
+
+        return (f"[{format_duration(now - self.started)}] {done}/{self.target_item_count} items "
+                f"({done / max(1, self.target_item_count):.0%}) | {items_per_second:.2f} items/s | "
+                f"{tokens_per_minute / 1000:,.1f}k{quota} tok/min | {in_flight} in flight | "
+                f"retries {retry_rate} ({rate_limited} x 429) | "
+                f"{totals.get('emails', 0)} emails, {totals.get('rsmf_chats', 0)} chats, "
+                f"{totals.get('calendar_events', 0)} events, {totals.get('attachments', 0)} attachments | ETA {eta}")
+
+    def _refresh(self):
+        interval = 0.5 if self.live else PLAIN_STATUS_INTERVAL
+        while not self._stop.wait(interval):
+            if self.live:
+                self._stream.set_status(self.status_line())
+            else:
+                status = f"[Status] {self.status_line()}"
+                print(status, flush=True)
+                log.info(status)
+
+    def start(self):
+        if self.live:
+            self._stream = StatusLineStream(sys.stdout)
+            sys.stdout = self._stream
+        self._thread = threading.Thread(target=self._refresh, name='progress', daemon=True)
+        self._thread.start()
+
+    def job_done(self):
+        """
+        Called when a job has finished generating, ahead of its report: prints the current
+        status, or stops the dashboard with the final status once every job is done.
+        """
+        with self._lock:
+            self.jobs_left -= 1
+            last = self.jobs_left <= 0
+        if last:
+            self.stop()
+        else:
+            print(f"[Status] {self.status_line()}")
+
+    def stop(self):
+        """Stops refreshing, restores stdout and prints the final status once."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._stream:
+            self._stream.clear()
+            sys.stdout = self._stream.stream
+            self._stream = None
+        print(f"[Status] {self.status_line()}")
+
+# Run-wide dashboard fed by the LLM layer and the scenario collectors; None when not running
+progress_dashboard = None
+
+def format_duration(seconds):
+    """Formats seconds as H:MM:SS."""
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+class ConsoleLogHandler(logging.Handler):
+    """Prints log records, so they go through the status line stream when it is installed."""
+    def emit(self, record):
+        try:
+            print(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+class RunLogFileHandler(logging.FileHandler):
+    """FileHandler that creates the output directory when the first record is written."""
+    def _open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.baseFilename)), exist_ok=True)
+        return super()._open()
+
+def configure_logging(log_file, file_level='INFO', console_level=logging.INFO):
+    """
+    Sends the generation log to log_file at file_level and to the console at console_level.
+    The file is opened lazily so it doesn't create the output directory before the run checks it.
+    """
+    log.setLevel(logging.DEBUG)
+    log.propagate = False
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+        handler.close()
+
+    file_handler = RunLogFileHandler(log_file, encoding='utf-8', delay=True)
+    file_handler.setLevel(file_level)
+    file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s [%(threadName)s] %(message)s"))
+    log.addHandler(file_handler)
+
+    console_handler = ConsoleLogHandler()
+    console_handler.setLevel(console_level)
+    console_handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(console_handler)
+
+# --- LLM Request Layer ---
+# Generation code describes the completions it needs as LLMRequest objects and the
+# engines (thread or asyncio) decide how to execute them.
+
+# Keys the LLM must return for each structured response kind
+REQUIRED_RESPONSE_KEYS = {
+    'email': ["subject", "body", "sender_name", "sender_email", "recipients"],
+    'calendar': ["summary", "description", "organizer_name", "organizer_email", "attendees"],
+}
+
+@dataclass
+class LLMRequest:
+    """
+    One chat completion needed by the generation steps.
+
+    kind is 'json' (any JSON object), 'email', 'calendar', 'chat' (validated JSON) or
+    'attachment' (free text; errors fall back to `fallback`). context is the scenario's
+    company/personnel block, sent ahead of everything else (see build_chat_api_kwargs).
+    """
+    system_message: str
+    prompt: str
+    temperature: float
+    kind: str = 'json'
+    label: str = ''
+    fallback: str = None
+    context: str = ''
+
+def build_chat_api_kwargs(request):
+    """
+    Builds the chat.completions.create() arguments for a request.
+
+    The context block goes first, as its own system message, followed by the per-kind
+    system message and only then the varying task. Every request of a run therefore
+    starts with the same bytes, which the provider's automatic prompt caching can reuse.
+    """
+    messages = [{"role": "system", "content": request.context}] if request.context else []
+    messages += [{"role": "system", "content": request.system_message}, {"role": "user", "content": request.prompt}]
+    api_kwargs = {
+        'model': AZURE_MODEL_NAME,
+        'messages': messages,
+        'temperature': request.temperature,
+    }
+    if request.kind != 'attachment':
+        api_kwargs['response_format'] = {"type": "json_object"}
+    return api_kwargs
+
+def announce_llm_request(request):
+    """Prints the per-request progress line."""
+    if request.kind == 'attachment':
+        log.debug(f"  ... Generating content for attachment: {request.label} ...")
+    else:
+        log.debug(f"---> Sending prompt to Azure OpenAI Model (temp={request.temperature:.2f})...")
+
+def parse_llm_response(request, content):
+    """Parses and validates raw completion text; returns None (or the fallback) when unusable."""
+    if request.kind == 'attachment':
+        return content
+
+    data = None
+    try:
+        data = json.loads(content)
+    except Exception as e:
+        log.error(f"!!! ERROR: Failed to get valid response from LLM. Details: {e}")
+
+    return validate_llm_response(request, data)
+
+def validate_llm_response(request, data):
+    """Checks a parsed JSON response has the keys its kind requires."""
+    if request.kind == 'chat':
+        if data and 'messages' in data and isinstance(data['messages'], list):
+            return data
+        log.error("!!! ERROR: LLM response for chat was missing required keys.")
+        return None
+    if request.kind in REQUIRED_RESPONSE_KEYS:
+        if data and all(key in data for key in REQUIRED_RESPONSE_KEYS[request.kind]):
+            return data
+        log.error(f"!!! ERROR: LLM response for {'calendar event' if request.kind == 'calendar' else request.kind} was missing required keys.")
+        return None
+    return data
+
+def handle_llm_request_error(request, error):
+    """Reports a failed request and returns the value the caller should fall back to."""
+    if request.kind == 'attachment':
+        log.error(f"!!! ERROR generating attachment content: {error}")
+        return request.fallback
+    log.error(f"!!! ERROR: Failed to get valid response from LLM. Details: {error}")
+    return validate_llm_response(request, None)
+
+# --- LLM Backends ---
+
+@dataclass
+class LLMCompletion:
+    """What a backend returns for one request: completion text, usage and response headers."""
+    content: str
+    total_tokens: int = None
+    headers: dict = None
+    prompt_tokens: int = None
+    cached_tokens: int = None
+    completion_tokens: int = None
+
+class AzureBackend:
+    """Sends requests to the Azure OpenAI deployment configured in .env."""
+    name = 'azure'
+
+    def __init__(self):
+        self.client = AzureOpenAI(azure_endpoint=os.getenv("AZURE_ENDPOINT"), api_key=os.getenv("AZURE_API_KEY"), api_version=os.getenv("AZURE_API_VERSION"))
+        # Async twin of the client, used only by the asyncio engine (--engine async)
+        self.async_client = AsyncAzureOpenAI(azure_endpoint=os.getenv("AZURE_ENDPOINT"), api_key=os.getenv("AZURE_API_KEY"), api_version=os.getenv("AZURE_API_VERSION"))
+
+    def complete(self, request, api_kwargs):
+        raw_response = self.client.chat.completions.with_raw_response.create(**api_kwargs)
+        return self._to_completion(raw_response)
+
+    async def async_complete(self, request, api_kwargs):
+        raw_response = await self.async_client.chat.completions.with_raw_response.create(**api_kwargs)
+        return self._to_completion(raw_response)
+
+    def submit_batch(self, path):
+        """Uploads a batch request file and starts a Batch API job on it; returns the batch id."""
+        with open(path, 'rb') as f:
+            upload = self.client.files.create(file=f, purpose="batch")
+        # The service validates the file before a batch may reference it
+        while getattr(self.client.files.retrieve(upload.id), 'status', 'processed') not in ('processed', 'error'):
+            time.sleep(5)
+        batch = self.client.batches.create(input_file_id=upload.id, endpoint="/chat/completions", completion_window="24h")
+        return batch.id
+
+    def wait_for_batch(self, batch_id, output_path, poll_seconds=60):
+        """Polls a batch until it ends, then downloads its output and error lines to output_path; returns the final status."""
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in ('completed', 'failed', 'expired', 'cancelled'):
+                break
+            counts = getattr(batch, 'request_counts', None)
+            progress = f" ({counts.completed + counts.failed}/{counts.total})" if counts and counts.total else ""
+            log.info(f"    [Batch] {batch_id}: {batch.status}{progress}")
+            time.sleep(poll_seconds)
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    f.write(self.client.files.content(file_id).text.rstrip('\n') + '\n')
+        if batch.status == 'failed' and getattr(batch, 'errors', None):
+            for error in batch.errors.data or []:
+                log.error(f"!!! ERROR: Batch {batch_id} failed: {error.message}")
+        return batch.status
+
+    def cancel_batch(self, batch_id):
+        self.client.batches.cancel(batch_id)
+
+    @staticmethod
+    def _to_completion(raw_response):
+        response = raw_response.parse()
+        usage = getattr(response, 'usage', None)
+        details = getattr(usage, 'prompt_tokens_details', None)
+        return LLMCompletion(response.choices[0].message.content, get_usage_total_tokens(response), raw_response.headers,
+                             getattr(usage, 'prompt_tokens', None), getattr(details, 'cached_tokens', None),
+                             getattr(usage, 'completion_tokens', None))
+
+class MockLLMError(Exception):
+    """Injected failure from the mock backend; carries a fake `response` so 429 handling sees Retry-After."""
+
+    def __init__(self, message, headers=None):
+        super().__init__(message)
+        self.response = type('MockResponse', (), {'headers': headers or {}})()
+
+class MockBackend:
+    """
+    Offline stand-in for Azure OpenAI, for load testing everything except the LLM.
+
+    Responses are deterministic per request (seeded from the prompt text and --mock-seed)
+    and schema-valid for every request kind, using the personnel listed in the request's
+    context block. Latency is log-normal around latency_ms; error_rate / rate_limit_rate
+    inject failures (rate-limit errors carry a Retry-After header like the real service).
+    Usage mimics automatic prompt caching: a system prefix of 1024+ tokens seen before is
+    reported as cached, in 128-token steps.
+    """
+    name = 'mock'
+
+    TOPIC_STOPWORDS = {'about', 'after', 'their', 'there', 'these', 'those', 'which', 'while', 'would', 'should',
+                       'could', 'email', 'write', 'draft', 'create', 'generate', 'other', 'where', 'being', 'sender'}
+    SENTENCES = [
+        "Following up on the {topic} item from this morning.",
+        "Can we get aligned on {topic} before the end of the week?",
+        "I reviewed the latest numbers for {topic} and have a few concerns.",
+        "Please keep the {topic} discussion internal for now.",
+        "The team is still waiting on sign-off for {topic}.",
+        "Let me know if you need anything else on {topic}.",
+        "We should loop in legal before we finalize {topic}.",
+        "Attached is the updated summary covering {topic}.",
+        "Quick reminder that {topic} is on the agenda for Thursday.",
+        "I spoke with the vendor and they confirmed the {topic} timeline.",
+    ]
+    CHAT_LINES = ["hey, got a sec?", "ok", "sounds good", "checking now", "can you send me the {topic} file?",
+                  "thx", "will do", "fyi the {topic} deadline moved", "lol yes", "let's talk offline about {topic}", "👍"]
+
+    def __init__(self, latency_ms=800, latency_sigma=0.5, error_rate=0.0, rate_limit_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        # Latency and fault draws come from one shared stream; content from per-request streams
+        self._fault_random = random.Random(seed)
+        self._fault_lock = threading.Lock()
+        self._seen_prefixes = set()
+
+    def complete(self, request, api_kwargs):
+        delay = self._draw_fault()
+        if delay:
+            time.sleep(delay)
+        return self._build_completion(request, api_kwargs)
+
+    async def async_complete(self, request, api_kwargs):
+        delay = self._draw_fault()
+        if delay:
+            await asyncio.sleep(delay)
+        return self._build_completion(request, api_kwargs)
+
+    def _draw_fault(self):
+        """Returns this call's latency in seconds, or raises an injected failure."""
+        with self._fault_lock:
+            roll = self._fault_random.random()
+            delay = self._fault_random.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000 if self.latency_ms > 0 else 0
+        if roll < self.rate_limit_rate:
+            raise MockLLMError("Error code: 429 - rate_limit_exceeded (mock backend)", {'retry-after-ms': '1000'})
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise MockLLMError("Error code: 500 - internal_server_error (mock backend)")
+        return delay
+
+    def _build_completion(self, request, api_kwargs):
+        material = f"{self.seed}\x00{request.context}\x00{request.system_message}\x00{request.prompt}\x00{request.temperature}"
+        rng = random.Random(hashlib.sha256(material.encode('utf-8')).digest())
+        people = re.findall(r"^- ([^,\n]+), [^\n]*\(([^()\s]+@[^()\s]+)\)$", request.context + request.prompt, re.MULTILINE) or [("Alex Morgan", "alex.morgan@example.com"), ("Sam Lee", "sam.lee@example.com")]
+        task = request.prompt.split("Task:", 1)[-1]
+        topics = [w.strip('.,:;!?"\'()').lower() for w in task.split()]
+        topics = [w for w in topics if len(w) > 4 and w.isalpha() and w not in self.TOPIC_STOPWORDS] or ['the project']
+
+        # People named in the task act first; everyone else fills in recipients
+        mentioned = [p for p in people if p[0] in task]
+        sender = mentioned[0] if mentioned else rng.choice(people)
+        others = [p for p in mentioned[1:] + people if p != sender]
+        recipients = [list(p) for p in dict.fromkeys(others[:rng.randint(1, 3)])] or [list(sender)]
+
+        def paragraph(count):
+            return " ".join(rng.choice(self.SENTENCES).format(topic=rng.choice(topics)) for _ in range(count))
+
+        if request.kind == 'attachment':
+            content = "\n\n".join(paragraph(rng.randint(3, 6)) for _ in range(rng.randint(3, 8)))
+        elif request.kind == 'calendar':
+            content = json.dumps({
+                'summary': f"{rng.choice(topics).title()} sync",
+                'description': paragraph(2),
+                'organizer_name': sender[0], 'organizer_email': sender[1],
+                'attendees': recipients,
+            })
+        elif request.kind == 'chat':
+            participants = [sender] + [tuple(r) for r in recipients]
+            content = json.dumps({'messages': [
+                {'sender_name': p[0], 'sender_email': p[1], 'body': rng.choice(self.CHAT_LINES).format(topic=rng.choice(topics))}
+                for p in (participants[i % len(participants)] for i in range(rng.randint(4, 12)))
+            ]}, ensure_ascii=False)
+        elif request.kind == 'email':
+            content = json.dumps({
+                'subject': f"{rng.choice(['Re: ', 'FW: ', '', '', ''])}{' '.join(rng.sample(topics, min(3, len(topics)))).title()}",
+                'body': "\n\n".join([f"Hi {recipients[0][0].split()[0]},"] + [paragraph(rng.randint(2, 4)) for _ in range(rng.randint(1, 3))] + ["Thanks,"]),
+                'sender_name': sender[0], 'sender_email': sender[1],
+                'recipients': recipients,
+            })
+        else:
+            content = json.dumps({'text': paragraph(3)})
+
+        prompt_tokens = (len(request.context) + len(request.system_message) + len(request.prompt)) // 4
+        completion_tokens = len(content) // 4
+        return LLMCompletion(content, prompt_tokens + completion_tokens, {}, prompt_tokens, self._cached_prefix_tokens(request), completion_tokens)
+
+    def _cached_prefix_tokens(self, request):
+        """Longest previously seen system prefix (context, then context + system message) that qualifies for caching."""
+        cached = 0
+        for prefix in (request.context, request.context + request.system_message):
+            tokens = len(prefix) // 4
+            if tokens < 1024:
+                continue
+            digest = hashlib.sha256(prefix.encode('utf-8')).digest()
+            with self._fault_lock:
+                if digest in self._seen_prefixes:
+                    cached = tokens // 128 * 128
+                else:
+                    self._seen_prefixes.add(digest)
+        return cached
+
+llm_backend = None
+
+def configure_llm_backend(name='azure', mock_latency_ms=800, mock_latency_sigma=0.5, mock_error_rate=0.0, mock_rate_limit_rate=0.0, mock_seed=0):
+    """Selects the backend every LLM request goes through (--backend)."""
+    global llm_backend
+    if name == 'mock':
+        llm_backend = MockBackend(mock_latency_ms, mock_latency_sigma, mock_error_rate, mock_rate_limit_rate, mock_seed)
+        print(f"Using offline mock LLM backend (~{mock_latency_ms} ms latency, {mock_error_rate:.0%} errors, {mock_rate_limit_rate:.0%} rate limits).")
+        return llm_backend
+    try:
+        llm_backend = AzureBackend()
+    except Exception as e:
+        print(f"Error: Failed to configure AzureOpenAI client. Check .env file. Details: {e}")
+        exit()
+    return llm_backend
+
+def get_llm_backend():
+    """The configured backend; defaults to Azure OpenAI when nothing was configured."""
+    return llm_backend or configure_llm_backend('azure')
+
+# --- LLM Response Cache ---
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of LLM completions, stored in SQLite.
+
+    Keys hash (backend, model, messages, temperature, response_format, seed) plus an
+    occurrence index: the Nth identical request in a run maps to the Nth cached answer, so
+    repeated prompts still get distinct completions while a re-run of the same config
+    replays them. Entries older than max_age_days are dropped and the least recently used
+    entries are evicted once the store exceeds max_size_mb. Hits only note their last use in
+    memory; it is written with the next commit (a put, eviction or close).
+    """
+
+    def __init__(self, path, max_size_mb=1024, max_age_days=30):
+        self.path = path
+        self.max_size_bytes = max_size_mb * 1024 * 1024 if max_size_mb else None
+        self.max_age_seconds = max_age_days * 86400 if max_age_days else None
+        self._occurrences = {}
+        self._last_used = {}  # key -> time of hits not yet written
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)")
+        self._db.commit()
+        self.evict()
+
+    def make_key(self, api_kwargs):
+        """Hashes the request fields that determine the completion, plus its occurrence index."""
+        material = json.dumps([
+            get_llm_backend().name, api_kwargs.get('model'), [message['content'] for message in api_kwargs['messages']],
+            api_kwargs.get('temperature'), api_kwargs.get('response_format'), api_kwargs.get('seed'),
+        ], sort_keys=True, ensure_ascii=False)
+        digest = hashlib.sha256(material.encode('utf-8')).hexdigest()
+        with self._lock:
+            occurrence = self._occurrences.get(digest, 0)
+            self._occurrences[digest] = occurrence + 1
+        return f"{digest}:{occurrence}"
+
+    def get(self, key):
+        """Returns cached content for key, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT content FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._last_used[key] = time.time()
+            return row[0]
+
+    def _write_last_used(self):
+        """Adds the pending hit times to the current transaction (caller holds the lock)."""
+        if self._last_used:
+            self._db.executemany("UPDATE responses SET last_used = ? WHERE key = ?",
+                                 [(used, key) for key, used in self._last_used.items()])
+            self._last_used.clear()
+
+    def put(self, key, content):
+        """Stores a completion."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses (key, content, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                             (key, content, len(content.encode('utf-8')), now, now))
+            self._write_last_used()
+            self._db.commit()
+
+    def evict(self):
+        """Drops expired entries, then least recently used entries beyond the size budget."""
+        with self._lock:
+            self._write_last_used()
+            if self.max_age_seconds:
+                self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age_seconds,))
+            if self.max_size_bytes:
+                total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_size_bytes:
+                    excess = total - self.max_size_bytes
+                    freed = 0
+                    stale_keys = []
+                    for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                        stale_keys.append((key,))
+                        freed += size
+                        if freed >= excess:
+                            break
+                    self._db.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+            self._db.commit()
+
+    def close(self):
+        """Applies eviction and closes the store."""
+        self.evict()
+        with self._lock:
+            self._db.close()
+
+# Optional process-wide response cache; None disables caching
+response_cache = None
+
+def configure_response_cache(path=None, max_size_mb=1024, max_age_days=30):
+    """Opens the on-disk response cache at path (no-op when path is empty)."""
+    global response_cache
+    response_cache = ResponseCache(path, max_size_mb, max_age_days) if path else None
+    if response_cache:
+        print(f"LLM response cache: {os.path.abspath(path)}")
+    return response_cache
+
+def lookup_cached_response(request, api_kwargs):
+    """Returns (cache_key, parsed_response) for a request; parsed_response is None on a miss."""
+    if not response_cache:
+        return None, None
+    cache_key = response_cache.make_key(api_kwargs)
+    content = response_cache.get(cache_key)
+    usage = job_llm_usage.get()
+    if usage is not None:
+        with llm_usage_lock:
+            usage['cache_misses' if content is None else 'cache_hits'] += 1
+    if content is None:
+        return cache_key, None
+    return cache_key, parse_llm_response(request, content)
+
+def store_cached_response(cache_key, content, parsed):
+    """Caches a completion that parsed successfully."""
+    if response_cache and cache_key and parsed is not None:
+        response_cache.put(cache_key, content)
+
+# Rough completion budgets by response kind, used until the response reports real usage
+ESTIMATED_COMPLETION_TOKENS = {'email': 700, 'calendar': 300, 'chat': 900, 'attachment': 1200, 'json': 700}
+
+def estimate_request_tokens(request):
+    """Estimates prompt + completion tokens for a request (~4 characters per token)."""
+    return (len(request.context) + len(request.system_message) + len(request.prompt)) // 4 + ESTIMATED_COMPLETION_TOKENS.get(request.kind, 700)
+
+def get_usage_total_tokens(response):
+    """Total tokens reported by a completion's `usage`, or None."""
+    usage = getattr(response, 'usage', None)
+    return getattr(usage, 'total_tokens', None) if usage else None
+
+# Token usage of the scenario job running in the current context (its stats' 'llm_usage')
+job_llm_usage = contextvars.ContextVar('job_llm_usage', default=None)
+llm_usage_lock = threading.Lock()
+
+def record_llm_usage(completion):
+    """Adds a completion's reported usage to the current job's stats."""
+    usage = job_llm_usage.get()
+    if usage is None:
+        return
+    with llm_usage_lock:
+        usage['requests'] += 1
+        usage['prompt_tokens'] += completion.prompt_tokens or 0
+        usage['cached_tokens'] += completion.cached_tokens or 0
+        usage['completion_tokens'] += completion.completion_tokens or 0
+
+# Per-stage timings of the scenario job running in the current context (its entry in the
+# stats' 'profile': item type -> stage -> totals)
+job_profile = contextvars.ContextVar('job_profile', default=None)
+profile_lock = threading.Lock()
+
+def record_stage(stage, item_type, seconds, profile=None, **counters):
+    """Adds one timed operation (plus any extra counters) to a profile, by default the current job's."""
+    profile = job_profile.get() if profile is None else profile
+    if profile is None:
+        return
+    with profile_lock:
+        entry = profile.setdefault(item_type, {}).setdefault(stage, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        entry['count'] += 1
+        entry['seconds'] += seconds
+        entry['max_seconds'] = max(entry['max_seconds'], seconds)
+        for name, value in counters.items():
+            entry[name] = entry.get(name, 0) + value
+
+@contextlib.contextmanager
+def timed_stage(stage, item_type):
+    """Times the enclosed block as one operation of stage for item_type."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, item_type, time.perf_counter() - start)
+
+def new_llm_timing():
+    """Accumulator for one LLM call across its retries: time waiting for quota/slots vs. on the network."""
+    return {'queue_seconds': 0.0, 'network_seconds': 0.0, 'attempts': 0, 'rate_limited': 0}
+
+def record_llm_call(request, completion, timing=None, seconds=0.0):
+    """
+    Adds a finished LLM call to the current job's usage and profile (completion is None if
+    it failed). Batch calls have no timing of their own and are profiled as 'llm_batch'.
+    """
+    counters = {'failed': 0 if completion else 1}
+    if completion:
+        record_llm_usage(completion)
+        counters.update(prompt_tokens=completion.prompt_tokens or 0, cached_tokens=completion.cached_tokens or 0,
+                        completion_tokens=completion.completion_tokens or 0)
+    if timing:
+        counters.update(queue_seconds=timing['queue_seconds'], network_seconds=timing['network_seconds'],
+                        retries=max(0, timing['attempts'] - 1), rate_limited=timing['rate_limited'])
+    record_stage('llm' if timing else 'llm_batch', request.kind, seconds, **counters)
+    if progress_dashboard:
+        progress_dashboard.record_call(completion.total_tokens or 0 if completion else 0,
+                                       counters.get('retries', 0), counters.get('rate_limited', 0))
+
+def execute_llm_request(request):
+    """Runs one LLMRequest on the calling thread with caching, rate limiting and retry logic."""
+    api_kwargs = build_chat_api_kwargs(request)
+    cache_key, cached = lookup_cached_response(request, api_kwargs)
+    if cached is not None:
+        return cached
+
+    announce_llm_request(request)
+    estimated_tokens = estimate_request_tokens(request)
+    backend = get_llm_backend()
+    timing, completion, started = new_llm_timing(), None, time.perf_counter()
+    try:
+        def _call_api():
+            queued = time.perf_counter()
+            if rate_limiter:
+                rate_limiter.acquire(estimated_tokens)
+            sent = time.perf_counter()
+            timing['queue_seconds'] += sent - queued
+            timing['attempts'] += 1
+            if progress_dashboard:
+                progress_dashboard.llm_started()
+            try:
+                completion = backend.complete(request, api_kwargs)
+            except Exception as e:
+                timing['rate_limited'] += is_rate_limit_error(e)
+                raise
+            finally:
+                timing['network_seconds'] += time.perf_counter() - sent
+                if progress_dashboard:
+                    progress_dashboard.llm_finished()
+            if rate_limiter:
+                rate_limiter.update_from_headers(completion.headers)
+            return completion
+
+        completion = call_llm_with_retry(_call_api)
+        if rate_limiter:
+            rate_limiter.record_usage(estimated_tokens, completion.total_tokens)
+        content = completion.content
+        parsed = parse_llm_response(request, content)
+        store_cached_response(cache_key, content, parsed)
+        return parsed
+    except Exception as e:
+        return handle_llm_request_error(request, e)
+    finally:
+        record_llm_call(request, completion, timing, time.perf_counter() - started)
+
+# Bounds concurrent requests in the asyncio engine; created by run_generation_jobs()
+async_llm_slots = None
+
+async def async_execute_llm_request(request):
+    """Coroutine version of execute_llm_request() using the backend's async client."""
+    api_kwargs = build_chat_api_kwargs(request)
+    cache_key, cached = lookup_cached_response(request, api_kwargs)
+    if cached is not None:
+        return cached
+
+    announce_llm_request(request)
+    estimated_tokens = estimate_request_tokens(request)
+    backend = get_llm_backend()
+    timing, completion, started = new_llm_timing(), None, time.perf_counter()
+    try:
+        async def _call_api():
+            queued = time.perf_counter()
+            if rate_limiter:
+                await rate_limiter.async_acquire(estimated_tokens)
+            async with async_llm_slots:
+                sent = time.perf_counter()
+                timing['queue_seconds'] += sent - queued
+                timing['attempts'] += 1
+                if progress_dashboard:
+                    progress_dashboard.llm_started()
+                try:
+                    completion = await backend.async_complete(request, api_kwargs)
+                except Exception as e:
+                    timing['rate_limited'] += is_rate_limit_error(e)
+                    raise
+                finally:
+                    timing['network_seconds'] += time.perf_counter() - sent
+                    if progress_dashboard:
+                        progress_dashboard.llm_finished()
+            if rate_limiter:
+                rate_limiter.update_from_headers(completion.headers)
+            return completion
+
+        completion = await async_call_llm_with_retry(_call_api)
+        if rate_limiter:
+            rate_limiter.record_usage(estimated_tokens, completion.total_tokens)
+        content = completion.content
+        parsed = parse_llm_response(request, content)
+        store_cached_response(cache_key, content, parsed)
+        return parsed
+    except Exception as e:
+        return handle_llm_request_error(request, e)
+    finally:
+        record_llm_call(request, completion, timing, time.perf_counter() - started)
+
+# --- Batch API ---
+# The batch engine (--engine batch) sends a whole round of LLMRequests as one JSONL file
+# through the Azure OpenAI Batch API: cheaper, and not bound by the per-minute quota, but
+# answered within hours rather than seconds. Backends without a batch endpoint (the mock),
+# or any backend with --batch-local, process the same file locally instead.
+
+# Requests per batch file (the service accepts up to 100,000)
+BATCH_SIZE = 50000
+# Seconds between batch status polls
+BATCH_POLL_SECONDS = 60
+# Where round files are written (removed once their results are read)
+BATCH_DIR = '.batch'
+# Process batch files with the regular chat endpoint instead of the Batch API
+BATCH_LOCAL = False
+
+def build_batch_line(custom_id, request):
+    """One line of a batch request file: the request's chat.completions.create() arguments."""
+    return {'custom_id': custom_id, 'method': 'POST', 'url': '/chat/completions', 'body': build_chat_api_kwargs(request)}
+
+def parse_batch_result(record):
+    """Turns one line of batch output into an LLMCompletion, or an Exception for a failed request."""
+    response = record.get('response') or {}
+    if record.get('error') or response.get('status_code') != 200:
+        error = record.get('error') or (response.get('body') or {}).get('error') or {}
+        return Exception(f"Error code: {response.get('status_code')} - {error.get('message', error) if isinstance(error, dict) else error} (batch)")
+    body = response['body']
+    usage = body.get('usage') or {}
+    return LLMCompletion(body['choices'][0]['message']['content'], usage.get('total_tokens'), {},
+                         usage.get('prompt_tokens'), (usage.get('prompt_tokens_details') or {}).get('cached_tokens'),
+                         usage.get('completion_tokens'))
+
+def build_batch_result(custom_id, completion):
+    """Batch output line for a completion (or exception) produced by the local stand-in."""
+    if isinstance(completion, Exception):
+        status = 429 if is_rate_limit_error(completion) else 500
+        return {'custom_id': custom_id, 'response': {'status_code': status, 'body': {'error': {'message': str(completion)}}}, 'error': None}
+    usage = {'prompt_tokens': completion.prompt_tokens, 'completion_tokens': completion.completion_tokens, 'total_tokens': completion.total_tokens,
+             'prompt_tokens_details': {'cached_tokens': completion.cached_tokens}}
+    body = {'object': 'chat.completion', 'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': completion.content}}], 'usage': usage}
+    return {'custom_id': custom_id, 'response': {'status_code': 200, 'body': body}, 'error': None}
+
+def run_local_batch(backend, path, output_path, requests_by_id, workers):
+    """
+    Local stand-in for the Batch API: answers every line of a batch file with the regular
+    endpoint (workers at a time, within the rate limiter) and writes the output file in
+    the service's format. Failed lines are reported, not retried, as the service does.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f]
+
+    def _answer(line):
+        request = requests_by_id[line['custom_id']]
+        estimated_tokens = estimate_request_tokens(request)
+        try:
+            if rate_limiter:
+                rate_limiter.acquire(estimated_tokens)
+            completion = backend.complete(request, line['body'])
+            if rate_limiter:
+                rate_limiter.update_from_headers(completion.headers)
+                rate_limiter.record_usage(estimated_tokens, completion.total_tokens)
+        except Exception as e:
+            completion = e
+        return build_batch_result(line['custom_id'], completion)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor, open(output_path, 'w', encoding='utf-8') as f:
+        for result in executor.map(_answer, lines):
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    return 'completed'
+
+def execute_batch_round(requests, round_number, local_workers=200):
+    """
+    Answers a round of LLMRequests through the Batch API (or the local stand-in), split
+    into files of BATCH_SIZE requests that run side by side.
+
+    Returns:
+        list: An LLMCompletion or an Exception per request, in order
+    """
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    backend = get_llm_backend()
+    custom_ids = [f"round{round_number}-{index}" for index in range(len(requests))]
+    parts = []
+    for part_number, start in enumerate(range(0, len(requests), BATCH_SIZE), 1):
+        path = os.path.join(BATCH_DIR, f"round-{round_number:04d}-part-{part_number:03d}.jsonl")
+        with open(path, 'w', encoding='utf-8') as f:
+            for index in range(start, min(start + BATCH_SIZE, len(requests))):
+                f.write(json.dumps(build_batch_line(custom_ids[index], requests[index]), ensure_ascii=False) + "\n")
+        parts.append((path, path[:-len('.jsonl')] + '.output.jsonl', range(start, min(start + BATCH_SIZE, len(requests)))))
+
+    if BATCH_LOCAL or not hasattr(backend, 'submit_batch'):
+        for path, output_path, indexes in parts:
+            run_local_batch(backend, path, output_path, {custom_ids[i]: requests[i] for i in indexes}, local_workers)
+    else:
+        batch_ids = []
+        try:
+            for path, _, indexes in parts:
+                batch_ids.append(backend.submit_batch(path))
+                log.info(f"    [Batch] Submitted {len(indexes)} request(s) as {batch_ids[-1]}")
+            for batch_id, (_, output_path, _) in zip(batch_ids, parts):
+                backend.wait_for_batch(batch_id, output_path, BATCH_POLL_SECONDS)
+        except KeyboardInterrupt:
+            # Don't leave paid work running for a run that is no longer listening
+            for batch_id in batch_ids:
+                try:
+                    backend.cancel_batch(batch_id)
+                except Exception as e:
+                    log.error(f"!!! ERROR: Could not cancel batch {batch_id}: {e}")
+            raise
+
+    results = {}
+    for path, output_path, _ in parts:
+        with open(output_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    results[record['custom_id']] = parse_batch_result(record)
+        os.remove(path)
+        os.remove(output_path)
+    return [results.get(custom_id) or Exception("Error code: None - no result returned (batch)") for custom_id in custom_ids]
+
 # --- Attachment Generation Functions ---
 
-def generate_attachment_text_from_llm(filename, description, file_type, email_context=None, temperature=0.8):
-    """Generates realistic text content for a document based on its description and email context."""
+def build_attachment_text_request(filename, description, file_type, email_context=None, temperature=0.8):
+    """Builds the LLM request for an attachment's text content, aligned with its email."""
     system_message = (
     f"You are an AI assistant generating the internal text content for a fake file. "
     f"The filename is '{filename}'. "
@@ -441,138 +1937,543 @@ CRITICAL ALIGNMENT REQUIREMENT:
     else:
         prompt = f"Generate content for this document: {description}"
 
-    print(f"  ... Generating content for attachment: {filename} ...")
-    try:
-        def _call_api():
-            return client.chat.completions.create(
-                model=AZURE_MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=temperature
-            )
+    return LLMRequest(system_message, prompt, temperature, kind='attachment', label=filename, fallback=description)
 
-        response = call_llm_with_retry(_call_api)
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"!!! ERROR generating attachment content: {e}")
-        return description # Fallback
+def generate_attachment_text_from_llm(filename, description, file_type, email_context=None, temperature=0.8):
+    """Generates realistic text content for a document based on its description and email context."""
+    return execute_llm_request(build_attachment_text_request(filename, description, file_type, email_context, temperature))
+
+# --- PDF Writer ---
+
+PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT = 612, 792  # US Letter, in points
+PDF_MARGIN = 54
+PDF_FONT_SIZE = 11
+PDF_HEADING_SIZE = 14
+PDF_LEADING = 15
+# Flate-compress page content streams (--pdf-uncompressed turns it off for debugging)
+PDF_FLATE = True
+
+# Helvetica advance widths (1/1000 em) for printable ASCII, from the base-14 font metrics;
+# other WinAnsi codes use an average width, which is close enough for line wrapping
+HELVETICA_WIDTHS = [556] * 256
+HELVETICA_WIDTHS[32:127] = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584]
+for code, width in {0x85: 1000, 0x91: 222, 0x92: 222, 0x93: 333, 0x94: 333, 0x95: 350, 0x96: 556, 0x97: 1000, 0xA0: 278}.items():
+    HELVETICA_WIDTHS[code] = width
+
+def _win_ansi_fallback(error):
+    """Codec error handler: characters outside WinAnsi lose their accents (NFKD) or become '?'."""
+    replacement = ''.join('?' if unicodedata.combining(ch) == 0 and not ch.isascii() else ch
+                          for ch in unicodedata.normalize('NFKD', error.object[error.start:error.end])
+                          if not unicodedata.combining(ch))
+    return replacement or '?', error.end
+
+codecs.register_error('pdf_win_ansi', _win_ansi_fallback)
+
+def encode_pdf_text(text):
+    """Encodes text for the standard fonts' WinAnsiEncoding (cp1252: Western European text,
+    curly quotes, dashes, euro sign). Scripts the base-14 fonts don't cover become '?'."""
+    return text.encode('cp1252', errors='pdf_win_ansi')
+
+def wrap_pdf_lines(text, font_size=PDF_FONT_SIZE, max_width=PDF_PAGE_WIDTH - 2 * PDF_MARGIN):
+    """Word-wraps text to max_width points of Helvetica, keeping paragraph breaks. Yields encoded lines."""
+    limit = max_width * 1000 / font_size
+    space = HELVETICA_WIDTHS[32]
+    char_width = HELVETICA_WIDTHS.__getitem__
+    for paragraph in text.expandtabs(4).splitlines():
+        line, line_width = [], 0
+        for word in encode_pdf_text(paragraph).split():
+            word_width = sum(map(char_width, word))
+            if line and line_width + space + word_width > limit:
+                yield b' '.join(line)
+                line, line_width = [], 0
+            # Words wider than the page (URLs, hashes) are broken wherever they hit the margin
+            while word_width > limit:
+                cut, cut_width = 0, 0
+                while cut_width + HELVETICA_WIDTHS[word[cut]] <= limit:
+                    cut_width += HELVETICA_WIDTHS[word[cut]]
+                    cut += 1
+                yield word[:cut]
+                word, word_width = word[cut:], word_width - cut_width
+            line.append(word)
+            line_width += word_width + (space if len(line) > 1 else 0)
+        yield b' '.join(line)
+
+def escape_pdf_string(data):
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)').replace(b'\r', b'\\r')
+
+class PdfWriter:
+    """
+    Minimal PDF 1.4 writer for text documents: Helvetica with WinAnsiEncoding, one content
+    stream per page (optionally Flate-compressed) and a cross-reference table built from the
+    real byte offsets. Objects go to `out` as pages are added, so a document of any length is
+    written with constant memory; `out` only needs write().
+    """
+    CATALOG, PAGES, FONT, BOLD_FONT, INFO = 1, 2, 3, 4, 5
+
+    def __init__(self, out, title='', compress=None):
+        self.out = out
+        self.title = title
+        self.compress = PDF_FLATE if compress is None else compress
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = self.INFO + 1
+        self.position = 0
+        # The comment with high-bit bytes marks the file as binary for transfer tools
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self.out.write(data)
+        self.position += len(data)
+
+    def _object(self, number, body, stream=None):
+        self.offsets[number] = self.position
+        if stream is None:
+            self._write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+            return
+        if self.compress:
+            stream = zlib.compress(stream, 6)
+            body += b"/Filter/FlateDecode"
+        self._write(b"%d 0 obj\n<<%s/Length %d>>\nstream\n" % (number, body, len(stream)))
+        self._write(stream)
+        self._write(b"\nendstream\nendobj\n")
+
+    def add_page(self, lines, heading=None):
+        """Adds a page of pre-wrapped, encoded lines (see wrap_pdf_lines) with an optional bold heading."""
+        top = PDF_PAGE_HEIGHT - PDF_MARGIN
+        parts = [b"BT"]
+        if heading:
+            parts.append(b"/F2 %d Tf %d %d Td (%s) Tj" % (PDF_HEADING_SIZE, PDF_MARGIN, top - PDF_HEADING_SIZE, escape_pdf_string(heading)))
+            parts.append(b"/F1 %d Tf %d TL 0 %d Td" % (PDF_FONT_SIZE, PDF_LEADING, -PDF_LEADING))
+        else:
+            parts.append(b"/F1 %d Tf %d TL %d %d Td" % (PDF_FONT_SIZE, PDF_LEADING, PDF_MARGIN, top))
+        parts.extend(b"(%s) '" % escape_pdf_string(line) if line else b"T*" for line in lines)
+        parts.append(b"ET")
+        parts.append(b"BT /F1 9 Tf %d %d Td (Page %d) Tj ET" % (PDF_PAGE_WIDTH // 2 - 15, PDF_MARGIN // 2, len(self.page_ids) + 1))
+
+        contents_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self._object(contents_id, b"", b"\n".join(parts))
+        self._object(page_id, b"<</Type/Page/Parent %d 0 R/MediaBox[0 0 %d %d]/Resources<</Font<</F1 %d 0 R/F2 %d 0 R>>>>/Contents %d 0 R>>"
+                     % (self.PAGES, PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT, self.FONT, self.BOLD_FONT, contents_id))
+        self.page_ids.append(page_id)
+
+    def write_text(self, lines, heading=None):
+        """Paginates an iterable of encoded lines onto new pages; the heading goes on the first one."""
+        body_lines = (PDF_PAGE_HEIGHT - 2 * PDF_MARGIN) // PDF_LEADING
+        page, capacity = [], body_lines - (2 if heading else 0)
+        for line in lines:
+            page.append(line)
+            if len(page) == capacity:
+                self.add_page(page, heading)
+                page, heading, capacity = [], None, body_lines
+        if page or heading:
+            self.add_page(page, heading)
+
+    def close(self):
+        """Writes the page tree, fonts, catalog and document info, then the xref table and trailer."""
+        if not self.page_ids:
+            self.add_page([])
+        for number, font in ((self.FONT, b"Helvetica"), (self.BOLD_FONT, b"Helvetica-Bold")):
+            self._object(number, b"<</Type/Font/Subtype/Type1/BaseFont/%s/Encoding/WinAnsiEncoding>>" % font)
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self.page_ids)
+        self._object(self.PAGES, b"<</Type/Pages/Count %d/Kids[%s]>>" % (len(self.page_ids), kids))
+        self._object(self.CATALOG, b"<</Type/Catalog/Pages %d 0 R>>" % self.PAGES)
+        created = generation_now().strftime("D:%Y%m%d%H%M%S").encode('ascii')
+        # Info strings use PDFDocEncoding, or UTF-16 with a BOM for anything beyond ASCII
+        title = self.title.encode('ascii') if self.title.isascii() else codecs.BOM_UTF16_BE + self.title.encode('utf-16-be')
+        self._object(self.INFO, b"<</Title(%s)/Producer(synth-data)/CreationDate(%s)>>" % (escape_pdf_string(title), created))
+
+        xref_offset = self.position
+        entries = [b"0000000000 65535 f \n"] + [b"%010d 00000 n \n" % self.offsets[number] for number in range(1, self.next_id)]
+        self._write(b"xref\n0 %d\n%s" % (self.next_id, b"".join(entries)))
+        self._write(b"trailer\n<</Size %d/Root %d 0 R/Info %d 0 R>>\nstartxref\n%d\n%%%%EOF\n" % (self.next_id, self.CATALOG, self.INFO, xref_offset))
 
 def create_fake_pdf_attachment(filename, content_text):
-    """Creates a valid PDF with basic manual text wrapping and character sanitization."""
-    
-    # --- SANITIZATION START ---
-    replacements = {
-        '\u2018': "'",  # Left single quote
-        '\u2019': "'",  # Right single quote
-        '\u201c': '"',  # Left double quote
-        '\u201d': '"',  # Right double quote
-        '\u2013': '-',  # En dash
-        '\u2014': '--', # Em dash
-        '\u2026': '...',# Ellipsis
-        '\u00A0': ' '   # Non-breaking space
-    }
-    for char, replacement in replacements.items():
-        content_text = content_text.replace(char, replacement)
-    
-    clean_text = content_text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
-    # --- SANITIZATION END ---
-    
-    words = clean_text.split()
-    lines = []
-    current_line = []
-    current_length = 0
-    
-    for word in words:
-        if current_length + len(word) > 85: # Approx char limit per line
-            lines.append(" ".join(current_line))
-            current_line = [word]
-            current_length = len(word)
+    """Creates a valid, paginated PDF: wrapped text with the filename as heading."""
+    buffer = BytesIO()
+    writer = PdfWriter(buffer, title=filename)
+    writer.write_text(wrap_pdf_lines(content_text), heading=encode_pdf_text(filename))
+    writer.close()
+    return buffer.getvalue()
+
+# --- Office Document Writers ---
+
+# Data rows in generated spreadsheets (--xlsx-rows)
+XLSX_DATA_ROWS = 19
+
+# Characters XML 1.0 can't carry; LLM text occasionally contains them
+XML_INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+XML_SPECIAL_CHARS = re.compile('[&<>\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+def xml_text(value):
+    """Escapes text for XML element content (most strings need nothing, so check first)."""
+    text = str(value)
+    if XML_SPECIAL_CHARS.search(text):
+        text = xml_escape(XML_INVALID_CHARS.sub('', text))
+    return text
+
+def office_zip_info(name, when):
+    """A deflated package member dated `when` (seeded runs produce byte-identical files)."""
+    info = zipfile.ZipInfo(name, date_time=when.timetuple()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+def office_core_xml(when, title='', creator=''):
+    """docProps/core.xml with the created/modified dates set to `when`."""
+    stamp = when.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+            'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/" '
+            'xmlns:dcmitype="http://purl.org/dc/dcmitype/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+            f'<dc:title>{xml_text(title)}</dc:title><dc:creator>{xml_text(creator)}</dc:creator><cp:revision>1</cp:revision>'
+            f'<dcterms:created xsi:type="dcterms:W3CDTF">{stamp}</dcterms:created>'
+            f'<dcterms:modified xsi:type="dcterms:W3CDTF">{stamp}</dcterms:modified></cp:coreProperties>')
+
+@dataclass
+class DocxTemplate:
+    """python-docx's default template, split so documents can reuse its compressed parts."""
+    package: bytes        # zip of every part except the document body and core properties
+    document_head: bytes  # word/document.xml up to and including <w:body>
+    document_tail: bytes  # the section properties and closing tags
+
+docx_template = None
+docx_template_lock = threading.Lock()
+
+def get_docx_template():
+    """
+    Loads and splits the default template once per process. Its styles alone are ~800 KB of
+    XML, which Document() used to parse and save() to deflate again for every attachment.
+    """
+    global docx_template
+    with docx_template_lock:
+        if docx_template is None:
+            source = BytesIO()
+            Document().save(source)
+            when = generation_now()
+            package = BytesIO()
+            with zipfile.ZipFile(source) as template, zipfile.ZipFile(package, 'w') as target:
+                for info in template.infolist():
+                    if info.filename == 'word/document.xml':
+                        document = template.read(info)
+                    elif info.filename != 'docProps/core.xml':
+                        target.writestr(office_zip_info(info.filename, when), template.read(info))
+            body = document.index(b'<w:body>') + len(b'<w:body>')
+            section = document.index(b'<w:sectPr')
+            docx_template = DocxTemplate(package.getvalue(), document[:body], document[section:])
+        return docx_template
+
+def docx_paragraph(text, style=None):
+    style_xml = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ''
+    return f'<w:p>{style_xml}<w:r><w:t xml:space="preserve">{xml_text(text)}</w:t></w:r></w:p>'
+
+def write_docx(out, heading, paragraphs, large=False):
+    """
+    Writes a .docx to the seekable binary stream `out`: the cached template parts are copied
+    in as-is and only the body is generated, streamed paragraph by paragraph. Pass large=True
+    for documents that may pass 4 GB (zip64).
+    """
+    template = get_docx_template()
+    when = generation_now()
+    out.write(template.package)
+    with zipfile.ZipFile(out, 'a') as package:
+        with package.open(office_zip_info('word/document.xml', when), 'w', force_zip64=large) as part:
+            part.write(template.document_head)
+            part.write(docx_paragraph(heading, 'Heading1').encode('utf-8'))
+            chunk = []
+            for paragraph in paragraphs:
+                # (text, style) tuples carry a paragraph style, e.g. ('1. Scope', 'Heading2')
+                chunk.append(docx_paragraph(*paragraph) if isinstance(paragraph, tuple) else docx_paragraph(paragraph))
+                if len(chunk) == 1000:
+                    part.write(''.join(chunk).encode('utf-8'))
+                    chunk = []
+            part.write(''.join(chunk).encode('utf-8'))
+            part.write(template.document_tail)
+        package.writestr(office_zip_info('docProps/core.xml', when), office_core_xml(when, creator='python-docx'))
+
+XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '<Override PartName="/docProps/core.xml" ContentType="application/vnd.openxmlformats-package.core-properties+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" Target="docProps/core.xml"/>'
+        '</Relationships>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'),
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'),
+}
+
+def xlsx_column_name(index):
+    """0 -> 'A', 25 -> 'Z', 26 -> 'AA'."""
+    name = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(65 + remainder) + name
+    return name
+
+def xlsx_row(row_number, values, columns):
+    cells = []
+    for column, value in zip(columns, values):
+        if value is None or value == '':
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c r="{column}{row_number}"><v>{value}</v></c>')
         else:
-            current_line.append(word)
-            current_length += len(word) + 1
-    lines.append(" ".join(current_line))
-    
-    pdf_text_stream = "BT /F1 11 Tf 50 750 Td 15 TL " 
-    for line in lines:
-        pdf_text_stream += f"({line}) Tj T* "
-    pdf_text_stream += "ET"
-
-    pdf_content = f"""%PDF-1.4
-1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj
-2 0 obj<</Type/Pages/Count 1/Kids[3 0 R]>>endobj
-3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]/Contents 4 0 R>>endobj
-4 0 obj<</Length {len(pdf_text_stream) + 20}>>stream
-{pdf_text_stream}
-endstream endobj
-xref
-0 5
-0000000000 65535 f
-0000000010 00000 n
-0000000059 00000 n
-0000000112 00000 n
-0000000199 00000 n
-trailer<</Size 5/Root 1 0 R>>
-startxref
-288
-%%EOF"""
-    
-    return pdf_content.encode('latin-1', errors='replace')
+            text = xml_text(value)
+            space = ' xml:space="preserve"' if text[:1].isspace() or text[-1:].isspace() else ''
+            cells.append(f'<c r="{column}{row_number}" t="inlineStr"><is><t{space}>{text}</t></is></c>')
+    return f'<row r="{row_number}">{"".join(cells)}</row>'
+
+def write_xlsx(out, sheet_title, rows, large=False):
+    """
+    Writes a single-sheet .xlsx to the binary stream `out`, streaming `rows` (lists of str,
+    int or float) into the worksheet so memory stays flat however many there are. Strings
+    are stored inline, so no shared-string table has to be held in memory. Pass large=True
+    for workbooks that may pass 4 GB (zip64).
+    """
+    when = generation_now()
+    columns = [xlsx_column_name(index) for index in range(16)]
+    with zipfile.ZipFile(out, 'w') as package:
+        for name, content in XLSX_STATIC_PARTS.items():
+            package.writestr(office_zip_info(name, when), content)
+        package.writestr(office_zip_info('xl/workbook.xml', when), (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{xml_text(sheet_title[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'))
+        package.writestr(office_zip_info('docProps/core.xml', when), office_core_xml(when, creator='synth-data'))
+        with package.open(office_zip_info('xl/worksheets/sheet1.xml', when), 'w', force_zip64=large) as part:
+            part.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                       b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            chunk = []
+            for row_number, values in enumerate(rows, start=1):
+                if len(values) > len(columns):
+                    columns = [xlsx_column_name(index) for index in range(len(values))]
+                chunk.append(xlsx_row(row_number, values, columns))
+                if len(chunk) == 1000:
+                    part.write(''.join(chunk).encode('utf-8'))
+                    chunk = []
+            part.write(''.join(chunk).encode('utf-8'))
+            part.write(b'</sheetData></worksheet>')
 
 def create_fake_word_doc(filename, content_text):
     """Creates a fake .docx file in memory with generated content."""
-    document = Document()
-    document.add_heading(filename, level=1)
-    
-    # Add paragraphs
-    for para in content_text.split('\n'):
-        if para.strip():
-            document.add_paragraph(para.strip())
-            
     file_stream = BytesIO()
-    document.save(file_stream)
-    file_stream.seek(0)
+    write_docx(file_stream, filename, (para.strip() for para in content_text.split('\n') if para.strip()))
     return file_stream.getvalue()
 
-def create_fake_excel_sheet(filename, content_text):
-    """Creates a fake .xlsx file with generated content and dummy data."""
-    workbook = Workbook()
-    sheet = workbook.active
-    sheet.title = "Report Data"
-    sheet['A1'] = filename
-    
+def iter_report_sheet_rows(filename, content_text, data_rows):
+    """The rows of a report sheet: title, the text lines, then a table of dummy records."""
+    yield [filename]
+    yield []
     # Put the text content into rows at the top
-    current_row = 3
     for line in content_text.split('\n'):
         if line.strip():
-            sheet[f'A{current_row}'] = line
-            current_row += 1
-            
-    current_row += 2
-    headers = ['ID', 'Category', 'Amount', 'Status', 'Review Date']
-    for col, header in enumerate(headers, start=1):
-        sheet.cell(row=current_row, column=col, value=header)
-        
-    # Add some random rows of "data"
-    for i in range(1, 20):
-        row_num = current_row + i
-        sheet.cell(row=row_num, column=1, value=f"REC-{1000+i}")
-        sheet.cell(row=row_num, column=2, value=random.choice(['Hardware', 'Software', 'Services', 'Logistics']))
-        sheet.cell(row=row_num, column=3, value=random.randint(500, 50000))
-        sheet.cell(row=row_num, column=4, value=random.choice(['Approved', 'Pending', 'Rejected']))
-        sheet.cell(row=row_num, column=5, value=datetime.now().strftime("%Y-%m-%d"))
-        
+            yield [line]
+    yield []
+    yield []
+    yield ['ID', 'Category', 'Amount', 'Status', 'Review Date']
+    review_date = generation_now().strftime("%Y-%m-%d")
+    for i in range(1, data_rows + 1):
+        yield [f"REC-{1000+i}", rng.choice(['Hardware', 'Software', 'Services', 'Logistics']),
+               rng.randint(500, 50000), rng.choice(['Approved', 'Pending', 'Rejected']), review_date]
+
+def create_fake_excel_sheet(filename, content_text, data_rows=None):
+    """Creates a fake .xlsx file with generated content and dummy data (XLSX_DATA_ROWS rows by default)."""
     file_stream = BytesIO()
-    workbook.save(file_stream)
-    file_stream.seek(0)
+    write_xlsx(file_stream, "Report Data", iter_report_sheet_rows(filename, content_text, data_rows if data_rows is not None else XLSX_DATA_ROWS))
     return file_stream.getvalue()
 
+# --- Sized Document Stress Artifacts ---
+
+PDF_MIME = 'application/pdf'
+DOCX_MIME = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Size targets an attachment type may set under `size:`, per file type
+SIZED_ATTACHMENT_TARGETS = {PDF_MIME: ('pages', 'mb'), DOCX_MIME: ('pages', 'mb'), XLSX_MIME: ('rows', 'mb')}
+# Word paginates on open; about five generated paragraphs fill a Letter page
+DOCX_PARAGRAPHS_PER_PAGE = 5
+# Sized documents are built in memory up to this size, then spill to a temp file next to the email
+SIZED_ATTACHMENT_SPOOL_MB = 32
+
+def validate_attachment_sizes(attachment_config):
+    """
+    Checks the optional `size` targets of attachments.types (rows/pages/mb). Targets that
+    don't apply to the type's file format, or aren't positive numbers, are dropped with a warning.
+    """
+    for att_type in attachment_config.get('types', []):
+        size = att_type.get('size')
+        if size is None:
+            continue
+        name = att_type.get('name', att_type.get('mime_type'))
+        allowed = SIZED_ATTACHMENT_TARGETS.get(att_type.get('mime_type'))
+        if not allowed or not isinstance(size, dict):
+            print(f"Warning: Ignoring 'size' on attachment type '{name}'; size targets apply to PDF, DOCX and XLSX types.")
+            att_type.pop('size')
+            continue
+        valid = {}
+        for key, value in size.items():
+            if key in allowed and isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+                valid[key] = value
+            else:
+                print(f"Warning: Ignoring size target {key}: {value!r} on attachment type '{name}' (use {' / '.join(allowed)} > 0).")
+        if valid:
+            att_type['size'] = valid
+        else:
+            att_type.pop('size')
+
+class SeedTextExpander:
+    """
+    Procedural text from an LLM-written seed: its sentences are recombined into new paragraphs
+    and their digits redrawn, so a few hundred words stretch to any length while still reading
+    like the document they came from (and without compressing down to nothing).
+    """
+
+    def __init__(self, seed_text, seed):
+        self.random = random.Random(seed)
+        text = ' '.join((seed_text or '').split())
+        self.sentences = [sentence for sentence in re.split(r'(?<=[.!?])\s+', text) if len(sentence.split()) >= 4] or [text or 'No content.']
+        # Each sentence split around its numbers: [text, digit count, text, digit count, ..., text]
+        self.templates = [re.split(r'(\d+)', sentence) for sentence in self.sentences]
+        for parts in self.templates:
+            parts[1::2] = [len(digits) for digits in parts[1::2]]
+        words = re.findall(r"[A-Za-z][A-Za-z'-]{3,}", text)
+        self.terms = sorted({word for word in words if word[0].isupper()}) or sorted(set(words)) or ['General']
+
+    def sentence(self):
+        parts = self.random.choice(self.templates)
+        if len(parts) == 1:
+            return parts[0]
+        redrawn = parts[:]
+        for index in range(1, len(parts), 2):
+            redrawn[index] = str(self.random.randrange(10 ** parts[index])).zfill(parts[index])
+        return ''.join(redrawn)
+
+    def fragment(self):
+        """The first few words of a seed sentence (spreadsheet notes)."""
+        return ' '.join(self.random.choice(self.sentences).split()[:self.random.randint(4, 9)])
+
+    def term(self):
+        return self.random.choice(self.terms)
+
+    def blocks(self):
+        """Endless ('heading', text) / ('paragraph', text) blocks: numbered sections of a few paragraphs each."""
+        section = 0
+        while True:
+            section += 1
+            yield 'heading', f"{section}. {' '.join(self.term() for _ in range(self.random.randint(2, 4)))}"
+            for _ in range(self.random.randint(3, 6)):
+                yield 'paragraph', ' '.join(self.sentence() for _ in range(self.random.randint(3, 7)))
+
+def iter_sized_sheet_rows(filename, seed_text, expander, size, written):
+    """Report sheet rows: the seed text on top, then procedural records until the rows/MB targets are met."""
+    yield [filename]
+    yield []
+    for line in (seed_text or '').split('\n'):
+        if line.strip():
+            yield [line]
+    yield []
+    yield ['ID', 'Date', 'Category', 'Amount', 'Status', 'Notes']
+    target_rows, target_bytes = size.get('rows', 0), size.get('mb', 0) * 1024 * 1024
+    stamp = generation_now()
+    row = 0
+    while row < target_rows or written() < target_bytes:
+        row += 1
+        stamp -= timedelta(minutes=expander.random.randint(1, 240))
+        yield [f"REC-{100000 + row}", stamp.strftime("%Y-%m-%d %H:%M"), expander.term(), round(expander.random.uniform(50, 250000), 2),
+               expander.random.choice(['Approved', 'Pending', 'Rejected', 'On Hold']), expander.fragment()]
+
+def write_sized_attachment(out, attachment, seed_text):
+    """
+    Streams a PDF/DOCX/XLSX with `size` targets into the seekable stream `out`, expanding the
+    LLM-written seed text procedurally until every target is met: pages (PDF exactly unless
+    the MB target needs more, DOCX approximately), rows (XLSX) and MB of output. Memory stays
+    flat however large it gets.
+    """
+    size, filename, mime_type = attachment['size'], attachment['filename'], attachment['mime_type']
+    expander = SeedTextExpander(seed_text, attachment['seed'])
+    target_pages, target_bytes = size.get('pages', 0), size.get('mb', 0) * 1024 * 1024
+    # Members past 4 GB need zip64; only turn it on when a target could get there
+    large = size.get('mb', 0) >= 1024 or size.get('rows', 0) >= 10_000_000 or target_pages >= 100_000
+
+    if mime_type == PDF_MIME:
+        writer = PdfWriter(out, title=filename)
+
+        def block_lines():
+            for kind, text in expander.blocks():
+                if kind == 'heading':
+                    yield b''
+                yield from wrap_pdf_lines(text)
+                yield b''
+
+        def lines():
+            # Checked per line: write_text() adds each page as it fills, so stopping before
+            # the next line leaves no partial page past the target
+            for line in block_lines():
+                if len(writer.page_ids) >= target_pages and writer.position >= target_bytes:
+                    return
+                yield line
+        writer.write_text(lines(), heading=encode_pdf_text(filename))
+        writer.close()
+    elif mime_type == DOCX_MIME:
+        def paragraphs():
+            count = 0
+            for kind, text in expander.blocks():
+                if count >= target_pages * DOCX_PARAGRAPHS_PER_PAGE and out.tell() >= target_bytes:
+                    return
+                count += 1
+                yield (text, 'Heading2') if kind == 'heading' else text
+        write_docx(out, filename, paragraphs(), large=large)
+    else:
+        write_xlsx(out, "Report Data", iter_sized_sheet_rows(filename, seed_text, expander, size, out.tell), large=large)
+
+def iter_sized_attachment_chunks(attachment, seed_text, spool_dir, chunk_size=1024 * 1024):
+    """Renders a sized attachment into a spooled temp file and streams it back in chunks (see write_email_file)."""
+    ext = os.path.splitext(attachment['filename'])[1].lower().lstrip('.') or 'bin'
+    with tempfile.SpooledTemporaryFile(max_size=SIZED_ATTACHMENT_SPOOL_MB * 1024 * 1024, dir=spool_dir) as spool:
+        with timed_stage('render_sized', ext):
+            write_sized_attachment(spool, attachment, seed_text)
+        spool.seek(0)
+        while True:
+            chunk = spool.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
 def create_near_duplicate(email_content, variation_type='signature'):
     """Creates near-duplicate by modifying non-substantive content."""
     modified_content = email_content.copy()
     variation_options = ['signature', 'disclaimer', 'formatting']
-    variation_type = random.choice(variation_options)
+    variation_type = rng.choice(variation_options)
     if variation_type == 'signature':
         if "\n\nSent from my iPhone" not in modified_content['body']:
              modified_content['body'] += "\n\nSent from my iPhone"
@@ -594,7 +2495,7 @@ def inject_blast_recipients(email_content, personnel_map):
     STRESS TEST FEATURE:
     Programmatically appends up to 500 email addresses to the recipients list.
     """
-    print("  -> Stress Test Triggered: Injecting 500+ recipients...")
+    log.debug("  -> Stress Test Triggered: Injecting 500+ recipients...")
     # Extract all emails from the personnel map
     all_emails = [p['email'] for p in personnel_map.values() if 'email' in p]
     
@@ -648,7 +2549,7 @@ def get_temperature_for_scenario(scenario_type, is_noise=False, config_temp=None
         return config_temp
 
     # Default behavior (backwards compatible)
-    if is_noise: return random.uniform(0.9, 1.3)
+    if is_noise: return rng.uniform(0.9, 1.3)
     elif scenario_type == 'thread': return 0.85
     elif scenario_type == 'chat': return 0.7  # High temp for chat spontaneity
     else: return 0.95
@@ -686,30 +2587,17 @@ def get_language_instruction(language_code, language_ratio=None):
 
 def generate_llm_response(prompt, system_message, temperature=0.95):
     """Generic function to get a JSON response from the LLM."""
-    print(f"---> Sending prompt to Azure OpenAI Model (temp={temperature:.2f})...")
-    try:
-        def _call_api():
-            return client.chat.completions.create(
-                model=AZURE_MODEL_NAME,
-                messages=[{"role": "system", "content": system_message}, {"role": "user", "content": prompt}],
-                temperature=temperature,
-                response_format={"type": "json_object"}
-            )
-
-        response = call_llm_with_retry(_call_api)
-        return json.loads(response.choices[0].message.content)
-    except Exception as e:
-        print(f"!!! ERROR: Failed to get valid response from LLM. Details: {e}")
-        return None
+    return execute_llm_request(LLMRequest(system_message, prompt, temperature))
 
-def generate_email_content_from_llm(prompt, temperature=0.95, language_code=None, language_ratio=None):
-    """Generates email content from LLM.
+def build_email_request(prompt, temperature=0.95, language_code=None, language_ratio=None, context=''):
+    """Builds the LLM request for a single email.
 
     Args:
         prompt: The user prompt for email generation
         temperature: LLM temperature setting
         language_code: Optional language code (e.g., 'de', 'es', 'zh', 'de-en-mixed')
         language_ratio: Optional ratio for mixed languages (e.g., 0.7 = 70% primary language)
+        context: Company/personnel context block, sent as the stable prompt prefix
     """
     system_message = "You are an AI assistant for generating simulated corporate emails for a fictional story. Return a single, valid JSON object and nothing else. The JSON object must have the keys: 'subject', 'body', 'sender_name', 'sender_email', 'recipients'. 'recipients' must be a list of lists, like [['Recipient Name', 'recipient@email.com']]. You can OPTIONALLY include 'cc_recipients' and 'bcc_recipients' keys, following the same format as 'recipients'. When asked to reply, your 'body' should ONLY contain the new reply content."
 
@@ -718,31 +2606,37 @@ def generate_email_content_from_llm(prompt, temperature=0.95, language_code=None
         language_instruction = get_language_instruction(language_code, language_ratio)
         system_message += language_instruction
 
-    email_data = generate_llm_response(prompt, system_message, temperature)
-    if email_data and all(key in email_data for key in ["subject", "body", "sender_name", "sender_email", "recipients"]):
-        return email_data
-    else:
-        print("!!! ERROR: LLM response for email was missing required keys.")
-        return None
+    return LLMRequest(system_message, prompt, temperature, kind='email', context=context)
+
+def generate_email_content_from_llm(prompt, temperature=0.95, language_code=None, language_ratio=None):
+    """Generates email content from LLM.
+
+    Args:
+        prompt: The user prompt for email generation
+        temperature: LLM temperature setting
+        language_code: Optional language code (e.g., 'de', 'es', 'zh', 'de-en-mixed')
+        language_ratio: Optional ratio for mixed languages (e.g., 0.7 = 70% primary language)
+    """
+    return execute_llm_request(build_email_request(prompt, temperature, language_code, language_ratio))
+
+def build_calendar_request(prompt, temperature=0.9, context=''):
+    """Builds the LLM request for a calendar event."""
+    system_message = "You are an AI assistant for generating simulated corporate calendar events for a fictional story. Return a single, valid JSON object and nothing else. The JSON object must have the keys: 'summary' (the event title), 'description' (event details), 'organizer_name', 'organizer_email', and 'attendees'. 'attendees' must be a list of lists, like [['Attendee Name', 'attendee@email.com']]."
+    return LLMRequest(system_message, prompt, temperature, kind='calendar', context=context)
 
 def generate_calendar_content_from_llm(prompt, temperature=0.9):
     """Generates calendar event content from LLM."""
-    system_message = "You are an AI assistant for generating simulated corporate calendar events for a fictional story. Return a single, valid JSON object and nothing else. The JSON object must have the keys: 'summary' (the event title), 'description' (event details), 'organizer_name', 'organizer_email', and 'attendees'. 'attendees' must be a list of lists, like [['Attendee Name', 'attendee@email.com']]."
-    event_data = generate_llm_response(prompt, system_message, temperature)
-    if event_data and all(key in event_data for key in ["summary", "description", "organizer_name", "organizer_email", "attendees"]):
-        return event_data
-    else:
-        print("!!! ERROR: LLM response for calendar event was missing required keys.")
-        return None
+    return execute_llm_request(build_calendar_request(prompt, temperature))
 
-def generate_chat_content_from_llm(prompt, temperature=0.7, language_code=None, language_ratio=None):
-    """Generates a back-and-forth chat conversation with realistic chat patterns.
+def build_chat_request(prompt, temperature=0.7, language_code=None, language_ratio=None, context=''):
+    """Builds the LLM request for a back-and-forth chat conversation with realistic chat patterns.
 
     Args:
         prompt: The user prompt for chat generation
         temperature: LLM temperature setting
         language_code: Optional language code (e.g., 'de', 'es', 'zh', 'de-en-mixed')
         language_ratio: Optional ratio for mixed languages (e.g., 0.7 = 70% primary language)
+        context: Company/personnel context block, sent as the stable prompt prefix
     """
     system_message = (
         "You are an AI assistant for generating simulated corporate chat logs (Slack/Teams). "
@@ -773,31 +2667,223 @@ def generate_chat_content_from_llm(prompt, temperature=0.7, language_code=None,
         language_instruction = get_language_instruction(language_code, language_ratio)
         system_message += language_instruction
 
-    chat_data = generate_llm_response(prompt, system_message, temperature)
-    if chat_data and 'messages' in chat_data and isinstance(chat_data['messages'], list):
-        return chat_data
-    else:
-        print("!!! ERROR: LLM response for chat was missing required keys.")
-        return None
+    return LLMRequest(system_message, prompt, temperature, kind='chat', context=context)
 
-def add_realistic_email_metadata(msg, scenario_description):
-    """Adds realistic email client headers and importance flags."""
-    msg['X-Mailer'] = random.choice(['Microsoft Outlook 16.0', 'Apple Mail (16.0.3)', 'Mozilla Thunderbird 115.3.1', 'Google Mail'])
-    msg['X-Priority'] = '1 (Highest)' if random.random() < 0.1 else '3 (Normal)'
-    msg['MIME-Version'] = '1.0'
-    hot_keywords = ['confidential', 'privileged', 'fraud', 'urgent', 'legal', 'price-fixing', 'safety']
-    if any(keyword in scenario_description.lower() for keyword in hot_keywords):
-        msg['Importance'] = 'High'
-        if 'legal' in scenario_description.lower() or 'privilege' in scenario_description.lower():
+def generate_chat_content_from_llm(prompt, temperature=0.7, language_code=None, language_ratio=None):
+    """Generates a back-and-forth chat conversation with realistic chat patterns.
+
+    Args:
+        prompt: The user prompt for chat generation
+        temperature: LLM temperature setting
+        language_code: Optional language code (e.g., 'de', 'es', 'zh', 'de-en-mixed')
+        language_ratio: Optional ratio for mixed languages (e.g., 0.7 = 70% primary language)
+    """
+    return execute_llm_request(build_chat_request(prompt, temperature, language_code, language_ratio))
+
+def add_realistic_email_metadata(msg, scenario_description):
+    """Adds realistic email client headers and importance flags."""
+    msg['X-Mailer'] = rng.choice(['Microsoft Outlook 16.0', 'Apple Mail (16.0.3)', 'Mozilla Thunderbird 115.3.1', 'Google Mail'])
+    msg['X-Priority'] = '1 (Highest)' if rng.random() < 0.1 else '3 (Normal)'
+    msg['MIME-Version'] = '1.0'
+    hot_keywords = ['confidential', 'privileged', 'fraud', 'urgent', 'legal', 'price-fixing', 'safety']
+    if any(keyword in scenario_description.lower() for keyword in hot_keywords):
+        msg['Importance'] = 'High'
+        if 'legal' in scenario_description.lower() or 'privilege' in scenario_description.lower():
             msg['Sensitivity'] = 'Private'
 
 # --- File Creation and Saving Logic ---
 
-def create_and_save_email(base_filename, email_content, output_dir, email_date, personnel_map, scenario_description, attachment_config=None, headers=None, stats=None):
-    """Creates an email, saves it, adds attachments, and updates stats."""
+def apply_sender_signature(email_content, personnel_map):
+    """Appends the sender's signature block to the body (60% of the time)."""
     sender_profile = personnel_map.get(email_content.get('sender_email'))
-    if sender_profile and sender_profile.get('signature') and random.random() < 0.6:
+    if sender_profile and sender_profile.get('signature') and rng.random() < 0.6:
         email_content['body'] += f"\n\n-- \n{sender_profile['signature']}"
+
+def plan_email_attachments(attachment_config, scenario_description, email_date):
+    """
+    Makes the random attachment decisions for one email.
+    Returns a list of dicts with 'filename' and 'mime_type', plus 'size_mb' for stress-test
+    log files or 'description' for LLM-written documents ('size' and 'seed' too when they are sized stress documents).
+    """
+    planned = []
+    if not attachment_config:
+        return planned
+
+    # Retrieve the user-configured log size, default to 50MB if not set
+    log_size_mb = attachment_config.get('log_size_mb', 50)
+
+    for att_type in attachment_config.get('types', []):
+        allowed_scenarios = att_type.get('limit_to_scenarios', [])
+        if scenario_description not in allowed_scenarios:
+            continue
+
+        if rng.random() < att_type.get('probability', 1.0):
+            att_filename = rng.choice(att_type['filenames']).format(
+                date=email_date.strftime('%Y-%m-%d'),
+                quarter= (email_date.month - 1) // 3 + 1,
+                version=rng.randint(1, 5)
+            )
+            mime_type = att_type.get('mime_type', 'application/octet-stream')
+            attachment = {'filename': att_filename, 'mime_type': mime_type}
+
+            if mime_type == 'text/x-log':
+                # Check if YAML specifies a fixed size for this specific file type
+                # If yes, use it. If no, fall back to the user's input (log_size_mb)
+                attachment['size_mb'] = att_type.get('fixed_size_mb', log_size_mb)
+            else:
+                attachment['description'] = att_type.get('content_description', f'Content for {att_filename}')
+                if att_type.get('size'):
+                    # Sized stress documents are expanded from the LLM text with their own RNG
+                    attachment['size'] = att_type['size']
+                    attachment['seed'] = rng.getrandbits(63)
+            planned.append(attachment)
+
+    return planned
+
+def build_attachment_requests(planned_attachments, email_content):
+    """Builds LLM requests for every planned attachment that needs generated text (in plan order)."""
+    requests = []
+    for attachment in planned_attachments:
+        if 'description' not in attachment:
+            continue
+        mime_type = attachment['mime_type']
+        file_context = "Word Document"
+        if "spreadsheet" in mime_type: file_context = "Excel Spreadsheet Data"
+        if "pdf" in mime_type: file_context = "PDF Document"
+
+        # Pass email content to ensure attachment aligns with email narrative
+        requests.append(build_attachment_text_request(attachment['filename'], attachment['description'], file_context, email_context=email_content))
+    return requests
+
+def pair_attachment_texts(planned_attachments, texts):
+    """Zips generated texts back onto the plan; log attachments get None."""
+    texts = iter(texts)
+    return [(attachment, next(texts) if 'description' in attachment else None) for attachment in planned_attachments]
+
+def iter_log_attachment_chunks(size_mb, chunk_lines=8192):
+    """
+    Streams the repetitive heartbeat log used for the large-file stress test in ~1 MB chunks,
+    so a 500 MB log never has to exist in memory.
+    """
+    # 1 MB = 1024 * 1024 bytes
+    target_size_bytes = size_mb * 1024 * 1024
+
+    # Create a base string (~100 bytes)
+    base_line = f"[{generation_now().isoformat()}] INFO: System heartbeat check - Status OK - Process ID {rng.randint(1000,9999)} - Memory: {rng.randint(200,800)}MB\n"
+    base_bytes = base_line.encode('utf-8')
+
+    # Calculate how many iterations needed to reach target MB
+    iterations = int(target_size_bytes / len(base_bytes))
+
+    # Every chunk is the same block of whole lines, built once
+    full_chunks, remainder = divmod(iterations, chunk_lines)
+    if full_chunks:
+        block = base_bytes * chunk_lines
+        for _ in range(full_chunks):
+            yield block
+    if remainder:
+        yield base_bytes * remainder
+
+def build_log_attachment_bytes(size_mb):
+    """Builds the whole heartbeat log in memory (small logs only; emails stream it instead)."""
+    return b"".join(iter_log_attachment_chunks(size_mb))
+
+def add_streamed_attachment(msg, filename, maintype='text', subtype='plain'):
+    """
+    Adds a base64 attachment whose body is filled in by write_email_file() while the
+    message is written, instead of being encoded into the message up front.
+    Returns the placeholder that marks the body's position in the serialized message.
+    """
+    msg.add_attachment(b"", maintype=maintype, subtype=subtype, filename=filename)
+    placeholder = f"@@STREAMED-ATTACHMENT-{uuid.uuid4().hex}@@"
+    msg.get_payload()[-1].set_payload(placeholder)
+    return placeholder
+
+def write_base64_chunks(f, chunks):
+    """Base64-encodes a byte stream onto f in 76-character lines, exactly like the email package would."""
+    # 57 input bytes encode to one full 76-character line, so only whole lines are written per chunk
+    carry = b""
+    for chunk in chunks:
+        data = carry + chunk if carry else chunk
+        cut = len(data) - len(data) % 57
+        if cut:
+            f.write(base64.encodebytes(data[:cut]).decode('ascii'))
+        carry = data[cut:]
+    if carry:
+        f.write(base64.encodebytes(carry).decode('ascii'))
+
+def write_email_file(filepath, email_as_string, streamed_parts=None):
+    """
+    Writes a serialized email. streamed_parts maps add_streamed_attachment() placeholders
+    to callables returning that attachment's byte chunks; each is encoded as it is written.
+    """
+    with open(filepath, 'w', encoding='utf-8') as f:
+        remaining = email_as_string
+        for placeholder, make_chunks in (streamed_parts or {}).items():
+            head, remaining = remaining.split(placeholder, 1)
+            f.write(head)
+            write_base64_chunks(f, make_chunks())
+        f.write(remaining)
+
+# MIME subtypes of the rendered attachment types (the maintype is always 'application')
+MIME_SUBTYPES = {PDF_MIME: 'pdf', DOCX_MIME: 'vnd.openxmlformats-officedocument.wordprocessingml.document',
+                 XLSX_MIME: 'vnd.openxmlformats-officedocument.spreadsheetml.sheet'}
+
+def render_attachment(filename, mime_type, content_text):
+    """Renders an LLM-written attachment. Returns (file_data, subtype, ext); file_data is None for unsupported types."""
+    if mime_type == PDF_MIME:
+        return create_fake_pdf_attachment(filename, content_text), MIME_SUBTYPES[mime_type], '.pdf'
+    if mime_type == DOCX_MIME:
+        return create_fake_word_doc(filename, content_text), MIME_SUBTYPES[mime_type], '.docx'
+    if mime_type == XLSX_MIME:
+        return create_fake_excel_sheet(filename, content_text), MIME_SUBTYPES[mime_type], '.xlsx'
+    return None, None, 'unknown'
+
+# 'hardlink' writes each email once and hard-links the other custodian copies to it;
+# 'copy' gives every custodian an independent file (reflink clone where supported)
+CUSTODIAN_COPY_MODE = 'hardlink'
+
+FICLONE = 0x40049409  # Linux ioctl behind `cp --reflink` (Btrfs, XFS, ...)
+
+def clone_file(src, dst):
+    """Copy-on-write clone of src at dst; raises OSError where the filesystem can't reflink."""
+    if fcntl is None:
+        raise OSError("reflink not supported on this platform")
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+
+def place_custodian_copy(src, dst):
+    """
+    Puts an exact duplicate of src at dst without rewriting its bytes when possible:
+    hard link (CUSTODIAN_COPY_MODE 'hardlink'), else reflink clone, else a plain copy.
+    Returns the method used.
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if CUSTODIAN_COPY_MODE == 'hardlink':
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass  # e.g. cross-device, FAT/exFAT or SMB shares
+    try:
+        clone_file(src, dst)
+        return 'reflink'
+    except OSError:
+        pass
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+def create_and_save_email(base_filename, email_content, output_dir, email_date, personnel_map, scenario_description, attachment_config=None, headers=None, stats=None, prepared_attachments=None, apply_signature=True):
+    """
+    Creates an email, saves it, adds attachments, and updates stats.
+
+    prepared_attachments: Optional list of (planned attachment, text) pairs whose text was already
+        generated by the caller. When omitted, attachments are planned and generated here.
+    apply_signature: Set False when the caller already ran apply_sender_signature().
+    """
+    if apply_signature:
+        apply_sender_signature(email_content, personnel_map)
     
     msg = EmailMessage()
     msg['Subject'] = email_content.get('subject', 'No Subject')
@@ -818,100 +2904,56 @@ def create_and_save_email(base_filename, email_content, output_dir, email_date,
     if stats:
         stats['emails'] += 1
         # Track date for date range calculation
-        stats['email_dates'].append(email_date)
+        record_item_date(stats, email_date)
         # Track custodian (sender email)
         stats['custodians'].add(email_content.get('sender_email'))
 
     # --- Attachment Logic ---
-    if attachment_config:
-        # Retrieve the user-configured log size, default to 50MB if not set
-        log_size_mb = attachment_config.get('log_size_mb', 50)
-        
-        for att_type in attachment_config.get('types', []):
-            allowed_scenarios = att_type.get('limit_to_scenarios', [])
-            if scenario_description not in allowed_scenarios:
-                continue
-            
-            if random.random() < att_type.get('probability', 1.0):
-                att_filename = random.choice(att_type['filenames']).format(
-                    date=email_date.strftime('%Y-%m-%d'),
-                    quarter= (email_date.month - 1) // 3 + 1,
-                    version=random.randint(1, 5)
-                )
-                
-                mime_type = att_type.get('mime_type', 'application/octet-stream')
-                
-                # --- STRESS TEST: LARGE LOG FILE GENERATION ---
-                if mime_type == 'text/x-log':
-                    # Check if YAML specifies a fixed size for this specific file type
-                    # If yes, use it. If no, fall back to the user's input (log_size_mb)
-                    current_file_size_mb = att_type.get('fixed_size_mb', log_size_mb)
-                    
-                    print(f"  -> Generating LOG file: {att_filename} ({current_file_size_mb} MB)...")
-                    
-                    # 1 MB = 1024 * 1024 bytes
-                    target_size_bytes = current_file_size_mb * 1024 * 1024
-                    
-                    # Create a base string (~100 bytes)
-                    base_line = f"[{datetime.now().isoformat()}] INFO: System heartbeat check - Status OK - Process ID {random.randint(1000,9999)} - Memory: {random.randint(200,800)}MB\n"
-                    base_bytes = base_line.encode('utf-8')
-                    
-                    # Calculate how many iterations needed to reach target MB
-                    iterations = int(target_size_bytes / len(base_bytes))
-                    
-                    # Generate content in one mathematical operation (fast)
-                    full_content = base_bytes * iterations
-                    
-                    msg.add_attachment(full_content, maintype='text', subtype='plain', filename=att_filename)
-                    if stats:
-                        stats['attachments'] += 1
-                        stats['attachment_types']['.log'] = stats['attachment_types'].get('.log', 0) + 1
-                    
-                    continue # Skip LLM generation and standard processing
-                # ---------------------------------------------
-
-                short_desc = att_type.get('content_description', f'Content for {att_filename}')
-
-                # Generate realistic content with email context for alignment
-                file_context = "Word Document"
-                if "spreadsheet" in mime_type: file_context = "Excel Spreadsheet Data"
-                if "pdf" in mime_type: file_context = "PDF Document"
-
-                # Pass email content to ensure attachment aligns with email narrative
-                full_content_text = generate_attachment_text_from_llm(
-                    att_filename,
-                    short_desc,
-                    file_context,
-                    email_context=email_content  # NEW: Pass email context for alignment
-                )
-                
-                file_data = None
-                subtype = None
-                ext = 'unknown'
-
-                if mime_type == 'application/pdf':
-                    print(f"  -> Attaching file: {att_filename}")
-                    file_data = create_fake_pdf_attachment(att_filename, full_content_text)
-                    subtype = 'pdf'
-                    ext = '.pdf'
-                
-                elif mime_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
-                    print(f"  -> Attaching file: {att_filename}")
-                    file_data = create_fake_word_doc(att_filename, full_content_text)
-                    subtype = 'vnd.openxmlformats-officedocument.wordprocessingml.document'
-                    ext = '.docx'
-                
-                elif mime_type == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet':
-                    print(f"  -> Attaching file: {att_filename}")
-                    file_data = create_fake_excel_sheet(att_filename, full_content_text)
-                    subtype = 'vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                    ext = '.xlsx'
-
-                if file_data:
-                    msg.add_attachment(file_data, maintype='application', subtype=subtype, filename=att_filename)
-                    if stats:
-                        stats['attachments'] += 1
-                        stats['attachment_types'][ext] = stats['attachment_types'].get(ext, 0) + 1
+    if prepared_attachments is None and attachment_config:
+        planned = plan_email_attachments(attachment_config, scenario_description, email_date)
+        texts = [execute_llm_request(request) for request in build_attachment_requests(planned, email_content)]
+        prepared_attachments = pair_attachment_texts(planned, texts)
+
+    streamed_parts = {}
+    for attachment, content_text in prepared_attachments or []:
+        att_filename = attachment['filename']
+
+        # --- STRESS TEST: LARGE LOG FILE GENERATION ---
+        if attachment['mime_type'] == 'text/x-log':
+            log.debug(f"  -> Generating LOG file: {att_filename} ({attachment['size_mb']} MB)...")
+            # The log body is streamed into the file at write time so memory stays bounded
+            placeholder = add_streamed_attachment(msg, att_filename)
+            streamed_parts[placeholder] = functools.partial(iter_log_attachment_chunks, attachment['size_mb'])
+            if stats:
+                stats['attachments'] += 1
+                stats['attachment_types']['.log'] = stats['attachment_types'].get('.log', 0) + 1
+            continue
+        # ---------------------------------------------
+
+        # --- STRESS TEST: SIZED PDF/DOCX/XLSX, expanded from the LLM text while the email is written ---
+        if attachment.get('size'):
+            ext = os.path.splitext(att_filename)[1].lower()
+            log.debug(f"  -> Generating sized document: {att_filename} ({attachment['size']})...")
+            placeholder = add_streamed_attachment(msg, att_filename, 'application', MIME_SUBTYPES.get(attachment['mime_type'], 'octet-stream'))
+            streamed_parts[placeholder] = functools.partial(iter_sized_attachment_chunks, attachment, content_text or attachment['description'], output_dir)
+            if stats:
+                stats['attachments'] += 1
+                stats['attachment_types'][ext] = stats['attachment_types'].get(ext, 0) + 1
+            continue
+
+        # Attachments from email_output_steps() arrive already rendered
+        rendered = attachment.get('rendered')
+        if not rendered:
+            start = time.perf_counter()
+            rendered = render_attachment(att_filename, attachment['mime_type'], content_text)
+            record_stage('render', rendered[2].lstrip('.'), time.perf_counter() - start)
+        file_data, subtype, ext = rendered
+        if file_data:
+            log.debug(f"  -> Attaching file: {att_filename}")
+            msg.add_attachment(file_data, maintype='application', subtype=subtype, filename=att_filename)
+            if stats:
+                stats['attachments'] += 1
+                stats['attachment_types'][ext] = stats['attachment_types'].get(ext, 0) + 1
     
     # Exact Duplicate (Custodian Folder) Logic
     all_custodians = []
@@ -944,16 +2986,27 @@ def create_and_save_email(base_filename, email_content, output_dir, email_date,
                 if email and isinstance(email, str) and '@' in email:
                     all_custodians.append(email)
 
-    email_as_string = str(msg)
-
-    # Create folders only for valid, unique email addresses
-    for email_address in set(all_custodians):
-        custodian_folder_name = email_address.split('@')[0]
-        custodian_path = os.path.join(output_dir, custodian_folder_name)
-        os.makedirs(custodian_path, exist_ok=True)
-        filepath = os.path.join(custodian_path, f"{base_filename}.eml")
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(email_as_string)
+    if msg.is_multipart():
+        # Same shape as the email package's random boundary, but drawn from the job RNG
+        msg.set_boundary(f"{'=' * 15}{rng.randrange(2**63 - 1):019d}==")
+    with timed_stage('mime', 'email'):
+        email_as_string = str(msg)
+
+    # Create folders only for valid, unique email addresses. The message is written once;
+    # every other custodian gets an exact duplicate via hard link / reflink / copy
+    first_filepath = None
+    with timed_stage('write', 'email'):
+        for email_address in set(all_custodians):
+            custodian_folder_name = email_address.split('@')[0]
+            custodian_path = os.path.join(output_dir, custodian_folder_name)
+            os.makedirs(custodian_path, exist_ok=True)
+            filepath = os.path.join(custodian_path, f"{base_filename}.eml")
+            if first_filepath:
+                place_custodian_copy(first_filepath, filepath)
+            else:
+                write_email_file(filepath, email_as_string, streamed_parts)
+                first_filepath = filepath
+            record_output_file(stats, filepath)
                 
     return msg.get('Message-ID')
 
@@ -961,18 +3014,20 @@ def create_and_save_calendar_event(filename, event_content, output_dir, event_da
     """Creates and saves a calendar event as an .ics file."""
     if not os.path.exists(output_dir): os.makedirs(output_dir)
     if not filename.endswith('.ics'): filename = f"{filename}.ics"
-    dtstamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    dtstamp = generation_now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
     dtstart = event_date.strftime("%Y%m%dT%H%M%SZ")
     dtend = (event_date + timedelta(hours=1)).strftime("%Y%m%dT%H%M%SZ")
     attendee_lines = [f"ATTENDEE;CN={name};ROLE=REQ-PARTICIPANT:mailto:{email}" for name, email in event_content.get('attendees', [])]
-    ics_content = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//MySyntheticDataGenerator//EN", "BEGIN:VEVENT", f"UID:{uuid.uuid4()}@mygenerator.com", f"DTSTAMP:{dtstamp}", f"ORGANIZER;CN={event_content.get('organizer_name', 'Unknown')}:mailto:{event_content.get('organizer_email', 'unknown@organizer.com')}", *attendee_lines, f"DTSTART:{dtstart}", f"DTEND:{dtend}", f"SUMMARY:{event_content.get('summary', 'No Summary')}", f"DESCRIPTION:{event_content.get('description', '').replace(chr(10), chr(92)+'n')}", "END:VEVENT", "END:VCALENDAR"]
+    ics_content = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//MySyntheticDataGenerator//EN", "BEGIN:VEVENT", f"UID:{new_uuid()}@mygenerator.com", f"DTSTAMP:{dtstamp}", f"ORGANIZER;CN={event_content.get('organizer_name', 'Unknown')}:mailto:{event_content.get('organizer_email', 'unknown@organizer.com')}", *attendee_lines, f"DTSTART:{dtstart}", f"DTEND:{dtend}", f"SUMMARY:{event_content.get('summary', 'No Summary')}", f"DESCRIPTION:{event_content.get('description', '').replace(chr(10), chr(92)+'n')}", "END:VEVENT", "END:VCALENDAR"]
     full_path = os.path.join(output_dir, filename)
-    with open(full_path, 'w', encoding='utf-8') as f: f.write("\n".join(ics_content))
+    with timed_stage('write', 'calendar'):
+        with open(full_path, 'w', encoding='utf-8') as f: f.write("\n".join(ics_content))
+    record_output_file(stats, full_path)
     
     if stats:
         stats['calendar_events'] += 1
         # Track date for date range calculation
-        stats['email_dates'].append(event_date)
+        record_item_date(stats, event_date)
         # Track custodian (organizer email)
         stats['custodians'].add(event_content.get('organizer_email'))
 
@@ -980,34 +3035,18 @@ def create_and_save_calendar_event(filename, event_content, output_dir, event_da
 
 def get_deterministic_id(key, prefix="U"):
     """Generates a consistent 9-char ID based on an email or name string."""
-    seed = sum(ord(c) for c in key)
-    random.seed(seed)
-    suffix = ''.join(random.choices('0123456789ABCDEF', k=8))
-    random.seed() 
+    suffix = hashlib.sha256(key.encode('utf-8')).hexdigest()[:8].upper()
     return f"{prefix}{suffix}"
 
-def create_and_save_slack_native(base_filename, chat_content, output_dir, start_date, personnel_map, stats=None):
-    """
-    Creates a Native Slack Export folder structure with modern Block Kit formatting.
-    Structure: /slack_export/users.json, channels.json, /channel/YYYY-MM-DD.json
-    """
-    slack_root = os.path.join(output_dir, "slack_export")
-    os.makedirs(slack_root, exist_ok=True)
-
-    # Generate a consistent Team ID
-    random.seed(output_dir)
-    team_suffix = ''.join(random.choices('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ', k=10))
-    team_id = f"T{team_suffix}"
-    random.seed() # Reset seed
-
-    # 1. Generate users.json
+def build_slack_users(personnel_map, team_id, start_date):
+    """Builds users.json entries for every person in the roster."""
     users_list = []
     for email, profile in personnel_map.items():
         user_id = get_deterministic_id(email, "U")
         first_name = profile['name'].split()[0]
         real_name = profile['name']
         display_name = first_name.lower()
-        avatar_hash = "".join(random.choices('0123456789abcdef', k=12))
+        avatar_hash = hashlib.md5(email.encode('utf-8')).hexdigest()[:12]
         
         users_list.append({
             "id": user_id, "team_id": team_id, "name": email.split('@')[0], "deleted": False, "color": "9f69e7", "real_name": real_name, "tz": "America/Los_Angeles", "tz_label": "Pacific Daylight Time", "tz_offset": -25200,
@@ -1016,43 +3055,10 @@ def create_and_save_slack_native(base_filename, chat_content, output_dir, start_
             },
             "is_admin": False, "is_owner": False, "is_primary_owner": False, "is_restricted": False, "is_ultra_restricted": False, "is_bot": False, "is_app_user": False, "updated": int(start_date.timestamp()), "is_email_confirmed": True
         })
-    
-    # Merge logic for users.json
-    users_file_path = os.path.join(slack_root, "users.json")
-    if os.path.exists(users_file_path):
-        try:
-            with open(users_file_path, 'r', encoding='utf-8') as f:
-                existing_users = json.load(f)
-                existing_ids = {u['id'] for u in existing_users}
-                for new_user in users_list:
-                    if new_user['id'] not in existing_ids: existing_users.append(new_user)
-                users_list = existing_users
-        except: pass
-
-    with open(users_file_path, 'w', encoding='utf-8') as f: json.dump(users_list, f, indent=4)
-
-    # 2. Determine Channel
-    channel_name = re.sub(r'[^a-z0-9-_]', '', base_filename.lower().replace(' ', '-'))[:21]
-    channel_id = get_deterministic_id(channel_name, "C")
-    
-    # Update channels.json
-    channels_file = os.path.join(slack_root, "channels.json")
-    channels_list = []
-    if os.path.exists(channels_file):
-        try:
-            with open(channels_file, 'r') as f: channels_list = json.load(f)
-        except: pass
-    
-    if not any(c['id'] == channel_id for c in channels_list):
-        creator_id = users_list[0]['id'] if users_list else "U00000000"
-        channels_list.append({
-            "id": channel_id, "name": channel_name, "is_channel": True, "created": int(start_date.timestamp()), "is_archived": False, "is_general": False, "unlinked": 0, "creator": creator_id, "is_shared": False, "is_org_shared": False, "is_member": True, "is_private": False, "is_mpim": False, "members": [u['id'] for u in users_list],
-            "topic": {"value": f"Topic for {channel_name}", "creator": creator_id, "last_set": int(start_date.timestamp())},
-            "purpose": {"value": f"Purpose of {channel_name}", "creator": creator_id, "last_set": int(start_date.timestamp())}
-        })
-        with open(channels_file, 'w', encoding='utf-8') as f: json.dump(channels_list, f, indent=4)
+    return users_list
 
-    # 3. Create Messages with Enhanced Realism
+def build_slack_messages(chat_content, team_id, user_ids, start_date):
+    """Converts LLM chat messages into Slack export messages with modern Block Kit formatting."""
     messages = []
     current_time = start_date
     message_timestamps = {}  # Track timestamps for threading
@@ -1061,11 +3067,11 @@ def create_and_save_slack_native(base_filename, chat_content, output_dir, start_
         # Realistic chat timing: rapid-fire (5-30 sec) or thoughtful pauses (1-5 min)
         msg_length = len(msg.get('body', ''))
         if msg_length < 30:  # Short messages = rapid fire
-            current_time += timedelta(seconds=random.randint(5, 30))
+            current_time += timedelta(seconds=rng.randint(5, 30))
         elif msg_length < 100:  # Medium messages
-            current_time += timedelta(seconds=random.randint(20, 120))
+            current_time += timedelta(seconds=rng.randint(20, 120))
         else:  # Longer messages = more thinking time
-            current_time += timedelta(seconds=random.randint(60, 300))
+            current_time += timedelta(seconds=rng.randint(60, 300))
 
         ts_val = f"{current_time.timestamp():.6f}"
         sender_email = msg.get('sender_email', 'unknown@chat.com')
@@ -1073,12 +3079,12 @@ def create_and_save_slack_native(base_filename, chat_content, output_dir, start_
         real_name = msg.get('sender_name', 'Unknown User')
         first_name = real_name.split()[0]
         msg_text = msg.get('body', '')
-        client_msg_id = str(uuid.uuid4())
+        client_msg_id = str(new_uuid())
 
         user_profile_data = {
-            "avatar_hash": "".join(random.choices('0123456789abcdef', k=12)), "image_72": "https://secure.gravatar.com/avatar/example.jpg?s=72", "first_name": first_name, "real_name": real_name, "display_name": first_name.lower(), "team": team_id, "name": sender_email.split('@')[0], "is_restricted": False, "is_ultra_restricted": False
+            "avatar_hash": hashlib.md5(sender_email.encode('utf-8')).hexdigest()[:12], "image_72": "https://secure.gravatar.com/avatar/example.jpg?s=72", "first_name": first_name, "real_name": real_name, "display_name": first_name.lower(), "team": team_id, "name": sender_email.split('@')[0], "is_restricted": False, "is_ultra_restricted": False
         }
-        blocks = [{"type": "rich_text", "block_id": "".join(random.choices('0123456789abcdefghijklmnopqrstuvwxyz', k=5)), "elements": [{"type": "rich_text_section", "elements": [{"type": "text", "text": msg_text}]}]}]
+        blocks = [{"type": "rich_text", "block_id": "".join(rng.choices('0123456789abcdefghijklmnopqrstuvwxyz', k=5)), "elements": [{"type": "rich_text_section", "elements": [{"type": "text", "text": msg_text}]}]}]
 
         slack_msg = {
             "client_msg_id": client_msg_id, "type": "message", "text": msg_text, "user": user_id, "ts": ts_val, "team": team_id, "user_team": team_id, "source_team": team_id, "user_profile": user_profile_data, "blocks": blocks
@@ -1095,14 +3101,14 @@ def create_and_save_slack_native(base_filename, chat_content, output_dir, start_
         message_timestamps[f"{idx}_user"] = user_id
 
         # Add reactions (30% chance for short confirmations, 15% for other messages)
-        if random.random() < (0.3 if msg_length < 20 else 0.15):
-            reaction_emoji = random.choice([
+        if rng.random() < (0.3 if msg_length < 20 else 0.15):
+            reaction_emoji = rng.choice([
                 'thumbsup', '+1', 'white_check_mark', 'ok_hand', 'fire',
                 'eyes', 'point_up', 'raised_hands', 'slightly_smiling_face', 'sweat_smile'
             ])
             # Pick 1-3 random users to react
-            num_reactors = random.randint(1, min(3, len(users_list)))
-            reactors = random.sample([u['id'] for u in users_list], num_reactors)
+            num_reactors = rng.randint(1, min(3, len(user_ids)))
+            reactors = rng.sample(user_ids, num_reactors)
             slack_msg["reactions"] = [{
                 "name": reaction_emoji,
                 "users": reactors,
@@ -1110,8 +3116,8 @@ def create_and_save_slack_native(base_filename, chat_content, output_dir, start_
             }]
 
         # Add edit history (10% chance for messages over 50 chars)
-        if random.random() < 0.1 and msg_length > 50:
-            edit_time = current_time + timedelta(seconds=random.randint(30, 300))
+        if rng.random() < 0.1 and msg_length > 50:
+            edit_time = current_time + timedelta(seconds=rng.randint(30, 300))
             slack_msg["edited"] = {
                 "user": user_id,
                 "ts": f"{edit_time.timestamp():.6f}"
@@ -1125,39 +3131,229 @@ def create_and_save_slack_native(base_filename, chat_content, output_dir, start_
 
         messages.append(slack_msg)
 
-    # 4. Save Daily Log
-    channel_dir = os.path.join(slack_root, channel_name)
-    os.makedirs(channel_dir, exist_ok=True)
-    date_filename = start_date.strftime("%Y-%m-%d.json")
-    final_path = os.path.join(channel_dir, date_filename)
-    
-    existing_msgs = []
-    if os.path.exists(final_path):
+    return messages
+
+class SlackExportAggregator:
+    """
+    In-memory Slack export for one output directory, written by a single flush().
+
+    Workers only call add_chat(), which appends to per-channel-day message lists under a
+    lock; users.json, channels.json and the YYYY-MM-DD.json files are written by flush()
+    (periodically and at the end of the run), so there are no read-modify-write races and
+    no re-reading and re-sorting of a whole channel-day per chat.
+
+    merge_existing: Load any export already on disk (users, channels and each channel-day
+        the first time it is touched) and add to it. Otherwise an existing export is removed
+        on the first flush, so no channel-days of an earlier run are left behind.
+    team_key: Directory the Team ID is derived from (defaults to output_dir; shards pass the
+        directory they are merged into).
+    per_job: Hold each job's chats (keyed by their job id) until the job completes. Journaled
+        runs take them with pop_job() for the job's 'complete' record and only then hand them to
+        commit_chats(), so the export on disk only ever has messages of completed jobs (a resumed
+        run never duplicates them) and restore_chats() can re-add any a crash kept from a flush.
+    """
+
+    def __init__(self, output_dir, merge_existing=False, flush_interval=30.0, team_key=None, per_job=False):
+        self.slack_root = os.path.join(output_dir, "slack_export")
+        self.merge_existing = merge_existing
+        self.per_job = per_job
+        self._replace_existing = not merge_existing
+        self.flush_interval = flush_interval
+        # Consistent Team ID per output directory
+        team_suffix = ''.join(random.Random(team_key or output_dir).choices('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ', k=10))
+        self.team_id = f"T{team_suffix}"
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.users = {}      # user id -> users.json entry
+        self.channels = {}   # channel id -> channels.json entry
+        self.days = {}       # (channel_name, 'YYYY-MM-DD.json') -> messages
+        self._dirty_days = set()
+        self._dirty_index = False
+        self.pending = {}    # job id -> chats of jobs not yet complete (per_job)
+        self._rosters_seen = {}  # id() -> personnel maps already added to users (kept alive so ids stay unique)
+        if merge_existing:
+            self.users = {u['id']: u for u in self._load_json(os.path.join(self.slack_root, "users.json"))}
+            self.channels = {c['id']: c for c in self._load_json(os.path.join(self.slack_root, "channels.json"))}
+
+    @staticmethod
+    def _load_json(path):
+        if not os.path.exists(path):
+            return []
         try:
-            with open(final_path, 'r', encoding='utf-8') as f: existing_msgs = json.load(f)
-        except: pass
-    
-    existing_msgs.extend(messages)
-    existing_msgs.sort(key=lambda x: float(x['ts']))
+            with open(path, 'r', encoding='utf-8') as f: return json.load(f)
+        except (OSError, ValueError): return []
+
+    def _open_channel_day(self, channel_name, start_date, personnel_map, new_users):
+        """Registers a chat's users and channel and loads its channel-day; returns (day_key, user_ids). Call with the lock held."""
+        self._rosters_seen[id(personnel_map)] = personnel_map
+        for user in new_users:
+            if user['id'] not in self.users:
+                self.users[user['id']] = user
+                self._dirty_index = True
+        user_ids = list(self.users)
+
+        channel_id = get_deterministic_id(channel_name, "C")
+        if channel_id not in self.channels:
+            creator_id = user_ids[0] if user_ids else "U00000000"
+            self.channels[channel_id] = {
+                "id": channel_id, "name": channel_name, "is_channel": True, "created": int(start_date.timestamp()), "is_archived": False, "is_general": False, "unlinked": 0, "creator": creator_id, "is_shared": False, "is_org_shared": False, "is_member": True, "is_private": False, "is_mpim": False, "members": user_ids,
+                "topic": {"value": f"Topic for {channel_name}", "creator": creator_id, "last_set": int(start_date.timestamp())},
+                "purpose": {"value": f"Purpose of {channel_name}", "creator": creator_id, "last_set": int(start_date.timestamp())}
+            }
+            self._dirty_index = True
+
+        day_key = (channel_name, start_date.strftime("%Y-%m-%d.json"))
+        if day_key not in self.days:
+            existing = self._load_json(os.path.join(self.slack_root, *day_key)) if self.merge_existing else []
+            self.days[day_key] = existing
+        return day_key, user_ids
+
+    def _new_users(self, personnel_map, start_date):
+        # Every chat of a run shares one roster, so users are only built the first time
+        return build_slack_users(personnel_map, self.team_id, start_date) if id(personnel_map) not in self._rosters_seen else []
+
+    def add_chat(self, base_filename, chat_content, start_date, personnel_map):
+        """Buffers one chat (held under its job id, base_filename, when per_job); returns (channel_name, date_filename)."""
+        new_users = self._new_users(personnel_map, start_date)
+        channel_name = re.sub(r'[^a-z0-9-_]', '', base_filename.lower().replace(' ', '-'))[:21]
+        with self._lock:
+            day_key, user_ids = self._open_channel_day(channel_name, start_date, personnel_map, new_users)
+
+        messages = build_slack_messages(chat_content, self.team_id, user_ids, start_date)
+        chat = {'channel': channel_name, 'date': day_key[1], 'start': start_date.isoformat(), 'messages': messages}
+        if self.per_job:
+            with self._lock:
+                self.pending.setdefault(base_filename, []).append(chat)
+        else:
+            self.commit_chats([chat])
+        return day_key
+
+    def pop_job(self, job_id):
+        """Takes a job's held chats (per_job); returns them for the journal and commit_chats()."""
+        with self._lock:
+            return self.pending.pop(job_id, [])
+
+    def commit_chats(self, chats):
+        """Adds chats to their channel-days for the next flush."""
+        with self._lock:
+            for chat in chats:
+                day_key = (chat['channel'], chat['date'])
+                self.days[day_key].extend(chat['messages'])
+                self._dirty_days.add(day_key)
+
+    def restore_chats(self, chats, personnel_map):
+        """Re-adds journaled chats whose messages are missing from the export; returns the number of messages restored."""
+        restored = 0
+        for chat in chats:
+            start_date = datetime.fromisoformat(chat['start'])
+            new_users = self._new_users(personnel_map, start_date)
+            with self._lock:
+                day_key, _ = self._open_channel_day(chat['channel'], start_date, personnel_map, new_users)
+                present = {(message['ts'], message.get('user')) for message in self.days[day_key]}
+                missing = [message for message in chat['messages'] if (message['ts'], message.get('user')) not in present]
+                if missing:
+                    self.days[day_key].extend(missing)
+                    self._dirty_days.add(day_key)
+                    restored += len(missing)
+        return restored
+
+    def maybe_flush(self, before_flush=None):
+        """Flushes if flush_interval seconds have passed since the last flush, calling before_flush() first."""
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            if before_flush:
+                before_flush()
+            self.flush()
+
+    def flush(self):
+        """Writes users.json, channels.json and every channel-day changed since the last flush."""
+        with self._flush_lock:
+            with self._lock:
+                users = list(self.users.values()) if self._dirty_index else None
+                channels = list(self.channels.values()) if self._dirty_index else None
+                days = {key: list(self.days[key]) for key in self._dirty_days}
+                self._dirty_index = False
+                self._dirty_days = set()
+                self._last_flush = time.monotonic()
+
+            if users is None and not days:
+                return
+            if self._replace_existing:
+                # Channel-days of an earlier run would refer to users and channels this one doesn't have
+                shutil.rmtree(self.slack_root, ignore_errors=True)
+                self._replace_existing = False
+            os.makedirs(self.slack_root, exist_ok=True)
+            if users is not None:
+                with open(os.path.join(self.slack_root, "users.json"), 'w', encoding='utf-8') as f: json.dump(users, f, indent=4)
+                with open(os.path.join(self.slack_root, "channels.json"), 'w', encoding='utf-8') as f: json.dump(channels, f, indent=4)
+            for (channel_name, date_filename), messages in days.items():
+                channel_dir = os.path.join(self.slack_root, channel_name)
+                os.makedirs(channel_dir, exist_ok=True)
+                messages.sort(key=lambda x: float(x['ts']))
+                with open(os.path.join(channel_dir, date_filename), 'w', encoding='utf-8') as f: json.dump(messages, f, indent=4)
+
+# Open Slack exports by absolute output directory
+slack_exports = {}
+slack_exports_lock = threading.Lock()
+
+def open_slack_export(output_dir, merge_existing=False, team_key=None, per_job=False):
+    """Starts the run's Slack export for output_dir (see SlackExportAggregator)."""
+    slack_root = os.path.join(output_dir, "slack_export")
+    if not merge_existing and os.path.exists(slack_root):
+        print(f"Warning: Existing Slack export in '{slack_root}' will be deleted and replaced; use --slack-merge-existing to add to it instead.")
+    with slack_exports_lock:
+        aggregator = SlackExportAggregator(output_dir, merge_existing, team_key=team_key, per_job=per_job)
+        slack_exports[os.path.abspath(output_dir)] = aggregator
+        return aggregator
+
+def get_slack_export(output_dir):
+    """The open Slack export for output_dir; opened in merge mode if nobody opened it yet."""
+    with slack_exports_lock:
+        aggregator = slack_exports.get(os.path.abspath(output_dir))
+    return aggregator or open_slack_export(output_dir, merge_existing=True)
+
+def close_slack_export(output_dir):
+    """Flushes and forgets the Slack export for output_dir; messages of jobs that never completed are dropped."""
+    with slack_exports_lock:
+        aggregator = slack_exports.pop(os.path.abspath(output_dir), None)
+    if aggregator:
+        aggregator.flush()
+
+def restore_slack_messages(aggregator, output_dir, personnel_map):
+    """
+    Re-adds the Slack messages recorded in output_dir's journal that are missing from the
+    export (a crash between a job's 'complete' record and the next flush). Returns the count.
+    """
+    restored = 0
+    for record in RunJournal.load(output_dir):
+        if record['type'] == 'complete' and record.get('slack'):
+            restored += aggregator.restore_chats(record['slack'], personnel_map)
+    return restored
 
-    with open(final_path, 'w', encoding='utf-8') as f: json.dump(existing_msgs, f, indent=4)
+def create_and_save_slack_native(base_filename, chat_content, output_dir, start_date, personnel_map, stats=None):
+    """
+    Adds a chat to the Native Slack Export for output_dir (modern Block Kit formatting).
+    Structure: /slack_export/users.json, channels.json, /channel/YYYY-MM-DD.json
+    Files are written when the export is flushed (close_slack_export()).
+    """
+    channel_name, date_filename = get_slack_export(output_dir).add_chat(base_filename, chat_content, start_date, personnel_map)
         
     if stats:
         stats['scenarios_triggered'][f"Slack: {channel_name}"] = stats['scenarios_triggered'].get(f"Slack: {channel_name}", 0) + 1
         stats['rsmf_chats'] = stats.get('rsmf_chats', 0) + 1
         # Track date for date range calculation
-        stats['email_dates'].append(start_date)
+        record_item_date(stats, start_date)
         # Track custodians (participants in chat)
         for msg in chat_content.get('messages', []):
             stats['custodians'].add(msg.get('sender_email'))
 
-    print(f"  -> Created Native Slack Export: {channel_name}/{date_filename} (Modern Format)")
+    log.debug(f"  -> Created Native Slack Export: {channel_name}/{date_filename} (Modern Format)")
 
 def create_and_save_rsmf(base_filename, chat_content, output_dir, start_date, personnel_map, stats=None):
     """Creates a Relativity Short Message Format (RSMF) file."""
     if not os.path.exists(output_dir): os.makedirs(output_dir)
     
-    conversation_id = str(uuid.uuid4())
+    conversation_id = str(new_uuid())
     participants = []
     events = []
     participant_map = {}
@@ -1178,32 +3374,32 @@ def create_and_save_rsmf(base_filename, chat_content, output_dir, start_date, pe
         # Realistic chat timing based on message length
         msg_length = len(msg.get('body', ''))
         if msg_length < 30:
-            current_time += timedelta(seconds=random.randint(5, 30))
+            current_time += timedelta(seconds=rng.randint(5, 30))
         elif msg_length < 100:
-            current_time += timedelta(seconds=random.randint(20, 120))
+            current_time += timedelta(seconds=rng.randint(20, 120))
         else:
-            current_time += timedelta(seconds=random.randint(60, 300))
+            current_time += timedelta(seconds=rng.randint(60, 300))
 
         iso_timestamp = current_time.strftime("%Y-%m-%dT%H:%M:%S%z")
         if not iso_timestamp.endswith('Z') and '+' not in iso_timestamp and '-' not in iso_timestamp: iso_timestamp += "Z"
 
         event = {
-            "type": "message", "id": str(uuid.uuid4()), "participant": participant_map.get(msg.get('sender_email')), "body": msg.get('body'), "timestamp": iso_timestamp, "conversation": conversation_id
+            "type": "message", "id": str(new_uuid()), "participant": participant_map.get(msg.get('sender_email')), "body": msg.get('body'), "timestamp": iso_timestamp, "conversation": conversation_id
         }
 
         # Add reactions for Teams (similar to Slack)
-        if random.random() < (0.3 if msg_length < 20 else 0.15):
-            reaction_type = random.choice(['like', 'heart', 'laugh', 'surprised', 'sad'])
-            num_reactors = random.randint(1, min(3, len(participants)))
-            reactors = random.sample([p['id'] for p in participants], num_reactors)
+        if rng.random() < (0.3 if msg_length < 20 else 0.15):
+            reaction_type = rng.choice(['like', 'heart', 'laugh', 'surprised', 'sad'])
+            num_reactors = rng.randint(1, min(3, len(participants)))
+            reactors = rng.sample([p['id'] for p in participants], num_reactors)
             event["reactions"] = [{
                 "type": reaction_type,
                 "users": reactors
             }]
 
         # Add edited flag (10% chance for longer messages)
-        if random.random() < 0.1 and msg_length > 50:
-            edit_time = current_time + timedelta(seconds=random.randint(30, 300))
+        if rng.random() < 0.1 and msg_length > 50:
+            edit_time = current_time + timedelta(seconds=rng.randint(30, 300))
             event["editedTimestamp"] = edit_time.strftime("%Y-%m-%dT%H:%M:%S%z")
 
         events.append(event)
@@ -1224,19 +3420,20 @@ def create_and_save_rsmf(base_filename, chat_content, output_dir, start_date, pe
 
     try:
         with zipfile.ZipFile(full_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr('rsmf_manifest.json', json.dumps(manifest, indent=4))
+            zf.writestr(office_zip_info('rsmf_manifest.json', generation_now()), json.dumps(manifest, indent=4))
+        record_output_file(stats, full_path)
         
         if stats:
             stats['rsmf_chats'] = stats.get('rsmf_chats', 0) + 1
             # Track date for date range calculation
-            stats['email_dates'].append(start_date)
+            record_item_date(stats, start_date)
             # Track custodians (participants in chat)
             for participant in participants:
                 stats['custodians'].add(participant.get('email'))
 
-        print(f"  -> Created RSMF Chat log: {rsmf_filename}")
+        log.debug(f"  -> Created RSMF Chat log: {rsmf_filename}")
     except Exception as e:
-        print(f"!!! Error creating RSMF file: {e}")
+        log.error(f"!!! Error creating RSMF file: {e}")
 
 def create_and_save_webex_native(base_filename, chat_content, output_dir, start_date, personnel_map, stats=None):
     """
@@ -1269,11 +3466,11 @@ def create_and_save_webex_native(base_filename, chat_content, output_dir, start_
     messages_data = []
     current_time = start_date
     for msg in chat_content.get('messages', []):
-        current_time += timedelta(seconds=random.randint(5, 120))
+        current_time += timedelta(seconds=rng.randint(5, 120))
         iso_time = current_time.strftime("%Y-%m-%dT%H:%M:%S.000Z")
         sender_email = msg.get('sender_email', 'unknown@webex.com')
         person_id = get_deterministic_id(sender_email, "Y2lzY")
-        msg_id = str(uuid.uuid4())
+        msg_id = str(new_uuid())
 
         webex_msg = {
             "id": msg_id, "roomId": room_id, "roomType": "group", "text": msg.get('body', ''), "personId": person_id, "personEmail": sender_email, "created": iso_time, "edited": None, "deleted": False, "parentId": None, "attachments": [] 
@@ -1283,17 +3480,19 @@ def create_and_save_webex_native(base_filename, chat_content, output_dir, start_
     with open(os.path.join(webex_root, "rooms.json"), 'w', encoding='utf-8') as f: json.dump(rooms_data, f, indent=4)
     with open(os.path.join(webex_root, "participants.json"), 'w', encoding='utf-8') as f: json.dump(participants_data, f, indent=4)
     with open(os.path.join(webex_root, "messages.json"), 'w', encoding='utf-8') as f: json.dump(messages_data, f, indent=4)
+    for webex_file in ("rooms.json", "participants.json", "messages.json"):
+        record_output_file(stats, os.path.join(webex_root, webex_file))
 
     if stats:
         stats['scenarios_triggered'][f"Webex: {room_title}"] = stats['scenarios_triggered'].get(f"Webex: {room_title}", 0) + 1
         stats['rsmf_chats'] = stats.get('rsmf_chats', 0) + 1
         # Track date for date range calculation
-        stats['email_dates'].append(start_date)
+        record_item_date(stats, start_date)
         # Track custodians (participants in chat)
         for msg in chat_content.get('messages', []):
             stats['custodians'].add(msg.get('sender_email'))
 
-    print(f"  -> Created Webex API Export: {base_filename}")
+    log.debug(f"  -> Created Webex API Export: {base_filename}")
 
 def generate_realistic_timestamp(base_date=None, hours_offset=None, scenario_description='', is_urgent=False):
     """
@@ -1306,7 +3505,7 @@ def generate_realistic_timestamp(base_date=None, hours_offset=None, scenario_des
         is_urgent: Whether this is an urgent/time-sensitive communication
     """
     if base_date is None:
-        base_date = datetime.now() - timedelta(days=random.randint(10, 100))
+        base_date = generation_now() - timedelta(days=rng.randint(10, 100))
 
     # Determine timing pattern based on scenario
     is_fraud_scenario = any(keyword in scenario_description.lower()
@@ -1316,66 +3515,249 @@ def generate_realistic_timestamp(base_date=None, hours_offset=None, scenario_des
     if hours_offset:
         if is_urgent or is_fraud_scenario:
             # Urgent/fraud scenarios: Quick replies (30 min to 4 hours)
-            if is_fraud_scenario and random.random() < 0.3:
+            if is_fraud_scenario and rng.random() < 0.3:
                 # Some fraud emails show deliberate delays (let things cool down)
-                new_date = base_date + timedelta(hours=random.randint(24, 72), minutes=random.randint(0, 59))
+                new_date = base_date + timedelta(hours=rng.randint(24, 72), minutes=rng.randint(0, 59))
             else:
                 # Most urgent replies are fast
-                new_date = base_date + timedelta(minutes=random.randint(30, 240))
+                new_date = base_date + timedelta(minutes=rng.randint(30, 240))
         elif is_privilege_scenario:
             # Legal consultations: Often same-day or next business day
-            new_date = base_date + timedelta(hours=random.randint(2, 24), minutes=random.randint(0, 59))
+            new_date = base_date + timedelta(hours=rng.randint(2, 24), minutes=rng.randint(0, 59))
         else:
             # Normal business email patterns
-            new_date = base_date + timedelta(hours=hours_offset, minutes=random.randint(1, 59))
+            new_date = base_date + timedelta(hours=hours_offset, minutes=rng.randint(1, 59))
     else:
         new_date = base_date
 
     # Apply business hours (80% of emails during 8 AM - 6 PM)
-    if random.random() < 0.8:
-        new_date = new_date.replace(hour=random.randint(8, 18), minute=random.randint(0, 59))
+    if rng.random() < 0.8:
+        new_date = new_date.replace(hour=rng.randint(8, 18), minute=rng.randint(0, 59))
     else:
         # 20% outside business hours
-        if random.random() < 0.5:
+        if rng.random() < 0.5:
             # Early morning (6-8 AM)
-            new_date = new_date.replace(hour=random.randint(6, 7), minute=random.randint(0, 59))
+            new_date = new_date.replace(hour=rng.randint(6, 7), minute=rng.randint(0, 59))
         else:
             # Evening (6 PM - 11 PM) - fraud/urgent scenarios more likely
             hour_max = 23 if (is_fraud_scenario or is_urgent) else 21
-            new_date = new_date.replace(hour=random.randint(18, hour_max), minute=random.randint(0, 59))
+            new_date = new_date.replace(hour=rng.randint(18, hour_max), minute=rng.randint(0, 59))
 
     # Handle weekend/Friday evening patterns
-    if random.random() < 0.9:  # 90% respect weekends
+    if rng.random() < 0.9:  # 90% respect weekends
         # Skip weekends
         while new_date.weekday() >= 5:
             new_date += timedelta(days=1)
 
         # Friday evening -> Monday morning pattern
         if new_date.weekday() == 4 and new_date.hour >= 17:  # Friday after 5 PM
-            if random.random() < 0.7:  # 70% chance it waits until Monday
+            if rng.random() < 0.7:  # 70% chance it waits until Monday
                 # Jump to Monday morning
                 days_to_add = 7 - new_date.weekday()  # Days until Monday
                 new_date = new_date + timedelta(days=days_to_add)
-                new_date = new_date.replace(hour=random.randint(8, 10), minute=random.randint(0, 59))
+                new_date = new_date.replace(hour=rng.randint(8, 10), minute=rng.randint(0, 59))
 
     return new_date
 
-# --- Core Generation Functions ---
-
-def generate_email_thread(prompts, base_filename, output_dir, context_block, variables, personnel_map, scenario_description, attachment_config, near_dup_prob, run_count=1, is_noise=False, stats=None, config_temp=None, language_code=None, language_ratio=None):
-    """Generates a threaded email conversation.
-
-    Args:
-        language_code: Optional language code (e.g., 'de', 'es', 'zh', 'de-en-mixed')
-        language_ratio: Optional ratio for mixed languages (e.g., 0.7 = 70% primary language)
+# --- Generation Steps and Engines ---
+# Each scenario type is written once as a generator ("steps") that yields the work it
+# needs done: an LLMRequest (answered with the parsed response), a RenderTask (answered
+# with the rendered document and its render time), a list of either (answered concurrently with a list, in
+# order) or an OutputTask (answered with the writer's return value). BackgroundSteps
+# starts nested steps without waiting for them and JoinSteps collects their result, so
+# a generator can pipeline independent work. The thread engine answers steps from the
+# calling thread; the asyncio engine awaits them.
+
+@dataclass
+class OutputTask:
+    """Disk-bound writer call (e.g. create_and_save_email) handed to the engine."""
+    func: object
+    args: tuple = ()
+    kwargs: dict = None
+
+@dataclass
+class RenderTask:
+    """CPU-bound attachment rendering (PDF/DOCX/XLSX), run on the render process pool."""
+    filename: str
+    mime_type: str
+    content_text: str
+    seed: int = None
+
+    def run(self):
+        return contextvars.copy_context().run(run_render_task, self)
+
+def render_process_settings():
+    """Module settings the renderers read; spawned render processes start from the defaults."""
+    return {'REFERENCE_NOW': REFERENCE_NOW, 'PDF_FLATE': PDF_FLATE, 'XLSX_DATA_ROWS': XLSX_DATA_ROWS}
+
+def configure_render_process(settings):
+    """Render process initializer: spawned children re-import the module, so settings are passed in."""
+    globals().update(settings)
+
+def run_render_task(task):
+    """
+    Renders a RenderTask with its own RNG (module-level so render processes can unpickle it).
+    Returns (render_attachment() result, seconds spent rendering).
+    """
+    seed_job_rng(task.seed)
+    start = time.perf_counter()
+    rendered = render_attachment(task.filename, task.mime_type, task.content_text)
+    return rendered, time.perf_counter() - start
+
+@dataclass
+class BackgroundSteps:
+    """Nested generation steps started without waiting; answered with a handle for JoinSteps."""
+    steps: object
+    seed: int = None
+
+@dataclass
+class JoinSteps:
+    """Waits for a BackgroundSteps handle; answered with the nested steps' result."""
+    handle: object
+
+# Threads answering the requests of a yielded list concurrently (thread engine)
+ATTACHMENT_WORKERS = 8
+# Processes rendering attachments; 0 renders on the calling thread
+RENDER_PROCESSES = min(4, os.cpu_count() or 1)
+
+step_executors = {}
+step_executors_lock = threading.Lock()
+
+def get_step_executor(kind):
+    """Lazily created shared pool: 'requests' (threads), 'pipeline' (threads running
+    BackgroundSteps) or 'render' (processes, None if disabled)."""
+    with step_executors_lock:
+        if kind not in step_executors:
+            if kind == 'render':
+                # spawn, not fork: forking a process full of worker threads can deadlock the child
+                step_executors[kind] = ProcessPoolExecutor(RENDER_PROCESSES, mp_context=multiprocessing.get_context('spawn'),
+                                                           initializer=configure_render_process, initargs=(render_process_settings(),)) if RENDER_PROCESSES > 0 else None
+            elif kind == 'pipeline':
+                # One pending output per scenario worker (see email_thread_steps)
+                step_executors[kind] = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+            else:
+                step_executors[kind] = ThreadPoolExecutor(max_workers=ATTACHMENT_WORKERS)
+        return step_executors[kind]
+
+def shutdown_step_executors(wait=True):
+    """Stops the shared request and render pools (without wait, queued steps are cancelled)."""
+    with step_executors_lock:
+        for executor in step_executors.values():
+            if executor:
+                executor.shutdown(wait=wait, cancel_futures=not wait)
+        step_executors.clear()
+
+def submit_generation_step(step):
+    """Starts an LLMRequest or RenderTask on its shared pool; returns a Future."""
+    if isinstance(step, RenderTask):
+        render_executor = get_step_executor('render')
+        if render_executor:
+            return render_executor.submit(run_render_task, step)
+    # A copy of the job's context, so usage is recorded against the right job
+    return get_step_executor('requests').submit(contextvars.copy_context().run, execute_generation_step, step)
+
+def execute_generation_step(step):
+    """Answers one yielded step from the calling thread."""
+    if isinstance(step, OutputTask):
+        return step.func(*step.args, **(step.kwargs or {}))
+    if isinstance(step, BackgroundSteps):
+        return get_step_executor('pipeline').submit(contextvars.copy_context().run, run_background_steps, step)
+    if isinstance(step, JoinSteps):
+        return step.handle.result()
+    if isinstance(step, list):
+        if len(step) == 1 and not isinstance(step[0], RenderTask):
+            return [execute_generation_step(step[0])]
+        futures = [submit_generation_step(item) for item in step]
+        return [future.result() for future in futures]
+    if isinstance(step, RenderTask):
+        return submit_generation_step(step).result() if get_step_executor('render') else step.run()
+    return execute_llm_request(step)
+
+def run_background_steps(step):
+    """Runs BackgroundSteps to completion with their own RNG (thread engine pipeline pool)."""
+    seed_job_rng(step.seed)
+    return run_generation_steps(step.steps)
+
+async def async_run_background_steps(step, file_executor):
+    """asyncio counterpart of run_background_steps(); the task's context keeps the RNG private."""
+    seed_job_rng(step.seed)
+    return await async_run_generation_steps(step.steps, file_executor)
+
+def run_generation_steps(steps):
+    """Drives generation steps to completion on the calling thread; returns the steps' result."""
+    result = None
+    while True:
+        try:
+            step = steps.send(result)
+        except StopIteration as done:
+            return done.value
+        result = execute_generation_step(step)
+
+async def async_run_generation_steps(steps, file_executor):
+    """Drives generation steps on the event loop; file writing runs on file_executor."""
+    loop = asyncio.get_running_loop()
+    result = None
+    while True:
+        try:
+            step = steps.send(result)
+        except StopIteration as done:
+            return done.value
+        if isinstance(step, OutputTask):
+            # Writers draw from this job's RNG, so they run in a copy of its context
+            result = await loop.run_in_executor(file_executor, functools.partial(contextvars.copy_context().run, step.func, *step.args, **(step.kwargs or {})))
+        elif isinstance(step, BackgroundSteps):
+            result = asyncio.ensure_future(async_run_background_steps(step, file_executor))
+        elif isinstance(step, JoinSteps):
+            result = await step.handle
+        elif isinstance(step, list):
+            result = list(await asyncio.gather(*(async_execute_generation_step(item, file_executor) for item in step)))
+        else:
+            result = await async_execute_generation_step(step, file_executor)
+
+async def async_execute_generation_step(step, file_executor):
+    """Awaits one LLMRequest or RenderTask (rendering runs on the render pool, else file_executor)."""
+    if isinstance(step, RenderTask):
+        render_executor = get_step_executor('render')
+        if render_executor:
+            return await asyncio.get_running_loop().run_in_executor(render_executor, run_render_task, step)
+        return await asyncio.get_running_loop().run_in_executor(file_executor, step.run)
+    return await async_execute_llm_request(step)
+
+def email_output_steps(base_filename, email_content, output_dir, email_date, personnel_map, scenario_description, attachment_config, headers, stats, apply_signature=True):
+    """Generates an email's attachment texts, then hands the finished email to the writer."""
+    if apply_signature:
+        apply_sender_signature(email_content, personnel_map)
+    planned = plan_email_attachments(attachment_config, scenario_description, email_date)
+    requests = build_attachment_requests(planned, email_content)
+    texts = (yield requests) if requests else []
+    prepared_attachments = pair_attachment_texts(planned, texts)
+
+    # Render every document of the email in parallel before the message is assembled
+    # (sized stress documents are streamed into the message when it is written instead)
+    to_render = [(attachment, text) for attachment, text in prepared_attachments if 'description' in attachment and 'size' not in attachment]
+    if to_render:
+        rendered = yield [RenderTask(attachment['filename'], attachment['mime_type'], text, rng.getrandbits(64)) for attachment, text in to_render]
+        for (attachment, _), (result, seconds) in zip(to_render, rendered):
+            attachment['rendered'] = result
+            record_stage('render', result[2].lstrip('.'), seconds)
+    return (yield OutputTask(create_and_save_email, (base_filename, email_content, output_dir, email_date, personnel_map, scenario_description, attachment_config, headers, stats),
+                             {'prepared_attachments': prepared_attachments, 'apply_signature': False}))
+
+def email_thread_steps(prompts, base_filename, output_dir, context_block, variables, personnel_map, scenario_description, attachment_config, near_dup_prob, run_count=1, is_noise=False, stats=None, config_temp=None, language_code=None, language_ratio=None):
+    """
+    Generation steps for a threaded email conversation (see generate_email_thread).
+    Each reply quotes the message before it, so the LLM calls stay sequential; the
+    attachments and writing of message N run in the background while the LLM drafts
+    message N+1.
     """
     previous_message_id, references, generated_count = None, [], 0
+    pending_output = None
     previous_email_content, previous_email_date = None, None
     temperature = get_temperature_for_scenario('thread', is_noise, config_temp)
     for i, prompt_obj in enumerate(prompts):
         probability = prompt_obj.get('probability', 1.0)
-        if random.random() > probability:
-            print(f"  ... Skipping a prompt in thread based on probability < {probability}")
+        if rng.random() > probability:
+            log.debug(f"  ... Skipping a prompt in thread based on probability < {probability}")
             continue
 
         randomized_prompt = get_randomized_prompt(prompt_obj, variables, personnel_map, run_count)
@@ -1386,16 +3768,22 @@ def generate_email_thread(prompts, base_filename, output_dir, context_block, var
             style_instruction = f"\n\nIMPORTANT: Write this email in the style of {sender_name}: {style}"
         if previous_email_content:
             quoted_body = format_quoted_body(previous_email_content, previous_email_date)
-            full_prompt = f"{context_block}\n\nYou are drafting a reply to the following email:\n\n---\n{quoted_body}\n---\n\nYour task: {randomized_prompt}{style_instruction}"
+            full_prompt = f"You are drafting a reply to the following email:\n\n---\n{quoted_body}\n---\n\nYour task: {randomized_prompt}{style_instruction}"
         else:
-            full_prompt = f"{context_block}\n\nTask: {randomized_prompt}{style_instruction}"
-        email_content = generate_email_content_from_llm(full_prompt, temperature, language_code, language_ratio)
+            full_prompt = f"Task: {randomized_prompt}{style_instruction}"
+        email_content = yield build_email_request(full_prompt, temperature, language_code, language_ratio, context_block)
         if not email_content: continue
 
-        if random.random() < near_dup_prob:
-            print("  -> Creating a near-duplicate variation...")
+        if rng.random() < near_dup_prob:
+            log.debug("  -> Creating a near-duplicate variation...")
             email_content = create_near_duplicate(email_content)
 
+        # Finish writing the previous message before this one is queued. Only one output per
+        # thread is in flight, so the job's stats are never written from two threads at once
+        if pending_output:
+            yield JoinSteps(pending_output)
+            pending_output = None
+
         if previous_email_content and not email_content.get('subject', '').lower().startswith('re:'):
             email_content['subject'] = f"Re: {previous_email_content.get('subject', '')}"
         if previous_email_content:
@@ -1406,9 +3794,9 @@ def generate_email_thread(prompts, base_filename, output_dir, context_block, var
             domain = sender_email.split('@')[1]
         else:
             domain = 'synthetic.local' # Safe fallback domain
-            print(f"  !!! WARNING: LLM returned invalid sender_email: '{sender_email}'. Using fallback domain.")
+            log.warning(f"  !!! WARNING: LLM returned invalid sender_email: '{sender_email}'. Using fallback domain.")
         
-        current_message_id = f"<{uuid.uuid4()}@{domain}>"
+        current_message_id = f"<{new_uuid()}@{domain}>"
         headers = {'Message-ID': current_message_id}
 
         if previous_message_id:
@@ -1422,38 +3810,38 @@ def generate_email_thread(prompts, base_filename, output_dir, context_block, var
 
         current_email_date = generate_realistic_timestamp(
             previous_email_date,
-            random.randint(1, 48) if previous_email_date else None,
+            rng.randint(1, 48) if previous_email_date else None,
             scenario_description=scenario_description,
             is_urgent=is_urgent
         )
 
+        # Sign now, on this side of the pipeline: the next reply quotes the signed body
+        apply_sender_signature(email_content, personnel_map)
         dynamic_base_filename = f"{base_filename}_{generated_count + 1}"
-        create_and_save_email(dynamic_base_filename, email_content, output_dir, current_email_date, personnel_map, scenario_description, attachment_config, headers, stats)
+        pending_output = yield BackgroundSteps(email_output_steps(dynamic_base_filename, email_content, output_dir, current_email_date, personnel_map, scenario_description, attachment_config, headers, stats, apply_signature=False),
+                                               rng.getrandbits(64))
 
         generated_count += 1
         previous_message_id, previous_email_content, previous_email_date = current_message_id, email_content, current_email_date
+    if pending_output:
+        yield JoinSteps(pending_output)
     return generated_count
 
-def generate_standalone_email(prompt_template, base_filename, output_dir, context_block, variables, personnel_map, scenario_description, attachment_config, near_dup_prob, run_count=1, is_noise=False, stats=None, config_temp=None, language_code=None, language_ratio=None):
-    """Generates a standalone email.
-
-    Args:
-        language_code: Optional language code (e.g., 'de', 'es', 'zh', 'de-en-mixed')
-        language_ratio: Optional ratio for mixed languages (e.g., 0.7 = 70% primary language)
-    """
+def standalone_email_steps(prompt_template, base_filename, output_dir, context_block, variables, personnel_map, scenario_description, attachment_config, near_dup_prob, run_count=1, is_noise=False, stats=None, config_temp=None, language_code=None, language_ratio=None):
+    """Generation steps for a standalone email (see generate_standalone_email)."""
     randomized_prompt = get_randomized_prompt(prompt_template, variables, personnel_map, run_count)
     sender_name = get_sender_name_from_prompt(randomized_prompt, personnel_map)
     style_instruction = ""
     if sender_name and personnel_map.get(sender_name, {}).get('style'):
         style = personnel_map[sender_name]['style']
         style_instruction = f"\n\nIMPORTANT: Write this email in the style of {sender_name}: {style}"
-    full_prompt = f"{context_block}\n\nTask: {randomized_prompt}{style_instruction}"
+    full_prompt = f"Task: {randomized_prompt}{style_instruction}"
     temperature = get_temperature_for_scenario('standalone', is_noise, config_temp)
-    email_content = generate_email_content_from_llm(full_prompt, temperature, language_code, language_ratio)
+    email_content = yield build_email_request(full_prompt, temperature, language_code, language_ratio, context_block)
     if not email_content: return 0
 
-    if random.random() < near_dup_prob:
-        print("  -> Creating a near-duplicate variation...")
+    if rng.random() < near_dup_prob:
+        log.debug("  -> Creating a near-duplicate variation...")
         email_content = create_near_duplicate(email_content)
 
     # --- STRESS TEST: CHECK FOR BLAST EMAIL SCENARIO ---
@@ -1466,9 +3854,9 @@ def generate_standalone_email(prompt_template, base_filename, output_dir, contex
         domain = sender_email.split('@')[1]
     else:
         domain = 'synthetic.local' # Safe fallback domain
-        print(f"  !!! WARNING: LLM returned invalid sender_email: '{sender_email}'. Using fallback domain.")
+        log.warning(f"  !!! WARNING: LLM returned invalid sender_email: '{sender_email}'. Using fallback domain.")
     
-    headers = {'Message-ID': f"<{uuid.uuid4()}@{domain}>"}
+    headers = {'Message-ID': f"<{new_uuid()}@{domain}>"}
 
     # Detect urgency for standalone emails too
     is_urgent = any(keyword in email_content.get('subject', '').lower() + email_content.get('body', '').lower()
@@ -1479,92 +3867,364 @@ def generate_standalone_email(prompt_template, base_filename, output_dir, contex
         is_urgent=is_urgent
     )
 
-    create_and_save_email(base_filename, email_content, output_dir, email_date, personnel_map, scenario_description, attachment_config, headers, stats)
+    yield from email_output_steps(base_filename, email_content, output_dir, email_date, personnel_map, scenario_description, attachment_config, headers, stats)
     return 1
 
-def generate_calendar_event(prompt_template, base_filename, output_dir, context_block, variables, personnel_map, run_count=1, is_noise=False, stats=None, config_temp=None):
-    """Generates a standalone .ics calendar event."""
+def calendar_event_steps(prompt_template, base_filename, output_dir, context_block, variables, personnel_map, run_count=1, is_noise=False, stats=None, config_temp=None):
+    """Generation steps for a standalone .ics calendar event (see generate_calendar_event)."""
     randomized_prompt = get_randomized_prompt(prompt_template, variables, personnel_map, run_count)
-    full_prompt = f"{context_block}\n\nTask: {randomized_prompt}"
+    full_prompt = f"Task: {randomized_prompt}"
     temperature = get_temperature_for_scenario('calendar', is_noise, config_temp)
-    event_content = generate_calendar_content_from_llm(full_prompt, temperature)
+    event_content = yield build_calendar_request(full_prompt, temperature, context_block)
     if not event_content: return 0
     event_date = generate_realistic_timestamp()
     filename = f"{base_filename}.ics"
-    create_and_save_calendar_event(filename, event_content, output_dir, event_date, stats)
+    yield OutputTask(create_and_save_calendar_event, (filename, event_content, output_dir, event_date, stats))
     return 1
 
-def generate_chat_scenario(prompts, base_filename, output_dir, context_block, variables, personnel_map, chat_format='slack', run_count=1, is_noise=False, stats=None, config_temp=None, language_code=None, language_ratio=None):
-    """Orchestrates the creation of a chat/RSMF file.
+def write_chat_outputs(base_filename, chat_content, output_dir, start_date, personnel_map, chat_format, stats):
+    """Writes a generated chat in every requested export format."""
+    # 1. Slack (added to the in-memory export; the flush is profiled as post-processing)
+    if chat_format in ['slack', 'all']:
+        with timed_stage('write', 'slack'):
+            create_and_save_slack_native(base_filename, chat_content, output_dir, start_date, personnel_map, stats)
 
-    Args:
-        language_code: Optional language code (e.g., 'de', 'es', 'zh', 'de-en-mixed')
-        language_ratio: Optional ratio for mixed languages (e.g., 0.7 = 70% primary language)
-    """
+    # 2. Teams (RSMF)
+    if chat_format in ['teams', 'all']:
+        with timed_stage('write', 'rsmf'):
+            create_and_save_rsmf(base_filename, chat_content, output_dir, start_date, personnel_map, stats)
+
+    # 3. Webex (API Format)
+    if chat_format in ['webex', 'all']:
+        with timed_stage('write', 'webex'):
+            create_and_save_webex_native(base_filename, chat_content, output_dir, start_date, personnel_map, stats)
+
+def chat_scenario_steps(prompts, base_filename, output_dir, context_block, variables, personnel_map, chat_format='slack', run_count=1, is_noise=False, stats=None, config_temp=None, language_code=None, language_ratio=None):
+    """Generation steps for a chat/RSMF scenario (see generate_chat_scenario)."""
     prompt_obj = prompts[0]
     randomized_prompt = get_randomized_prompt(prompt_obj, variables, personnel_map, run_count)
 
-    full_prompt = f"{context_block}\n\nTask: {randomized_prompt}\n\nGenerate a conversation history between these participants."
+    full_prompt = f"Task: {randomized_prompt}\n\nGenerate a conversation history between these participants."
 
-    chat_content = generate_chat_content_from_llm(full_prompt, get_temperature_for_scenario('chat', is_noise, config_temp), language_code, language_ratio)
+    chat_content = yield build_chat_request(full_prompt, get_temperature_for_scenario('chat', is_noise, config_temp), language_code, language_ratio, context_block)
     
     if not chat_content: return 0
 
     start_date = generate_realistic_timestamp()
-    
-    # 1. Slack
-    if chat_format in ['slack', 'all']:
-        create_and_save_slack_native(base_filename, chat_content, output_dir, start_date, personnel_map, stats)
+    yield OutputTask(write_chat_outputs, (base_filename, chat_content, output_dir, start_date, personnel_map, chat_format, stats))
+    return 1
 
-    # 2. Teams (RSMF)
-    if chat_format in ['teams', 'all']:
-        create_and_save_rsmf(base_filename, chat_content, output_dir, start_date, personnel_map, stats)
+# --- Core Generation Functions ---
 
-    # 3. Webex (API Format)
-    if chat_format in ['webex', 'all']:
-        create_and_save_webex_native(base_filename, chat_content, output_dir, start_date, personnel_map, stats)
+def generate_email_thread(prompts, base_filename, output_dir, context_block, variables, personnel_map, scenario_description, attachment_config, near_dup_prob, run_count=1, is_noise=False, stats=None, config_temp=None, language_code=None, language_ratio=None):
+    """Generates a threaded email conversation.
 
-    return 1
+    Args:
+        language_code: Optional language code (e.g., 'de', 'es', 'zh', 'de-en-mixed')
+        language_ratio: Optional ratio for mixed languages (e.g., 0.7 = 70% primary language)
+    """
+    return run_generation_steps(email_thread_steps(prompts, base_filename, output_dir, context_block, variables, personnel_map, scenario_description, attachment_config, near_dup_prob, run_count, is_noise, stats, config_temp, language_code, language_ratio))
+
+def generate_standalone_email(prompt_template, base_filename, output_dir, context_block, variables, personnel_map, scenario_description, attachment_config, near_dup_prob, run_count=1, is_noise=False, stats=None, config_temp=None, language_code=None, language_ratio=None):
+    """Generates a standalone email.
+
+    Args:
+        language_code: Optional language code (e.g., 'de', 'es', 'zh', 'de-en-mixed')
+        language_ratio: Optional ratio for mixed languages (e.g., 0.7 = 70% primary language)
+    """
+    return run_generation_steps(standalone_email_steps(prompt_template, base_filename, output_dir, context_block, variables, personnel_map, scenario_description, attachment_config, near_dup_prob, run_count, is_noise, stats, config_temp, language_code, language_ratio))
+
+def generate_calendar_event(prompt_template, base_filename, output_dir, context_block, variables, personnel_map, run_count=1, is_noise=False, stats=None, config_temp=None):
+    """Generates a standalone .ics calendar event."""
+    return run_generation_steps(calendar_event_steps(prompt_template, base_filename, output_dir, context_block, variables, personnel_map, run_count, is_noise, stats, config_temp))
 
-def create_nested_containers(output_dir):
+def generate_chat_scenario(prompts, base_filename, output_dir, context_block, variables, personnel_map, chat_format='slack', run_count=1, is_noise=False, stats=None, config_temp=None, language_code=None, language_ratio=None):
+    """Orchestrates the creation of a chat/RSMF file.
+
+    Args:
+        language_code: Optional language code (e.g., 'de', 'es', 'zh', 'de-en-mixed')
+        language_ratio: Optional ratio for mixed languages (e.g., 0.7 = 70% primary language)
+    """
+    return run_generation_steps(chat_scenario_steps(prompts, base_filename, output_dir, context_block, variables, personnel_map, chat_format, run_count, is_noise, stats, config_temp, language_code, language_ratio))
+
+# Outer layer of the nested container: gzip (.tar.gz), zstd (.tar.zst) or none (.tar)
+CONTAINER_COMPRESSION = 'gzip'
+# Custodian folders zipped at the same time (zlib releases the GIL, so threads scale)
+CONTAINER_WORKERS = min(4, os.cpu_count() or 1)
+# Custodian zips are built in memory up to this size, then spill to a temp file in the output directory
+CONTAINER_SPOOL_MB = 64
+CONTAINER_EXTENSIONS = {'gzip': '.tar.gz', 'zstd': '.tar.zst', 'none': '.tar'}
+# Files that are already compressed are stored in the custodian zips rather than deflated again
+STORED_EXTENSIONS = ('.zip', '.gz', '.zst', '.docx', '.xlsx', '.pptx', '.png', '.jpg', '.jpeg')
+# 'end' zips the finished tree after generation; 'incremental' adds each job's files to the
+# custodian zips as it completes; 'incremental-delete' also removes the loose files it archived
+CONTAINER_MODE = 'end'
+CONTAINER_PARTS_DIRNAME = '.container_parts'
+
+def zip_compress_type(filename):
+    return zipfile.ZIP_STORED if filename.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+def add_zip_file(archive, path, arcname, compress_type=zipfile.ZIP_STORED):
+    """archive.write() for the container zips, with the entry dated REFERENCE_NOW in seeded runs so they reproduce."""
+    if not REFERENCE_NOW:
+        archive.write(path, arcname, compress_type=compress_type)
+        return
+    info = zipfile.ZipInfo.from_file(path, arcname)
+    info.date_time = REFERENCE_NOW.timetuple()[:6]
+    if info.is_dir():
+        archive.writestr(info, b'')
+        return
+    info.compress_type = compress_type
+    with open(path, 'rb') as source, archive.open(info, 'w') as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+
+def zip_custodian_folder(folder, spool_dir):
+    """
+    Zips one custodian folder into a spooled temp file (the same layout shutil.make_archive
+    produced) and returns it rewound, with its size.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=CONTAINER_SPOOL_MB * 1024 * 1024, dir=spool_dir)
+    with zipfile.ZipFile(spool, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            for name in dirs:
+                path = os.path.join(root, name)
+                add_zip_file(archive, path, os.path.relpath(path, folder))
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                add_zip_file(archive, path, os.path.relpath(path, folder), zip_compress_type(name))
+    size = spool.tell()
+    spool.seek(0)
+    return spool, size
+
+@contextlib.contextmanager
+def open_container_tar(path, compression):
+    """Opens the outer tar stream for writing with the chosen compression."""
+    with open(path, 'wb') as raw:
+        if compression == 'zstd':
+            with zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(raw, closefd=False) as compressed, \
+                    tarfile.open(fileobj=compressed, mode='w|') as tar:
+                yield tar
+        elif compression == 'gzip':
+            # The members are zips, so a fast gzip level loses almost nothing
+            with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=1, mtime=REFERENCE_NOW.timestamp() if REFERENCE_NOW else None) as compressed, \
+                    tarfile.open(fileobj=compressed, mode='w|') as tar:
+                yield tar
+        else:
+            with tarfile.open(fileobj=raw, mode='w|') as tar:
+                yield tar
+
+def add_container_member(tar, name, fileobj, size):
+    """Streams an open file into the tar as a regular member."""
+    member = tarfile.TarInfo(name)
+    member.size = size
+    member.mtime = REFERENCE_NOW.timestamp() if REFERENCE_NOW else time.time()
+    member.mode = 0o644
+    tar.addfile(member, fileobj)
+
+def container_archive_path(output_dir, compression):
+    """Path of the outer tar; its name suffix comes from the job RNG, so seeded runs reproduce it."""
+    return os.path.join(output_dir, f"Dataset_Nested_Export_{new_uuid().hex[:6]}{CONTAINER_EXTENSIONS[compression]}")
+
+def create_nested_containers(output_dir, compression=None, workers=None):
     """
     Stress Test Post-Processing:
-    Zips individual custodian folders, then puts them all in a .tar.gz archive.
+    Zips individual custodian folders, then puts them all in a tar archive (TarGz -> Zip -> Files).
+
+    Each custodian zip is built in a spooled temp file and streamed straight into the tar, so
+    the dataset is read once and no intermediate zips are left on disk. Up to `workers`
+    custodians are zipped in parallel; the tar keeps them in name order. Returns the archive path,
+    or None if the archive couldn't be written or is missing custodians whose zip failed.
     """
+    compression = compression or CONTAINER_COMPRESSION
+    workers = workers or CONTAINER_WORKERS
     print("\n--- Starting Post-Processing: Nested Container Creation ---")
-    
-    zip_files = []
-    
-    # 1. Walk immediate subdirectories (Custodians)
-    for item in os.listdir(output_dir):
-        full_path = os.path.join(output_dir, item)
-        if os.path.isdir(full_path):
-            print(f"  > Zipping folder: {item}")
-            try:
-                shutil.make_archive(full_path, 'zip', full_path)
-                zip_files.append(f"{full_path}.zip")
-            except Exception as e:
-                print(f"!!! Error zipping {item}: {e}")
 
-    # 2. Create the Master TarGz
-    tar_name = os.path.join(output_dir, f"Dataset_Nested_Export_{uuid.uuid4().hex[:6]}.tar.gz")
-    print(f"  > Creating Master Archive: {tar_name}")
-    
+    custodians = sorted(item for item in os.listdir(output_dir)
+                        if os.path.isdir(os.path.join(output_dir, item)) and item not in (SHARDS_DIRNAME, CONTAINER_PARTS_DIRNAME))
+    tar_name = container_archive_path(output_dir, compression)
+    print(f"  > Creating Master Archive: {tar_name} ({len(custodians)} custodian zips, {workers} workers)")
+
     try:
-        with tarfile.open(tar_name, "w:gz") as tar:
-            for zip_file in zip_files:
-                tar.add(zip_file, arcname=os.path.basename(zip_file))
-                
-        # 3. Cleanup: Remove the intermediate zip files
-        print("  > Cleaning up intermediate .zip files...")
-        for zip_file in zip_files:
-            if os.path.exists(zip_file):
-                os.remove(zip_file)
-                
-        print(f"--- Nested Container Created Successfully: {tar_name} ---")
+        with open_container_tar(tar_name, compression) as tar, ThreadPoolExecutor(max_workers=workers) as executor:
+            # A bounded window of zips in flight keeps the spooled temp files to about 2x workers
+            pending = collections.deque()
+            failed = []
+            custodian_iter = iter(custodians)
+            for item in custodian_iter:
+                pending.append((item, executor.submit(zip_custodian_folder, os.path.join(output_dir, item), output_dir)))
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                item, future = pending.popleft()
+                try:
+                    spool, size = future.result()
+                except Exception as e:
+                    log.error(f"!!! Error zipping {item}: {e}")
+                    failed.append(item)
+                else:
+                    with spool:
+                        add_container_member(tar, f"{item}.zip", spool, size)
+                    log.debug(f"  > Zipped folder: {item} ({size / (1024 * 1024):.1f} MB)")
+                next_item = next(custodian_iter, None)
+                if next_item is not None:
+                    pending.append((next_item, executor.submit(zip_custodian_folder, os.path.join(output_dir, next_item), output_dir)))
+
+        if failed:
+            print(f"!!! Nested Container Incomplete: {tar_name} is missing {len(failed)} of {len(custodians)} custodian(s): {', '.join(failed)} (see the log)")
+            return None
+        print(f"--- Nested Container Created Successfully: {tar_name} ({os.path.getsize(tar_name) / (1024 * 1024):.1f} MB) ---")
+        return tar_name
 
     except Exception as e:
         print(f"!!! Error creating master archive: {e}")
+        return None
+
+class IncrementalContainer:
+    """
+    Builds the nested container while generation runs. Each completed job's files are appended
+    to per-custodian zips in <output>/.container_parts on background threads, so archiving
+    overlaps with LLM wait time; seal() sweeps in whatever was written outside the jobs (e.g.
+    the Slack export) and streams the zips into the outer tar. With delete_archived the loose
+    files are removed as soon as they are in a zip, so the full tree never has to fit on disk.
+
+    close() leaves valid zips behind, so an interrupted run picks them up again on --resume.
+    A zip left unreadable by a hard crash is discarded; its files are archived again from the
+    loose copies unless they were already deleted.
+    """
+
+    def __init__(self, output_dir, delete_archived=False, resume=False, workers=None):
+        self.output_dir = output_dir
+        self.parts_dir = os.path.join(output_dir, CONTAINER_PARTS_DIRNAME)
+        self.delete_archived = delete_archived
+        self.workers = workers or CONTAINER_WORKERS
+        self.archived = {}  # custodian folder -> names already in its zip
+        self.failed = set()  # paths whose last archiving attempt failed
+        self._writers = {}
+        self._folder_locks = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+        if not resume:
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+        os.makedirs(self.parts_dir, exist_ok=True)
+        for entry in sorted(os.listdir(self.parts_dir)):
+            part_path = os.path.join(self.parts_dir, entry)
+            try:
+                with zipfile.ZipFile(part_path) as archive:
+                    self.archived[entry[:-len('.zip')]] = set(archive.namelist())
+            except (zipfile.BadZipFile, OSError):
+                os.remove(part_path)
+                print(f"  Warning: Container part {entry} was not closed cleanly and was discarded"
+                      f"{'; its deleted loose files are lost' if delete_archived else ''}.")
+
+    def _folder_lock(self, folder):
+        with self._lock:
+            return self._folder_locks.setdefault(folder, threading.Lock())
+
+    def _writer(self, folder):
+        """The open zip for a custodian folder (caller holds the folder lock)."""
+        writer = self._writers.get(folder)
+        if writer is None:
+            part_path = os.path.join(self.parts_dir, f"{folder}.zip")
+            writer = zipfile.ZipFile(part_path, 'a' if os.path.exists(part_path) else 'w', zipfile.ZIP_DEFLATED)
+            self._writers[folder] = writer
+            self.archived.setdefault(folder, set())
+        return writer
+
+    def _archive(self, folder, paths):
+        with self._folder_lock(folder):
+            writer, archived = self._writer(folder), self.archived[folder]
+            for path in paths:
+                arcname = os.path.relpath(path, os.path.join(self.output_dir, folder)).replace(os.sep, '/')
+                if arcname in archived or not os.path.exists(path):
+                    continue
+                try:
+                    add_zip_file(writer, path, arcname, zip_compress_type(path))
+                    archived.add(arcname)
+                    self.failed.discard(path)
+                except Exception as e:
+                    # Left loose; seal() tries again
+                    log.error(f"!!! Error archiving {path}: {e}")
+                    self.failed.add(path)
+                    continue
+                if self.delete_archived:
+                    os.remove(path)
+
+    def add_files(self, paths):
+        """Queues files (absolute or relative to the cwd) for their custodian zips; returns immediately."""
+        by_folder = {}
+        for path in paths:
+            relative = os.path.relpath(path, self.output_dir)
+            folder = relative.split(os.sep, 1)[0]
+            # Root files (calendar invites, reports) stay outside the container, as before
+            if folder == relative or folder in (SHARDS_DIRNAME, CONTAINER_PARTS_DIRNAME, os.pardir):
+                continue
+            by_folder.setdefault(folder, []).append(path)
+        if not by_folder:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='container')
+            executor = self._executor
+        for folder, folder_paths in by_folder.items():
+            executor.submit(self._archive, folder, folder_paths)
+
+    def close(self):
+        """Waits for queued files and closes the zips (they stay valid for seal() or a resume)."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=True)
+        for folder in list(self._writers):
+            with self._folder_lock(folder):
+                self._writers.pop(folder).close()
+
+    def seal(self, compression=None):
+        """
+        Archives anything still loose, then streams the custodian zips into the outer tar.
+        Returns its path, or None if it couldn't be written or files failed to archive.
+        """
+        compression = compression or CONTAINER_COMPRESSION
+        print("\n--- Sealing Incremental Nested Container ---")
+        self.close()
+
+        for folder in sorted(os.listdir(self.output_dir)):
+            folder_path = os.path.join(self.output_dir, folder)
+            if not os.path.isdir(folder_path) or folder in (SHARDS_DIRNAME, CONTAINER_PARTS_DIRNAME):
+                continue
+            loose = [os.path.join(root, name) for root, dirs, files in os.walk(folder_path) for name in sorted(files)]
+            if loose:
+                self._archive(folder, loose)
+            if self.delete_archived:
+                # Drop the folders emptied by archiving (bottom-up, so nested ones go first)
+                for root, dirs, files in os.walk(folder_path, topdown=False):
+                    if not os.listdir(root):
+                        os.rmdir(root)
+        self.close()
+
+        tar_name = container_archive_path(self.output_dir, compression)
+        parts = sorted(entry for entry in os.listdir(self.parts_dir) if entry.endswith('.zip'))
+        print(f"  > Creating Master Archive: {tar_name} ({len(parts)} custodian zips)")
+        try:
+            with open_container_tar(tar_name, compression) as tar:
+                for entry in parts:
+                    part_path = os.path.join(self.parts_dir, entry)
+                    with open(part_path, 'rb') as part:
+                        add_container_member(tar, entry, part, os.path.getsize(part_path))
+                    # Each zip goes as soon as it is in the tar, so the parts and the tar never both fill the disk
+                    os.remove(part_path)
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+            if self.failed:
+                missing = sorted(os.path.relpath(path, self.output_dir) for path in self.failed)
+                print(f"!!! Nested Container Incomplete: {tar_name} is missing {len(missing)} file(s) that failed to archive"
+                      f" and were left in place: {', '.join(missing[:5])}{', ...' if len(missing) > 5 else ''} (see the log)")
+                return None
+            print(f"--- Nested Container Created Successfully: {tar_name} ({os.path.getsize(tar_name) / (1024 * 1024):.1f} MB) ---")
+            return tar_name
+        except Exception as e:
+            print(f"!!! Error creating master archive: {e}")
+            return None
 
 def generate_protocol_document(output_dir, scenario_filter, config):
     """
@@ -1574,6 +4234,9 @@ def generate_protocol_document(output_dir, scenario_filter, config):
 
     # Determine scenario type from filter
     investigation_type = scenario_filter if scenario_filter and scenario_filter != 'all' else 'mixed'
+    if isinstance(investigation_type, list):
+        # Custom combinations get the generic multi-issue protocol
+        investigation_type = investigation_type[0] if len(investigation_type) == 1 else 'mixed'
 
     # Protocol templates by investigation type
     protocols = {
@@ -1840,56 +4503,471 @@ def generate_protocol_document(output_dir, scenario_filter, config):
     except Exception as e:
         print(f"!!! Error creating protocol document: {e}")
 
-# --- Main Orchestration Logic ---
-if __name__ == "__main__":
-    selected_config_file = select_config_file()
-    if not selected_config_file: exit()
-    target_item_count = get_target_email_count()
+# --- Run Stats and Checkpointing ---
 
-    # --- Prompt for Model Selection ---
-    selected_model = get_model_preference()
-    if selected_model:
-        AZURE_MODEL_NAME = selected_model
-        print(f"Using model: {AZURE_MODEL_NAME}")
-    else:
-        print(f"Using default model from .env: {AZURE_MODEL_NAME}")
+def new_run_stats(track_files=False):
+    """Creates an empty stats dict. Job-level stats can also track the files they write."""
+    stats = {
+        'emails': 0,
+        'calendar_events': 0,
+        'rsmf_chats': 0,
+        'attachments': 0,
+        'attachment_types': {},
+        'scenarios_triggered': {},
+        'stress_tests_triggered': [],
+        # Item dates for the date range: running min/max plus items per day, so memory
+        # stays constant no matter how many items are generated
+        'date_min': None,
+        'date_max': None,
+        'date_histogram': {},
+        'custodians': set(),  # Track unique custodian emails
+        # Reported LLM usage; cached_tokens is the part of prompt_tokens served from the prompt
+        # cache, cache_hits/cache_misses count lookups in the --response-cache store
+        'llm_usage': {'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0, 'cache_hits': 0, 'cache_misses': 0},
+        # Where the time went: scenario -> item type -> stage -> totals (see record_stage)
+        'profile': {},
+    }
+    if track_files:
+        stats['files_written'] = []
+    return stats
+
+def record_item_date(stats, item_date):
+    """Counts an item's date towards the date range and the per-day histogram."""
+    if stats['date_min'] is None or item_date < stats['date_min']:
+        stats['date_min'] = item_date
+    if stats['date_max'] is None or item_date > stats['date_max']:
+        stats['date_max'] = item_date
+    day = item_date.strftime('%Y-%m-%d')
+    stats['date_histogram'][day] = stats['date_histogram'].get(day, 0) + 1
+
+def record_output_file(stats, path):
+    """Notes a file written by the current job (used by the run journal)."""
+    if stats is not None and 'files_written' in stats:
+        stats['files_written'].append(path)
+
+def merge_run_stats(stats, delta):
+    """Folds a job's stats delta into the run totals (file lists are not merged)."""
+    for key, value in delta.items():
+        if key == 'files_written' or value is None:
+            continue
+        if key == 'date_min':
+            stats[key] = value if stats[key] is None else min(stats[key], value)
+        elif key == 'date_max':
+            stats[key] = value if stats[key] is None else max(stats[key], value)
+        elif isinstance(value, set):
+            stats[key].update(value)
+        elif key == 'profile':
+            merge_profile(stats[key], value)
+        elif isinstance(value, dict):
+            for name, count in value.items():
+                stats[key][name] = stats[key].get(name, 0) + count
+        elif key == 'stress_tests_triggered':
+            stats[key].extend(item for item in value if item not in stats[key])
+        elif isinstance(value, list):
+            stats[key].extend(value)
+        else:
+            stats[key] = stats.get(key, 0) + value
+
+def merge_profile(profile, delta):
+    """Adds one profile (scenario -> item type -> stage -> totals) into another."""
+    for scenario, item_types in delta.items():
+        for item_type, stages in item_types.items():
+            for stage, entry in stages.items():
+                target = profile.setdefault(scenario, {}).setdefault(item_type, {}).setdefault(stage, {})
+                for name, value in entry.items():
+                    target[name] = max(target.get(name, 0), value) if name == 'max_seconds' else target.get(name, 0) + value
+
+def stats_to_json(stats):
+    """JSON-safe copy of a stats dict (sets become lists, dates ISO strings)."""
+    data = {key: value for key, value in stats.items() if key != 'files_written'}
+    data['date_min'] = stats['date_min'].isoformat() if stats['date_min'] else None
+    data['date_max'] = stats['date_max'].isoformat() if stats['date_max'] else None
+    data['custodians'] = sorted(c for c in stats['custodians'] if c)
+    return data
+
+def stats_from_json(data):
+    """Inverse of stats_to_json()."""
+    data = dict(data)
+    stats = new_run_stats()
+    # Journals written before the date histogram existed list every item date
+    for date in data.pop('email_dates', []):
+        record_item_date(stats, datetime.fromisoformat(date))
+    merge_run_stats(stats, {
+        **data,
+        'date_min': datetime.fromisoformat(data['date_min']) if data.get('date_min') else None,
+        'date_max': datetime.fromisoformat(data['date_max']) if data.get('date_max') else None,
+        'custodians': set(data.get('custodians', [])),
+    })
+    return stats
+
+class StatsCollector:
+    """
+    Thread-safe run totals for the certification report.
 
-    # --- Prompt for Chat Format ---
-    chat_format_pref = get_chat_format_preference()
+    Writers never touch the totals: each scenario job accumulates into its own private
+    stats dict (new_job_stats()), owned by the worker running it, and hands it over with
+    merge() when the job completes. Only the merge takes the lock.
+    """
 
-    # --- Prompt for Log Size (Stress Test) ---
-    log_size_mb = get_log_size_preference()
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = new_run_stats()
 
-    # --- Prompt for Nested Container (Stress Test) ---
-    create_container = get_container_preference()
+    def new_job_stats(self):
+        """A fresh per-job accumulator (also tracks the job's files for the journal)."""
+        return new_run_stats(track_files=True)
 
-    # --- Prompt for Protocol Document Generation ---
-    generate_protocol = get_protocol_preference()
+    def merge(self, job_stats):
+        """Folds a completed job's accumulator into the run totals."""
+        with self._lock:
+            merge_run_stats(self._totals, job_stats)
 
-    config = load_config(selected_config_file)
-    if not config: exit()
-    print("\nConfiguration loaded.")
+    @property
+    def totals(self):
+        """The merged run totals; read once generation has finished."""
+        return self._totals
 
-    # Check if user selected config-acme.yaml and prompt for scenario filter
-    if selected_config_file == 'config-acme.yaml':
-        print("\n" + "="*80)
-        print("You selected config-acme.yaml (Master Configuration with All Scenarios)")
-        print("="*80)
-        print("\nThis config contains ALL investigation types mixed together.")
-        print("For realistic investigation testing, you should focus on ONE investigation type.")
+    def counts(self, keys):
+        """A consistent snapshot of the given counters while generation is still running."""
+        with self._lock:
+            return {key: self._totals[key] for key in keys}
 
-        user_filter_choice = get_scenario_filter_preference()
+class RunJournal:
+    """
+    Append-only JSONL journal of scenario jobs, kept in the output directory.
 
-        # Override the config's scenario_filter with user's choice
-        config['general_settings']['scenario_filter'] = user_filter_choice
+    A 'start' record is written when a job begins and a 'complete' record (items, files
+    written, stats delta) when it finishes. Records are flushed immediately but fsynced in
+    batches (every `fsync_every` records or `fsync_interval` seconds) to keep the overhead
+    low on large runs; at worst the last few completed jobs are regenerated on resume.
+    """
+    FILENAME = "generation_journal.jsonl"
+
+    def __init__(self, output_dir, resume=False, fsync_every=25, fsync_interval=5.0):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, self.FILENAME)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+
+    def _write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self._pending += 1
+            if self._pending >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def record_start(self, job_id, scenario_id, run_counter):
+        """Marks a job as started (its files are discarded on resume if it never completes)."""
+        self._write({'type': 'start', 'job': job_id, 'scenario': scenario_id, 'run': run_counter})
+
+    def record_complete(self, job_id, scenario_id, run_counter, items_created, stats_delta, slack_chats=None):
+        """Marks a job as finished, with the files it wrote, its stats delta and its Slack chats (if any)."""
+        files = [os.path.relpath(path, self.output_dir) for path in stats_delta.get('files_written', [])]
+        record = {'type': 'complete', 'job': job_id, 'scenario': scenario_id, 'run': run_counter,
+                  'items': items_created, 'files': files, 'stats': stats_to_json(stats_delta)}
+        if slack_chats:
+            record['slack'] = slack_chats
+        self._write(record)
+
+    def sync(self):
+        """Fsyncs the records written so far."""
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+
+    def close(self):
+        """Flushes and fsyncs outstanding records."""
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+    @classmethod
+    def load(cls, output_dir):
+        """Reads journal records, ignoring a torn final line."""
+        records = []
+        path = os.path.join(output_dir, cls.FILENAME)
+        if not os.path.exists(path):
+            return records
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+        return records
+
+def discard_incomplete_job_outputs(output_dir, job_ids):
+    """Removes files left behind by jobs that started but never completed."""
+    removed = 0
+    for root, dirs, files in os.walk(output_dir):
+        for dirname in list(dirs):
+            if dirname in job_ids:
+                shutil.rmtree(os.path.join(root, dirname), ignore_errors=True)
+                dirs.remove(dirname)
+                removed += 1
+        for filename in files:
+            if any(filename.startswith(job_id) for job_id in job_ids):
+                os.remove(os.path.join(root, filename))
+                removed += 1
+    return removed
+
+def replay_journal(output_dir, stats):
+    """
+    Folds the completed jobs of a journal into stats (a StatsCollector).
 
-        print("\nApplying filter to dataset generation...")
+    Returns:
+        tuple: (generated_item_count, completed, incomplete_job_ids) where completed maps
+               job id -> (scenario id, run counter, items)
+    """
+    started, completed = {}, {}
+    generated_item_count = 0
+    for record in RunJournal.load(output_dir):
+        if record['type'] == 'start':
+            started[record['job']] = record
+        elif record['type'] == 'complete':
+            completed[record['job']] = (record['scenario'], record['run'], record['items'])
+            generated_item_count += record['items']
+            stats.merge(stats_from_json(record['stats']))
+    return generated_item_count, completed, set(started) - completed.keys()
+
+def resume_from_journal(output_dir, stats):
+    """
+    Rebuilds stats (a StatsCollector) from the journal of an interrupted run and discards the
+    partial outputs of its unfinished jobs.
 
-    print("\nStarting large-scale item generation...")
+    Returns:
+        tuple: (generated_item_count, completed) where completed maps (scenario id, run counter)
+               -> items, for ScenarioPlan to replay
+    """
+    generated_item_count, completed, incomplete = replay_journal(output_dir, stats)
+    if incomplete:
+        removed = discard_incomplete_job_outputs(output_dir, incomplete)
+        print(f"  Discarded {removed} partial output(s) from {len(incomplete)} interrupted job(s).")
+    print(f"  Resuming from journal: {len(completed)} completed job(s), {generated_item_count} item(s).")
+    return generated_item_count, {(scenario_id, run_counter): items for scenario_id, run_counter, items in completed.values()}
 
-    output_dir = config['general_settings']['output_directory']
-    if os.path.exists(output_dir):
-        print(f"Warning: Output directory '{output_dir}' already exists.")
+# --- Scenario Scheduling ---
+
+# Configuration: Number of parallel workers (tune based on your Azure OpenAI TPM limits)
+MAX_WORKERS = 10
+
+# Set on Ctrl-C so every scheduler stops dispatching new scenario jobs and drains
+shutdown_requested = threading.Event()
+
+def iter_scenario_runs(scenarios, start_run=1, seed=None, run_step=1):
+    """
+    Endless feed of (scenario, run_counter) pairs.
+    Each pass over the config is a "Generation Run": the scenario list is reshuffled
+    and run_counter is bumped so filenames stay unique across passes. The shuffle is
+    seeded per run, so a resumed job continues with the same order. Shards advance
+    run_counter by the shard count so their run numbers never overlap.
+    """
+    run_counter = start_run
+    while True:
+        log.info(f"--- Starting Generation Run #{run_counter} ---")
+        batch = scenarios.copy()
+        random.Random(derive_seed(seed, 'run', run_counter)).shuffle(batch)
+        for scenario in batch:
+            yield scenario, run_counter
+        run_counter += run_step
+
+def max_scenario_items(scenario):
+    """Most items one job of a scenario can produce (a thread writes at most one email per prompt)."""
+    return max(1, len(scenario['prompts'])) if scenario.get('type') == 'thread' else 1
+
+# Jobs at the end of a wave that ScenarioPlan counts at their most output rather than waiting on.
+# Fixed rather than tied to the worker count, since it shapes which jobs a seeded run dispatches.
+PLAN_WINDOW = 32
+
+class ScenarioPlan:
+    """
+    Decides which scenario jobs a run dispatches, independently of when they finish.
+
+    Jobs are taken from the feed in waves. The next job joins the wave if the items committed
+    before the wave, plus the actual output of all but the last PLAN_WINDOW jobs in the wave,
+    plus the most the rest (and the new job) can produce stays within the target. When it
+    doesn't, the plan waits for those older jobs rather than guessing, and starts a new wave
+    from the actual count once the wave has drained (a wave always takes at least one job).
+    The job list therefore depends only on the seed and the jobs' own output, never on worker
+    count, engine or timing, and the target is overshot by less than one scenario's output.
+
+    completed: (scenario id, run counter) -> items of the jobs an interrupted run already
+        finished (from its journal). They are replayed in place instead of dispatched, so a
+        resumed run generates exactly the jobs the uninterrupted run would have.
+    """
+
+    def __init__(self, scenarios, target_item_count, start_run=1, seed=None, run_step=1, completed=None):
+        self.feed = iter_scenario_runs(scenarios, start_run, seed, run_step)
+        self.upcoming = next(self.feed)
+        self.target_item_count = target_item_count
+        self.scenario_run_counts = {}  # scenario id -> occurrences taken from the feed
+        self.completed = dict(completed or {})
+        self.committed = 0         # items of finished jobs
+        self.outstanding = {}      # (scenario id, run counter) -> wave entry of a dispatched job
+        self._start_wave()
+
+    def _start_wave(self):
+        self.wave = []             # [most, items or None, position] per job, in feed order
+        self.wave_start = self.committed
+        self.window_most = 0       # most output of the wave's last PLAN_WINDOW jobs
+        self.older_items = 0       # actual output of the finished jobs before them
+        self.older_most = 0        # most output of the unfinished jobs before them
+        self.older_waiting = 0     # how many of those are unfinished
+
+    def _add(self, most, items):
+        entry = [most, items, len(self.wave)]
+        self.wave.append(entry)
+        self.window_most += most
+        if len(self.wave) > PLAN_WINDOW:
+            older = self.wave[-PLAN_WINDOW - 1]
+            self.window_most -= older[0]
+            if older[1] is None:
+                self.older_most += older[0]
+                self.older_waiting += 1
+            else:
+                self.older_items += older[1]
+        return entry
+
+    def next_job(self):
+        """
+        The next (scenario, run_counter, occurrence) to dispatch, or None if nothing can be
+        dispatched until a job finishes (or at all, once the target is met).
+        """
+        while self.committed < self.target_item_count:
+            scenario, run_counter = self.upcoming
+            most = max_scenario_items(scenario)
+            bound = self.wave_start + self.older_items + self.older_most + self.window_most + most
+            if bound > self.target_item_count and self.wave:
+                if self.older_waiting or self.outstanding:
+                    return None
+                self._start_wave()
+                continue
+
+            self.upcoming = next(self.feed)
+            scenario_id = scenario['base_filename']
+            self.scenario_run_counts[scenario_id] = self.scenario_run_counts.get(scenario_id, 0) + 1
+            items = self.completed.pop((scenario_id, run_counter), None)
+            entry = self._add(most, items)
+            if items is not None:
+                self.committed += items
+                continue
+            self.outstanding[(scenario_id, run_counter)] = entry
+            return scenario, run_counter, self.scenario_run_counts[scenario_id]
+        return None
+
+    def finish(self, job, items_created):
+        """Records the result of a job next_job() returned (0 items if it failed)."""
+        scenario, run_counter, _ = job
+        entry = self.outstanding.pop((scenario['base_filename'], run_counter))
+        entry[1] = items_created
+        self.committed += items_created
+        if entry[2] < len(self.wave) - PLAN_WINDOW:
+            self.older_most -= entry[0]
+            self.older_waiting -= 1
+            self.older_items += items_created
+
+def run_scenario_scheduler(plan, worker, on_result, max_workers=10, executor=None):
+    """
+    Long-lived work-queue scheduler for scenario jobs.
+
+    Keeps up to max_workers jobs in flight on a single thread pool and dispatches the next
+    job the plan allows the moment any slot frees, instead of waiting for a whole
+    Generation Run to drain.
+
+    Args:
+        plan: ScenarioPlan deciding which jobs run
+        worker: Callable(scenario, run_counter, current_run) executed on the pool
+        on_result: Callable(result) run on the scheduler thread; returns items created
+        max_workers: Number of concurrent scenario jobs
+        executor: Shared ThreadPoolExecutor (several jobs can share one pool); a private
+                  pool of max_workers threads is created when omitted
+
+    Returns:
+        int: Total committed item count
+    """
+    in_flight = {}  # future -> the plan's job
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    try:
+        while True:
+            # Top up the queue until every slot is busy or the plan has nothing to dispatch
+            while not shutdown_requested.is_set() and len(in_flight) < max_workers:
+                job = plan.next_job()
+                if job is None:
+                    break
+                in_flight[executor.submit(worker, *job)] = job
+
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = in_flight.pop(future)
+                items_created = on_result(future.result())
+                plan.finish(job, items_created)
+                if items_created > 0:
+                    log.info(f"  > Progress: {plan.committed} / {plan.target_item_count} total items generated.")
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+
+    return plan.committed
+
+async def run_async_scenario_scheduler(plan, worker, on_result, max_jobs=200):
+    """asyncio counterpart of run_scenario_scheduler(); worker returns a coroutine instead of running on a pool."""
+    in_flight = {}  # task -> the plan's job
+
+    while True:
+        while not shutdown_requested.is_set() and len(in_flight) < max_jobs:
+            job = plan.next_job()
+            if job is None:
+                break
+            in_flight[asyncio.create_task(worker(*job))] = job
+
+        if not in_flight:
+            break
+
+        done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            job = in_flight.pop(task)
+            items_created = on_result(task.result())
+            plan.finish(job, items_created)
+            if items_created > 0:
+                log.info(f"  > Progress: {plan.committed} / {plan.target_item_count} total items generated.")
+
+    return plan.committed
+
+
+# --- Generation Jobs ---
+
+def load_job_config(job):
+    """
+    Loads a job's config and applies its scenario filter.
+
+    Returns:
+        tuple: (config, scenario_filter), or (None, None) if the config is unusable
+    """
+    config = load_config(job['config_path'])
+    if not config: return None, None
+    print(f"\nConfiguration loaded: {job['config_path']}")
+
+    if job['scenario_filter'] is not None:
+        # Override the config's scenario_filter with the job's choice
+        config['general_settings']['scenario_filter'] = job['scenario_filter']
 
     # Apply scenario filtering
     scenario_filter = config.get('general_settings', {}).get('scenario_filter', 'all')
@@ -1904,145 +4982,294 @@ if __name__ == "__main__":
             print("\n!!! WARNING: No scenarios match the filter! Check your 'scenario_filter' setting.")
             print("    Valid options: 'all', 'antitrust', 'safety_fraud', 'hr_misconduct'")
             print("    Note: 'legal_privilege' removed - privilege scenarios (S3) now included with all investigations")
-            exit()
+            return None, None
 
     # Replace the scenarios list with the filtered version
     config['scenarios'] = filtered_scenarios
+    return config, scenario_filter
+
+def prepare_generation_job(job, resume=False):
+    """
+    Loads a job's config, applies its overrides and opens its checkpoint journal.
+
+    Returns:
+        dict: Run state shared by the workers and the report, or None if the job cannot start
+    """
+    config, scenario_filter = load_job_config(job)
+    if not config: return None
+
+    print("\nStarting large-scale item generation...")
+
+    output_dir = job['output_directory'] or config['general_settings']['output_directory']
+    if os.path.exists(output_dir):
+        print(f"Warning: Output directory '{output_dir}' already exists.")
 
-    context = build_context_block(config['company_profiles'])
-    personnel_map = build_personnel_map(config['company_profiles'])
     attachment_config = config.get('attachments', {})
-    
+
     # Pass the log size into the config dictionary so it reaches the email function
     if attachment_config:
-        attachment_config['log_size_mb'] = log_size_mb
-    
+        attachment_config['log_size_mb'] = job['log_size_mb']
+        validate_attachment_sizes(attachment_config)
+
     # --- STATS TRACKING INIT ---
-    stats = {
-        'emails': 0,
-        'calendar_events': 0,
-        'rsmf_chats': 0,
-        'attachments': 0,
-        'attachment_types': {},
-        'scenarios_triggered': {},
-        'stress_tests_triggered': [],
-        'email_dates': [],  # Track all email dates for date range calculation
-        'custodians': set()  # Track unique custodian emails
+    stats = StatsCollector()
+
+    # Shard k of N takes Generation Runs k, k+N, k+2N, ... so filenames never collide
+    shard = job.get('shard')
+    generated_item_count, completed = 0, {}
+
+    # --- CHECKPOINT JOURNAL ---
+    if resume:
+        generated_item_count, completed = resume_from_journal(output_dir, stats)
+    elif os.path.exists(os.path.join(output_dir, RunJournal.FILENAME)):
+        print(f"Warning: Starting a new journal; use --resume to continue the previous run instead.")
+
+    run = {
+        'job': job,
+        'config': config,
+        'output_dir': output_dir,
+        'scenario_filter': scenario_filter,
+        'seed': job['seed'],
+        'context': build_context_block(config['company_profiles']),
+        # Per-scenario context blocks trimmed to the people each scenario mentions (--trim-context)
+        'scenario_contexts': {scenario['base_filename']: build_scenario_context_block(config['company_profiles'], scenario)
+                              for scenario in config['scenarios']} if job['trim_context'] else {},
+        'personnel_map': build_personnel_map(config['company_profiles']),
+        'attachment_config': attachment_config,
+        'stats': stats,
+        'generated_item_count': generated_item_count,
+        # Shards take every Nth Generation Run, so their run numbers never overlap; a resumed
+        # run replays the plan from the start, skipping the jobs its journal completed
+        'plan': ScenarioPlan(config['scenarios'], job['target_item_count'], shard['index'] + 1 if shard else 1, job['seed'],
+                             shard['count'] if shard else 1, completed),
+        'journal': RunJournal(output_dir, resume=resume),
+        'container': IncrementalContainer(output_dir, CONTAINER_MODE == 'incremental-delete', resume)
+                     if job['create_container'] and CONTAINER_MODE != 'end' else None,
+        'started': time.monotonic(),
+        # A resumed run always adds to the export its earlier part flushed; shards share the
+        # final directory's Slack team so their exports merge cleanly
+        'slack_export': open_slack_export(output_dir, job['slack_merge_existing'] or resume, shard['root'] if shard else None, per_job=True)
+                        if job['chat_format'] in ['slack', 'all'] else None,
     }
+    if resume and run['slack_export']:
+        restored = restore_slack_messages(run['slack_export'], output_dir, run['personnel_map'])
+        if restored:
+            print(f"  Restored {restored} Slack message(s) of completed jobs that were never flushed.")
+    if progress_dashboard:
+        progress_dashboard.add_run(run)
+    return run
+
+def start_scenario_job(run, scenario, run_counter, current_run):
+    """
+    Builds the generation steps for one scenario occurrence.
+    Returns tuple: (steps, job)
+    """
+    scenario_id = scenario['base_filename']
+    output_dir, personnel_map, attachment_config = run['output_dir'], run['personnel_map'], run['attachment_config']
+    context = run['scenario_contexts'].get(scenario_id, run['context'])
+
+    # Every occurrence gets its own RNG, so its structure doesn't depend on worker timing
+    seed_job_rng(derive_seed(run['seed'], scenario_id, current_run))
+    dynamic_base_filename = f"{scenario['base_filename']}_r{run_counter}_{new_uuid().hex[:6]}"
+    scenario_desc = scenario['description']
+    run['journal'].record_start(dynamic_base_filename, scenario_id, run_counter)
+
+    # Each job writes into its own stats, merged into the run totals when it completes
+    job_stats = run['stats'].new_job_stats()
+    job_llm_usage.set(job_stats['llm_usage'])
+    job_profile.set(job_stats['profile'].setdefault(scenario_id, {}))
+
+    log.info(f"  Running Scenario: {scenario_desc} (Occurrence #{current_run})")
+
+    variables = scenario.get('prompt_variables', None)
+    near_dup_prob = scenario.get('near_duplicate_probability', 0.0)
+    is_noise = 'noise' in scenario['base_filename'].lower()
+    prompts_list = scenario['prompts']
+
+    # Extract temperature from llm_settings if present
+    config_temp = None
+    if 'llm_settings' in scenario and 'temperature' in scenario['llm_settings']:
+        config_temp = scenario['llm_settings']['temperature']
+
+    # Extract language settings if present
+    language_code = scenario.get('language', None)
+    language_ratio = scenario.get('language_ratio', None)
+
+    # Track stress tests
+    stress_test_triggered = None
+    if "blast_email" in scenario['base_filename']:
+        stress_test_triggered = "Blast Email Expansion"
+
+    # Generate based on scenario type
+    steps = None
+    if scenario['type'] == 'thread':
+        steps = email_thread_steps(prompts_list, dynamic_base_filename, output_dir, context, variables, personnel_map, scenario_desc, attachment_config, near_dup_prob, current_run, is_noise, job_stats, config_temp, language_code, language_ratio)
+    elif scenario['type'] == 'standalone':
+        steps = standalone_email_steps(prompts_list[0], dynamic_base_filename, output_dir, context, variables, personnel_map, scenario_desc, attachment_config, near_dup_prob, current_run, is_noise, job_stats, config_temp, language_code, language_ratio)
+    elif scenario['type'] == 'calendar_event':
+        steps = calendar_event_steps(prompts_list[0], dynamic_base_filename, output_dir, context, variables, personnel_map, current_run, is_noise, job_stats, config_temp)
+    elif scenario['type'] == 'chat':
+        steps = chat_scenario_steps(prompts_list, dynamic_base_filename, output_dir, context, variables, personnel_map, run['job']['chat_format'], current_run, is_noise, job_stats, config_temp, language_code, language_ratio)
+
+    job = {'id': dynamic_base_filename, 'scenario_id': scenario_id, 'scenario_desc': scenario_desc,
+           'run': run_counter, 'stress_test': stress_test_triggered, 'stats': job_stats}
+    return steps, job
+
+def process_scenario_worker(run, scenario, run_counter, current_run):
+    """
+    Worker function to process a single scenario in parallel.
+    Returns tuple: (items_created, job) where job is None if the scenario failed
+    """
+    try:
+        steps, job = start_scenario_job(run, scenario, run_counter, current_run)
+        items_created = run_generation_steps(steps) if steps else 0
 
-    scenario_run_counts = {}
-    generated_item_count, run_counter = 0, 1
+        if items_created > 0:
+            log.info(f"  > Generated {items_created} item(s) for this scenario.")
 
-    # Thread-safe locks for stats and counters
-    stats_lock = threading.Lock()
-    count_lock = threading.Lock()
+        return (items_created, job)
 
-    # Configuration: Number of parallel workers (tune based on your Azure OpenAI TPM limits)
-    MAX_WORKERS = 10
+    except Exception as e:
+        log.error(f"  !!! ERROR processing scenario {scenario.get('description', 'unknown')}: {e}")
+        return (0, None)
 
-    def process_scenario_worker(scenario, run_counter, scenario_run_counts_local):
-        """
-        Worker function to process a single scenario in parallel.
-        Returns tuple: (items_created, scenario_desc, scenario_updates)
-        """
-        try:
-            scenario_id = scenario['base_filename']
-            current_run = scenario_run_counts_local.get(scenario_id, 0) + 1
-
-            dynamic_base_filename = f"{scenario['base_filename']}_r{run_counter}_{uuid.uuid4().hex[:6]}"
-            scenario_desc = scenario['description']
-
-            print(f"  Running Scenario: {scenario_desc} (Occurrence #{current_run})")
-
-            variables = scenario.get('prompt_variables', None)
-            near_dup_prob = scenario.get('near_duplicate_probability', 0.0)
-            items_created = 0
-            is_noise = 'noise' in scenario['base_filename'].lower()
-            prompts_list = scenario['prompts']
-
-            # Extract temperature from llm_settings if present
-            config_temp = None
-            if 'llm_settings' in scenario and 'temperature' in scenario['llm_settings']:
-                config_temp = scenario['llm_settings']['temperature']
-
-            # Extract language settings if present
-            language_code = scenario.get('language', None)
-            language_ratio = scenario.get('language_ratio', None)
-
-            # Track stress tests
-            stress_test_triggered = None
-            if "blast_email" in scenario['base_filename']:
-                stress_test_triggered = "Blast Email Expansion"
-
-            # Generate based on scenario type
-            if scenario['type'] == 'thread':
-                items_created = generate_email_thread(prompts_list, dynamic_base_filename, output_dir, context, variables, personnel_map, scenario_desc, attachment_config, near_dup_prob, current_run, is_noise, stats, config_temp, language_code, language_ratio)
-            elif scenario['type'] == 'standalone':
-                items_created = generate_standalone_email(prompts_list[0], dynamic_base_filename, output_dir, context, variables, personnel_map, scenario_desc, attachment_config, near_dup_prob, current_run, is_noise, stats, config_temp, language_code, language_ratio)
-            elif scenario['type'] == 'calendar_event':
-                items_created = generate_calendar_event(prompts_list[0], dynamic_base_filename, output_dir, context, variables, personnel_map, current_run, is_noise, stats, config_temp)
-            elif scenario['type'] == 'chat':
-                items_created = generate_chat_scenario(prompts_list, dynamic_base_filename, output_dir, context, variables, personnel_map, chat_format_pref, current_run, is_noise, stats, config_temp, language_code, language_ratio)
+async def process_scenario_worker_async(run, file_executor, scenario, run_counter, current_run):
+    """Coroutine version of process_scenario_worker() for the async engine."""
+    try:
+        steps, job = start_scenario_job(run, scenario, run_counter, current_run)
+        items_created = await async_run_generation_steps(steps, file_executor) if steps else 0
 
-            if items_created > 0:
-                print(f"  > Generated {items_created} item(s) for this scenario.")
+        if items_created > 0:
+            log.info(f"  > Generated {items_created} item(s) for this scenario.")
 
-            return (items_created, scenario_desc, scenario_id, stress_test_triggered)
+        return (items_created, job)
 
-        except Exception as e:
-            print(f"  !!! ERROR processing scenario {scenario.get('description', 'unknown')}: {e}")
-            return (0, scenario.get('description', 'unknown'), scenario.get('base_filename', 'unknown'), None)
-
-    while generated_item_count < target_item_count:
-        print(f"\n--- Starting Generation Run #{run_counter} ---")
-        scenarios = config['scenarios'].copy()
-        random.shuffle(scenarios)
-
-        # Build list of scenarios to process in this run
-        scenarios_to_process = []
-        for scenario in scenarios:
-            if generated_item_count >= target_item_count:
-                break
-            scenarios_to_process.append(scenario)
-
-        # Process scenarios in parallel with ThreadPoolExecutor
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            # Create local copy of run counts for this batch
-            scenario_run_counts_local = scenario_run_counts.copy()
-
-            # Submit all scenarios to thread pool
-            future_to_scenario = {}
-            for scenario in scenarios_to_process:
-                # Update local run count
-                scenario_id = scenario['base_filename']
-                scenario_run_counts_local[scenario_id] = scenario_run_counts_local.get(scenario_id, 0) + 1
-
-                # Submit to thread pool
-                future = executor.submit(process_scenario_worker, scenario, run_counter, scenario_run_counts_local)
-                future_to_scenario[future] = scenario
-
-            # Collect results as they complete
-            for future in as_completed(future_to_scenario):
-                items_created, scenario_desc, scenario_id, stress_test = future.result()
-
-                # Thread-safe updates to shared state
-                with stats_lock:
-                    stats['scenarios_triggered'][scenario_desc] = stats['scenarios_triggered'].get(scenario_desc, 0) + 1
-                    if stress_test and stress_test not in stats['stress_tests_triggered']:
-                        stats['stress_tests_triggered'].append(stress_test)
-
-                with count_lock:
-                    scenario_run_counts[scenario_id] = scenario_run_counts.get(scenario_id, 0) + 1
-                    if items_created > 0:
-                        generated_item_count += items_created
-                        print(f"  > Progress: {generated_item_count} / {target_item_count} total items generated.")
-
-        run_counter += 1
+    except Exception as e:
+        log.error(f"  !!! ERROR processing scenario {scenario.get('description', 'unknown')}: {e}")
+        return (0, None)
+
+def collect_scenario_result(run, result):
+    """Folds a finished job into the run stats and journals it; runs on the scheduler thread."""
+    items_created, job = result
+    if job is None:
+        return 0
+
+    job_stats = job['stats']
+    job_stats['scenarios_triggered'][job['scenario_desc']] = job_stats['scenarios_triggered'].get(job['scenario_desc'], 0) + 1
+    if job['stress_test']:
+        job_stats['stress_tests_triggered'].append(job['stress_test'])
+
+    run['stats'].merge(job_stats)
+    # A job's Slack messages are journaled with it and only then released to the export, so a
+    # crash can't leave them on disk for a job that is regenerated, nor lose them for one that isn't
+    slack_chats = run['slack_export'].pop_job(job['id']) if run['slack_export'] else None
+    run['journal'].record_complete(job['id'], job['scenario_id'], job['run'], items_created, job_stats, slack_chats)
+    if run['container']:
+        run['container'].add_files(job_stats['files_written'])
+    if run['slack_export']:
+        run['slack_export'].commit_chats(slack_chats)
+        # The 'complete' records must be on disk before the messages they cover
+        run['slack_export'].maybe_flush(run['journal'].sync)
+    if progress_dashboard:
+        progress_dashboard.record_items(items_created)
+
+    return items_created
+
+# Profile entry for whole-run work (Slack flush, container, protocol) rather than a scenario
+RUN_PROFILE_KEY = '(post-processing)'
+PROFILE_CSV_FIELDS = ['scenario', 'item_type', 'stage', 'count', 'seconds', 'avg_ms', 'max_ms', 'queue_seconds', 'network_seconds',
+                      'retries', 'rate_limited', 'failed', 'prompt_tokens', 'cached_tokens', 'completion_tokens']
+
+def close_run_outputs(run):
+    """Closes a run's journal and container zips and flushes its Slack export (profiled as post-processing)."""
+    run['journal'].close()
+    if run['container']:
+        run['container'].close()
+    start = time.perf_counter()
+    close_slack_export(run['output_dir'])
+    if run['slack_export']:
+        record_stage('slack_export_flush', 'run', time.perf_counter() - start, run['stats'].totals['profile'].setdefault(RUN_PROFILE_KEY, {}))
+
+def summarize_profile(profile):
+    """Totals per (item type, stage) across scenarios, plus LLM seconds per scenario."""
+    by_stage, llm_by_scenario = {}, {}
+    for scenario, item_types in profile.items():
+        for item_type, stages in item_types.items():
+            for stage, entry in stages.items():
+                target = by_stage.setdefault((item_type, stage), {})
+                for name, value in entry.items():
+                    target[name] = max(target.get(name, 0), value) if name == 'max_seconds' else target.get(name, 0) + value
+                if stage == 'llm':
+                    llm_by_scenario[scenario] = llm_by_scenario.get(scenario, 0) + entry['seconds']
+    return by_stage, llm_by_scenario
+
+def write_run_profile(output_dir, profile, wall_seconds=None):
+    """Writes run_profile.json (nested totals) and run_profile.csv (one row per scenario/item type/stage)."""
+    with open(os.path.join(output_dir, 'run_profile.json'), 'w', encoding='utf-8') as f:
+        json.dump({'wall_seconds': wall_seconds, 'max_workers': MAX_WORKERS, 'profile': profile}, f, indent=2)
+    with open(os.path.join(output_dir, 'run_profile.csv'), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=PROFILE_CSV_FIELDS)
+        writer.writeheader()
+        for scenario, item_types in sorted(profile.items()):
+            for item_type, stages in sorted(item_types.items()):
+                for stage, entry in sorted(stages.items()):
+                    writer.writerow({**{name: round(entry[name], 4) if isinstance(entry.get(name), float) else entry.get(name, '') for name in PROFILE_CSV_FIELDS[3:]},
+                                     'scenario': scenario, 'item_type': item_type, 'stage': stage,
+                                     'avg_ms': round(entry['seconds'] / entry['count'] * 1000, 1) if entry['count'] else 0,
+                                     'max_ms': round(entry['max_seconds'] * 1000, 1)})
+
+def print_profile_report(profile, wall_seconds=None):
+    """The RUN PROFILE section of the certification report."""
+    by_stage, llm_by_scenario = summarize_profile(profile)
+    llm = {}
+    for (item_type, stage), entry in by_stage.items():
+        if stage == 'llm':
+            for name, value in entry.items():
+                llm[name] = llm.get(name, 0) + value
+
+    print(f"\n[5] RUN PROFILE")
+    if wall_seconds:
+        print(f"    Wall Time:                {wall_seconds:.1f}s")
+    if llm.get('count'):
+        print(f"    LLM Calls:                {llm['count']} (avg {llm['seconds'] / llm['count']:.2f}s: "
+              f"{llm['queue_seconds'] / llm['count']:.2f}s waiting for quota/slots, {llm['network_seconds'] / llm['count']:.2f}s on the network)")
+        print(f"    Retries / 429s / Failed:  {llm['retries']} / {llm['rate_limited']} / {llm['failed']}")
+        tokens_per_call = (llm['prompt_tokens'] + llm['completion_tokens']) / llm['count']
+        network_per_call = llm['network_seconds'] / llm['count']
+        if network_per_call > 0:
+            # Each concurrent request sustains 60 / latency calls per minute
+            per_slot_tpm = tokens_per_call * 60 / network_per_call
+            print(f"    Sizing:                   {tokens_per_call:,.0f} tokens/call; each concurrent call sustains ~{per_slot_tpm:,.0f} TPM,")
+            print(f"                              so {MAX_WORKERS} workers can use ~{per_slot_tpm * MAX_WORKERS:,.0f} TPM")
+    print(f"    ---------------------------------------")
+    print(f"    {'Stage':<28} {'Count':>7} {'Total (s)':>10} {'Avg (ms)':>10} {'Max (ms)':>10}")
+    for (item_type, stage), entry in sorted(by_stage.items(), key=lambda item: -item[1]['seconds']):
+        print(f"    {stage + ' / ' + item_type:<28} {entry['count']:>7} {entry['seconds']:>10.1f} "
+              f"{entry['seconds'] / entry['count'] * 1000 if entry['count'] else 0:>10.1f} {entry['max_seconds'] * 1000:>10.1f}")
+    if llm_by_scenario:
+        slowest = sorted(llm_by_scenario.items(), key=lambda item: -item[1])[:3]
+        print(f"    Most LLM Time:            {', '.join(f'{scenario} ({seconds:.0f}s)' for scenario, seconds in slowest)}")
+
+def finish_generation_job(run):
+    """Post-processing for a completed job: nested container, certification report and protocol document."""
+    stats, output_dir, config = run['stats'].totals, run['output_dir'], run['config']
+    scenario_filter = run['scenario_filter']
+    log_size_mb = run['job']['log_size_mb']
+    create_container = run['job']['create_container']
+    generate_protocol = run['job']['generate_protocol']
+
+    run_profile = stats['profile'].setdefault(RUN_PROFILE_KEY, {})
 
     # --- POST PROCESSING: NESTED CONTAINER ---
     if create_container:
-        create_nested_containers(output_dir)
-        stats['stress_tests_triggered'].append("Recursive Containerization")
+        start = time.perf_counter()
+        seed_job_rng(derive_seed(run['job']['seed'], 'container'))
+        if run.get('container'):
+            tar_name = run['container'].seal()
+        else:
+            tar_name = create_nested_containers(output_dir)
+        record_stage('container', 'run', time.perf_counter() - start, run_profile)
+        stats['stress_tests_triggered'].append("Recursive Containerization" if tar_name else "Recursive Containerization (FAILED/INCOMPLETE - see log)")
 
     # --- REPORT GENERATION LOGIC ---
     total_docs = stats['emails'] + stats['calendar_events'] + stats.get('rsmf_chats', 0) + stats['attachments']
@@ -2082,6 +5309,8 @@ if __name__ == "__main__":
 
     noise_description = ", ".join(noise_types) if noise_types else "Business noise"
 
+    if progress_dashboard:
+        progress_dashboard.job_done()
     print("\n" + "="*80)
     print(f"   SYNTHETIC DATASET CERTIFICATION REPORT   |   {datetime.now().strftime('%Y-%m-%d %H:%M')}")
     print("="*80)
@@ -2089,9 +5318,9 @@ if __name__ == "__main__":
     # Calculate date range and custodian statistics
     date_range_str = "N/A"
     days_span = 0
-    if stats['email_dates']:
-        min_date = min(stats['email_dates'])
-        max_date = max(stats['email_dates'])
+    if stats['date_min']:
+        min_date = stats['date_min']
+        max_date = stats['date_max']
         days_span = (max_date - min_date).days + 1
         date_range_str = f"{min_date.strftime('%b %d, %Y')} - {max_date.strftime('%b %d, %Y')} ({days_span} days)"
 
@@ -2102,6 +5331,9 @@ if __name__ == "__main__":
     print(f"\n[1] DATASET VOLUME & DIVERSITY")
     print(f"    Total Readable Documents: {total_docs}")
     print(f"    Simulated Date Range:     {date_range_str}")
+    if stats['date_histogram']:
+        peak_day, peak_count = max(stats['date_histogram'].items(), key=lambda item: item[1])
+        print(f"    Busiest Day:              {datetime.strptime(peak_day, '%Y-%m-%d').strftime('%b %d, %Y')} ({peak_count} items)")
     print(f"    Active Custodians:        {total_custodians}")
     print(f"    ---------------------------------------")
     print(f"    • Emails (.eml):             {stats['emails']:<5} (RFC-compliant, headers included)")
@@ -2155,12 +5387,701 @@ if __name__ == "__main__":
 
     # Generate protocol document if requested
     if generate_protocol:
+        start = time.perf_counter()
         generate_protocol_document(output_dir, scenario_filter, config)
+        record_stage('protocol', 'run', time.perf_counter() - start, run_profile)
 
     print(f"\n[4] OUTPUT LOCATION")
     print(f"    Directory: {os.path.abspath(output_dir)}")
     if create_container:
-        print(f"    Archive:   Dataset_Nested_Export_*.tar.gz")
+        print(f"    Archive:   Dataset_Nested_Export_*{CONTAINER_EXTENSIONS[CONTAINER_COMPRESSION]}")
     if generate_protocol:
         print(f"    Protocol:  INVESTIGATION_PROTOCOL.md")
-    print("="*80)
\ No newline at end of file
+    print(f"    Profile:   run_profile.json / run_profile.csv")
+
+    wall_seconds = time.monotonic() - run['started'] if run.get('started') else None
+    print_profile_report(stats['profile'], wall_seconds)
+    cache_hits, cache_misses = stats['llm_usage'].get('cache_hits', 0), stats['llm_usage'].get('cache_misses', 0)
+    if cache_hits + cache_misses:
+        print(f"    LLM Response Cache:       {cache_hits} hits / {cache_misses} misses ({cache_hits / (cache_hits + cache_misses):.0%} hit rate)")
+    write_run_profile(output_dir, stats['profile'], wall_seconds)
+    print("="*80)
+
+# Serializes whole-job post-processing when jobs run concurrently so reports don't interleave
+report_lock = threading.Lock()
+
+def run_generation_job(job, executor, resume=False):
+    """
+    Runs one job on the thread engine, dispatching its scenario jobs onto the shared executor.
+    Returns the run state, or None if the job could not start or was interrupted.
+    """
+    if shutdown_requested.is_set(): return None
+    run = prepare_generation_job(job, resume)
+    if not run:
+        if progress_dashboard: progress_dashboard.job_done()
+        return None
+
+    try:
+        run['generated_item_count'] = run_scenario_scheduler(
+            run['plan'], functools.partial(process_scenario_worker, run), functools.partial(collect_scenario_result, run),
+            MAX_WORKERS, executor)
+    finally:
+        close_run_outputs(run)
+
+    if shutdown_requested.is_set():
+        return None
+    with report_lock:
+        finish_generation_job(run)
+    return run
+
+async def async_run_generation_job(job, file_executor, max_inflight_requests, resume=False):
+    """asyncio counterpart of run_generation_job(); config loading and reports run off the event loop."""
+    if shutdown_requested.is_set(): return None
+    run = await asyncio.to_thread(prepare_generation_job, job, resume)
+    if not run:
+        if progress_dashboard: progress_dashboard.job_done()
+        return None
+
+    try:
+        run['generated_item_count'] = await run_async_scenario_scheduler(
+            run['plan'], functools.partial(process_scenario_worker_async, run, file_executor), functools.partial(collect_scenario_result, run),
+            max_inflight_requests)
+    finally:
+        close_run_outputs(run)
+
+    if shutdown_requested.is_set():
+        return None
+    def finish():
+        with report_lock:
+            finish_generation_job(run)
+    await asyncio.to_thread(finish)
+    return run
+
+# --- Batch Engine ---
+# --engine batch drives the same generation steps round by round. Every scenario job
+# runs until it needs the LLM and parks; the parked requests of all jobs then go out as
+# one batch (see execute_batch_round) and the answers resume the jobs until they park on
+# their next request - a thread's next reply, an email's attachment texts. Writers and
+# rendering run between rounds on MAX_WORKERS threads. All jobs of an invocation share
+# the rounds.
+
+# Times a request failed by the batch is resubmitted in a later round before its fallback is used
+BATCH_MAX_ATTEMPTS = 3
+
+class BatchTask:
+    """Generation steps (a scenario job, or BackgroundSteps inside one) driven by the batch engine."""
+
+    def __init__(self, steps, context, run=None, job=None, scenario=None):
+        self.steps = steps
+        self.context = context       # the job's RNG and usage counters live here
+        self.run, self.job, self.scenario = run, job, scenario  # scenario jobs only
+        self.plan_job = None         # what the run's ScenarioPlan dispatched (scenario jobs only)
+        self.requests = []           # LLMRequests parked for the next round
+        self.answers = []
+        self.attempts = []
+        self.unanswered = []         # indexes still waiting for an answer
+        self.single = True           # parked on one LLMRequest rather than a list
+        self.done = False
+        self.result = None
+        self.error = None
+        self.joiner = None           # task parked on JoinSteps for this one
+
+def is_llm_step(step):
+    """True for the steps the batch engine answers in rounds: an LLMRequest or a list of them."""
+    return isinstance(step, LLMRequest) or (isinstance(step, list) and bool(step) and isinstance(step[0], LLMRequest))
+
+class BatchEngine:
+    """Parks generation steps on their LLM requests and answers them a round at a time."""
+
+    def __init__(self, workers, local_workers=200):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.local_workers = local_workers
+        self.lock = threading.Lock()
+        self.parked = []
+        self.finished = []
+        self.rounds = 0
+
+    def start(self, run, scenario, run_counter, current_run):
+        """Begins a scenario job in a fresh context; returns the future of its first advance."""
+        context = contextvars.Context()
+        return self.executor.submit(self._start, context, run, scenario, run_counter, current_run)
+
+    def _start(self, context, run, scenario, run_counter, current_run):
+        task = BatchTask(None, context, run, None, scenario)
+        task.plan_job = (scenario, run_counter, current_run)
+        try:
+            task.steps, task.job = context.run(start_scenario_job, run, scenario, run_counter, current_run)
+        except Exception as e:
+            self._complete(task, None, e)
+            return
+        if task.steps:
+            self.advance(task)
+        else:
+            self._complete(task, 0, None)
+
+    def advance(self, task, value=None, error=None):
+        """Runs task until it parks on the LLM or a join, or finishes (resuming a task joined on it)."""
+        while task:
+            try:
+                if error is not None:
+                    step = task.context.run(task.steps.throw, error)
+                else:
+                    step = task.context.run(task.steps.send, value)
+            except StopIteration as done:
+                task, value, error = self._complete(task, done.value, None)
+                continue
+            except Exception as e:
+                task, value, error = self._complete(task, None, e)
+                continue
+
+            value, error = None, None
+            if is_llm_step(step):
+                self._park(task, step)
+                return
+            if isinstance(step, BackgroundSteps):
+                child = BatchTask(step.steps, task.context.copy())
+                child.context.run(seed_job_rng, step.seed)
+                self.advance(child)
+                value = child
+            elif isinstance(step, JoinSteps):
+                with self.lock:
+                    if not step.handle.done:
+                        step.handle.joiner = task
+                        return
+                value, error = step.handle.result, step.handle.error
+            else:
+                try:
+                    value = task.context.run(execute_generation_step, step)
+                except Exception as e:
+                    error = e
+
+    def _park(self, task, step):
+        task.single = not isinstance(step, list)
+        task.requests = [step] if task.single else list(step)
+        task.answers = [None] * len(task.requests)
+        task.attempts = [0] * len(task.requests)
+        task.unanswered = list(range(len(task.requests)))
+        with self.lock:
+            self.parked.append(task)
+
+    def _complete(self, task, result, error):
+        """Marks task finished; returns (joiner, result, error) so a waiting task can continue."""
+        with self.lock:
+            task.done, task.result, task.error = True, result, error
+            if task.run is not None:
+                self.finished.append(task)
+            return task.joiner, result, error
+
+    def take_finished(self):
+        """Scenario jobs that finished since the last call."""
+        with self.lock:
+            finished, self.finished = self.finished, []
+        return finished
+
+    def run_round(self):
+        """
+        Answers every parked request (from the response cache where possible, otherwise
+        through one batch) and resumes the tasks whose requests are all answered.
+        Returns False when nothing was parked.
+        """
+        with self.lock:
+            parked, self.parked = self.parked, []
+        if not parked:
+            return False
+
+        outstanding = []  # (task, index, request, cache key)
+        cache_hits = 0
+        for task in parked:
+            unanswered = []
+            for index in task.unanswered:
+                request = task.requests[index]
+                cache_key, cached = lookup_cached_response(request, build_chat_api_kwargs(request))
+                if cached is not None:
+                    task.answers[index] = cached
+                    cache_hits += 1
+                else:
+                    outstanding.append((task, index, request, cache_key))
+                    unanswered.append(index)
+            task.unanswered = unanswered
+
+        if outstanding:
+            self.rounds += 1
+            log.info(f"[Batch Round {self.rounds}] {len(outstanding)} request(s) from {len(parked)} task(s)"
+                     f"{f', {cache_hits} answered from cache' if cache_hits else ''}...")
+            round_start = time.monotonic()
+            if progress_dashboard:
+                progress_dashboard.llm_started(len(outstanding))
+            try:
+                completions = execute_batch_round([request for _, _, request, _ in outstanding], self.rounds, self.local_workers)
+            finally:
+                if progress_dashboard:
+                    progress_dashboard.llm_finished(len(outstanding))
+            failed = 0
+            for (task, index, request, cache_key), completion in zip(outstanding, completions):
+                if isinstance(completion, Exception):
+                    failed += 1
+                    task.attempts[index] += 1
+                    if task.attempts[index] < BATCH_MAX_ATTEMPTS:
+                        continue
+                    task.context.run(record_llm_call, request, None)
+                    task.answers[index] = handle_llm_request_error(request, completion)
+                else:
+                    task.context.run(record_llm_call, request, completion)
+                    parsed = parse_llm_response(request, completion.content)
+                    store_cached_response(cache_key, completion.content, parsed)
+                    task.answers[index] = parsed
+                task.unanswered.remove(index)
+            log.info(f"  > Batch round {self.rounds} finished in {time.monotonic() - round_start:.1f}s"
+                  f"{f' ({failed} failed request(s), retried next round up to {BATCH_MAX_ATTEMPTS} attempts)' if failed else ''}.")
+
+        ready = []
+        for task in parked:
+            # Requests the batch failed stay parked for the next round
+            if task.unanswered:
+                with self.lock:
+                    self.parked.append(task)
+            else:
+                ready.append(task)
+
+        futures = [self.executor.submit(self.advance, task, task.answers[0] if task.single else task.answers) for task in ready]
+        for future in futures:
+            future.result()
+        return True
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+def run_batch_generation_jobs(jobs, max_inflight_requests=200, resume=False):
+    """
+    Runs every job on the batch engine. Each job dispatches every scenario job its plan
+    allows up front (topping up after each round once a wave has drained), so a round
+    carries every request the runs can make at that point.
+
+    Returns:
+        list: Run state per job (None for jobs that failed to start)
+    """
+    local = BATCH_LOCAL or not hasattr(get_llm_backend(), 'submit_batch')
+    print(f"Using batch engine ({'local stand-in, ' + str(max_inflight_requests) + ' concurrent requests' if local else 'Azure OpenAI Batch API'}; round files in {os.path.abspath(BATCH_DIR)}).")
+    runs = [prepare_generation_job(job, resume) for job in jobs]
+    if progress_dashboard:
+        for run in runs:
+            if not run: progress_dashboard.job_done()
+    engine = BatchEngine(MAX_WORKERS, max_inflight_requests)
+
+    def top_up():
+        futures = []
+        for run in runs:
+            if not run: continue
+            while (job := run['plan'].next_job()) is not None:
+                futures.append(engine.start(run, *job))
+        for future in futures:
+            future.result()
+
+    def collect():
+        for task in engine.take_finished():
+            run = task.run
+            if task.error is not None:
+                log.error(f"  !!! ERROR processing scenario {task.scenario.get('description', 'unknown')}: {task.error}")
+                run['plan'].finish(task.plan_job, 0)
+                continue
+            items_created = collect_scenario_result(run, (task.result or 0, task.job))
+            run['plan'].finish(task.plan_job, items_created)
+            run['generated_item_count'] = run['plan'].committed
+            if items_created > 0:
+                log.info(f"  > Progress: {run['plan'].committed} / {run['job']['target_item_count']} total items generated.")
+
+    try:
+        top_up()
+        while True:
+            collect()
+            top_up()
+            if not engine.run_round():
+                break
+    finally:
+        engine.shutdown()
+        for run in runs:
+            if run:
+                close_run_outputs(run)
+        if os.path.isdir(BATCH_DIR) and not os.listdir(BATCH_DIR):
+            os.rmdir(BATCH_DIR)
+
+    for run in runs:
+        if run:
+            with report_lock:
+                finish_generation_job(run)
+    return runs
+
+def run_generation_jobs(jobs, engine='thread', concurrent=False, max_inflight_requests=200, file_workers=4, resume=False):
+    """
+    Runs every job of an invocation over one shared client, rate limiter and worker pool.
+
+    With concurrent=False jobs run back-to-back; with concurrent=True they run side by side
+    and their scenario jobs compete for the same MAX_WORKERS slots (thread engine) or the same
+    max_inflight_requests LLM slots (async engine), so the deployment quota is never exceeded.
+    The batch engine always runs the jobs together, sharing its rounds.
+
+    Returns:
+        list: Run state per job (None for jobs that failed to start)
+    """
+    if engine == 'batch':
+        return run_batch_generation_jobs(jobs, max_inflight_requests, resume)
+
+    if engine == 'async':
+        print(f"Using asyncio engine (max {max_inflight_requests} in-flight requests).")
+
+        async def _run():
+            global async_llm_slots
+            async_llm_slots = asyncio.Semaphore(max_inflight_requests)
+            # Like the thread engine, the first Ctrl-C lets in-flight scenario jobs finish and
+            # journal; a second one cancels them
+            loop, main_task = asyncio.get_running_loop(), asyncio.current_task()
+            def request_shutdown():
+                if shutdown_requested.is_set():
+                    main_task.cancel()
+                shutdown_requested.set()
+            try:
+                loop.add_signal_handler(signal.SIGINT, request_shutdown)
+                handling_sigint = True
+            except (NotImplementedError, RuntimeError, ValueError):
+                handling_sigint = False  # Windows event loops, or not on the main thread
+            try:
+                # File writers run on a small thread pool so the event loop never blocks on disk
+                with ThreadPoolExecutor(max_workers=file_workers) as file_executor:
+                    if concurrent:
+                        return await asyncio.gather(*(async_run_generation_job(job, file_executor, max_inflight_requests, resume) for job in jobs))
+                    return [await async_run_generation_job(job, file_executor, max_inflight_requests, resume) for job in jobs]
+            finally:
+                if handling_sigint:
+                    loop.remove_signal_handler(signal.SIGINT)
+
+        try:
+            runs = asyncio.run(_run())
+        except asyncio.CancelledError:
+            raise KeyboardInterrupt
+        if shutdown_requested.is_set():
+            raise KeyboardInterrupt
+        return runs
+
+    # Job schedulers run on their own threads (one at a time unless concurrent) so the main
+    # thread stays free to catch Ctrl-C and tell every scheduler to drain
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, \
+         ThreadPoolExecutor(max_workers=len(jobs) if concurrent else 1) as job_threads:
+        futures = [job_threads.submit(run_generation_job, job, executor, resume) for job in jobs]
+        try:
+            return [future.result() for future in futures]
+        except KeyboardInterrupt:
+            # Let in-flight scenario jobs finish and journal before the pools shut down
+            shutdown_requested.set()
+            job_threads.shutdown(wait=False, cancel_futures=True)
+            raise
+
+# --- Sharded Generation ---
+# A job can be split into N shards that run as separate processes: --shards N starts them
+# on this machine, --shard K/N runs one shard (e.g. one per host, all writing to a shared
+# filesystem). Each shard is a complete job in <output>/shards/shard-K-of-N with its own
+# journal, seed and Generation Run numbers, so shards never touch each other's files.
+# merge_shards() then moves the items into <output>, merges the Slack exports and writes
+# one certification report from the shards' journals.
+
+SHARDS_DIRNAME = 'shards'
+
+def parse_shard_spec(value):
+    """Parses 'K/N' (1-based) into (index, count); returns None when malformed."""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", value or '')
+    if not match:
+        return None
+    number, count = int(match.group(1)), int(match.group(2))
+    return (number - 1, count) if 1 <= number <= count else None
+
+def shard_directory(root, index, count):
+    """Working directory of shard index (0-based) of count."""
+    return os.path.join(root, SHARDS_DIRNAME, f"shard-{index + 1:03d}-of-{count:03d}")
+
+def build_shard_job(job, index, count, root):
+    """The part of job that shard index of count generates, in its own directory."""
+    share = job['target_item_count'] // count + (1 if index < job['target_item_count'] % count else 0)
+    return {**job,
+            'target_item_count': share,
+            'output_directory': shard_directory(root, index, count),
+            'seed': derive_seed(job['seed'], 'shard', index, count),
+            # Containers, protocol and the combined report are produced by merge_shards()
+            'create_container': False,
+            'generate_protocol': False,
+            'shard': {'index': index, 'count': count, 'root': root}}
+
+def strip_cli_option(argv, option):
+    """Removes `option value` / `option=value` from an argument list."""
+    stripped, skip = [], False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == option:
+            skip = True
+        elif not arg.startswith(option + '='):
+            stripped.append(arg)
+    return stripped
+
+def run_local_shards(argv, count, log_dir):
+    """
+    Runs every shard of this invocation as a child process (`app.py <argv> --shard K/N`).
+    Each child logs to log_dir/shard-K-of-N.log. Returns True if all shards succeeded.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    env = {**os.environ, 'PYTHONUNBUFFERED': '1'}
+    shards = []
+    for index in range(count):
+        log_path = os.path.join(log_dir, f"shard-{index + 1:03d}-of-{count:03d}.log")
+        log_file = open(log_path, 'w', encoding='utf-8')
+        command = [sys.executable, os.path.abspath(__file__), *argv, '--shard', f"{index + 1}/{count}"]
+        shards.append((subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT, env=env), log_file, log_path))
+    print(f"\nStarted {count} shard processes (logs: {os.path.abspath(log_dir)})")
+
+    try:
+        for index, (process, log_file, log_path) in enumerate(shards):
+            process.wait()
+            print(f"  Shard {index + 1}/{count} {'finished' if process.returncode == 0 else f'FAILED (exit {process.returncode}, see {log_path})'}")
+    except KeyboardInterrupt:
+        # The shards received the same Ctrl-C; let them journal their in-flight work and exit
+        for process, _, _ in shards:
+            process.wait()
+        raise
+    finally:
+        for _, log_file, _ in shards:
+            log_file.close()
+    return all(process.returncode == 0 for process, _, _ in shards)
+
+def move_shard_outputs(shard_dir, output_dir):
+    """Moves a shard's items to the same relative paths under output_dir (journal, log and Slack export stay)."""
+    moved = 0
+    for entry in os.listdir(shard_dir):
+        if entry in (RunJournal.FILENAME, LOG_FILENAME, 'slack_export'):
+            continue
+        source = os.path.join(shard_dir, entry)
+        target = os.path.join(output_dir, entry)
+        if not os.path.isdir(source):
+            os.replace(source, target)
+            moved += 1
+            continue
+        for dirpath, _, filenames in os.walk(source):
+            target_dir = os.path.join(target, os.path.relpath(dirpath, source))
+            os.makedirs(target_dir, exist_ok=True)
+            for filename in filenames:
+                # A rename keeps the hard links between custodian copies intact
+                os.replace(os.path.join(dirpath, filename), os.path.join(target_dir, filename))
+                moved += 1
+        shutil.rmtree(source)
+    return moved
+
+def merge_slack_exports(shard_dirs, output_dir):
+    """
+    Merges the shards' Slack exports into output_dir/slack_export, adding to any export
+    already there. Channel-days only one shard wrote are moved as-is; the rest are combined
+    one channel-day at a time, so memory stays bounded. Merged shard exports are removed.
+    """
+    sources = [os.path.join(d, 'slack_export') for d in shard_dirs if os.path.isdir(os.path.join(d, 'slack_export'))]
+    if not sources:
+        return
+    load_json = SlackExportAggregator._load_json
+    slack_root = os.path.join(output_dir, 'slack_export')
+    os.makedirs(slack_root, exist_ok=True)
+    users = {u['id']: u for u in load_json(os.path.join(slack_root, 'users.json'))}
+    channels = {c['id']: c for c in load_json(os.path.join(slack_root, 'channels.json'))}
+    day_files = {}  # (channel_name, 'YYYY-MM-DD.json') -> shard files
+
+    for source in sources:
+        for user in load_json(os.path.join(source, 'users.json')):
+            users.setdefault(user['id'], user)
+        for channel in load_json(os.path.join(source, 'channels.json')):
+            known = channels.setdefault(channel['id'], channel)
+            if known is not channel:
+                known['members'] = list(dict.fromkeys(known['members'] + channel['members']))
+                known['created'] = min(known['created'], channel['created'])
+        for channel_name in os.listdir(source):
+            channel_dir = os.path.join(source, channel_name)
+            if os.path.isdir(channel_dir):
+                for date_filename in os.listdir(channel_dir):
+                    day_files.setdefault((channel_name, date_filename), []).append(os.path.join(channel_dir, date_filename))
+
+    for (channel_name, date_filename), paths in day_files.items():
+        os.makedirs(os.path.join(slack_root, channel_name), exist_ok=True)
+        target = os.path.join(slack_root, channel_name, date_filename)
+        if len(paths) == 1 and not os.path.exists(target):
+            os.replace(paths[0], target)
+            continue
+        messages = load_json(target)
+        for path in paths:
+            messages.extend(load_json(path))
+        messages.sort(key=lambda x: float(x['ts']))
+        with open(target, 'w', encoding='utf-8') as f: json.dump(messages, f, indent=4)
+
+    with open(os.path.join(slack_root, 'users.json'), 'w', encoding='utf-8') as f: json.dump(list(users.values()), f, indent=4)
+    with open(os.path.join(slack_root, 'channels.json'), 'w', encoding='utf-8') as f: json.dump(list(channels.values()), f, indent=4)
+    for source in sources:
+        shutil.rmtree(source)
+    print(f"  > Merged {len(sources)} Slack export(s) ({len(day_files)} channel-days).")
+
+def merge_shards(job):
+    """
+    Combines the shards of a job into its output directory and writes the combined
+    certification report (plus container/protocol if requested). Safe to re-run: items
+    and Slack exports already merged are skipped and stats are rebuilt from the journals.
+
+    Returns:
+        dict: Run state for the merged job, or None if there was nothing to merge
+    """
+    config, scenario_filter = load_job_config(job)
+    if not config: return None
+    output_dir = job['output_directory'] or config['general_settings']['output_directory']
+    shard_dirs = sorted(d for d in glob.glob(os.path.join(output_dir, SHARDS_DIRNAME, 'shard-*-of-*')) if os.path.isdir(d))
+    if not shard_dirs:
+        print(f"Error: No shards found under '{os.path.join(output_dir, SHARDS_DIRNAME)}'.")
+        return None
+
+    print(f"\n--- Merging {len(shard_dirs)} shard(s) into {output_dir} ---")
+    stats = StatsCollector()
+    generated_item_count = 0
+    personnel_map = build_personnel_map(config['company_profiles'])
+    for shard_dir in shard_dirs:
+        items, completed, incomplete = replay_journal(shard_dir, stats)
+        # A shard that crashed may not have flushed its last completed jobs' Slack messages
+        shard_export = SlackExportAggregator(shard_dir, merge_existing=True, team_key=output_dir)
+        if restore_slack_messages(shard_export, shard_dir, personnel_map):
+            shard_export.flush()
+        if incomplete:
+            # Interrupted jobs left partial files; they were never counted, so drop them
+            removed = discard_incomplete_job_outputs(shard_dir, incomplete)
+            print(f"  Warning: {os.path.basename(shard_dir)} has {len(incomplete)} interrupted job(s); discarded {removed} partial output(s). Resume that shard first to reach the full count.")
+        moved = move_shard_outputs(shard_dir, output_dir)
+        generated_item_count += items
+        print(f"  > {os.path.basename(shard_dir)}: {len(completed)} job(s), {items} item(s), {moved} file(s) moved")
+    merge_slack_exports(shard_dirs, output_dir)
+
+    run = {'job': job, 'config': config, 'output_dir': output_dir, 'scenario_filter': scenario_filter,
+           'stats': stats, 'generated_item_count': generated_item_count}
+    with report_lock:
+        finish_generation_job(run)
+    return run
+
+# --- Main Orchestration Logic ---
+if __name__ == "__main__":
+    cli_args = parse_cli_args()
+    MAX_WORKERS = cli_args.max_workers
+    CUSTODIAN_COPY_MODE = cli_args.custodian_copies
+    ATTACHMENT_WORKERS = cli_args.attachment_workers
+    RENDER_PROCESSES = cli_args.render_processes
+    PDF_FLATE = not cli_args.pdf_uncompressed
+    XLSX_DATA_ROWS = cli_args.xlsx_rows
+    CONTAINER_COMPRESSION = cli_args.container_compression
+    CONTAINER_WORKERS = cli_args.container_workers
+    CONTAINER_MODE = cli_args.container_mode
+    BATCH_SIZE = cli_args.batch_size
+    BATCH_POLL_SECONDS = cli_args.batch_poll_seconds
+    BATCH_DIR = cli_args.batch_dir
+    BATCH_LOCAL = cli_args.batch_local
+    MASTER_SEED = cli_args.seed if cli_args.seed is not None else random.SystemRandom().getrandbits(32)
+    if cli_args.reference_date:
+        REFERENCE_NOW = datetime.strptime(cli_args.reference_date, "%Y-%m-%d")
+    elif cli_args.seed is not None:
+        REFERENCE_NOW = datetime.combine(datetime.now().date(), datetime.min.time())
+    shard_spec = parse_shard_spec(cli_args.shard) if cli_args.shard else None
+    # --shards and --merge-shards only coordinate; the LLM is called from the shard processes
+    if not (cli_args.shards or cli_args.merge_shards):
+        configure_llm_backend(cli_args.backend, cli_args.mock_latency_ms, cli_args.mock_latency_sigma,
+                              cli_args.mock_error_rate, cli_args.mock_429_rate, cli_args.mock_seed)
+        # Shards share the deployment's quota, so each one paces itself to its part of it
+        configure_rate_limiter(cli_args.rpm, cli_args.tpm, cli_args.quota_utilization / (shard_spec[1] if shard_spec else 1))
+        configure_response_cache(cli_args.response_cache, cli_args.cache_max_mb, cli_args.cache_max_age_days)
+
+    selected_model = cli_args.model
+    concurrent_jobs = cli_args.concurrent_jobs
+    if cli_args.jobs:
+        jobs, spec_settings = load_job_spec(cli_args.jobs)
+        if not jobs: exit(1)
+        selected_model = selected_model or spec_settings['model']
+        concurrent_jobs = concurrent_jobs or spec_settings['concurrent']
+    elif cli_args.config:
+        jobs = [job_from_cli_args(cli_args)]
+    else:
+        job, selected_model = prompt_for_job()
+        if not job: exit()
+        jobs = [job]
+
+    if selected_model:
+        AZURE_MODEL_NAME = selected_model
+        print(f"Using model: {AZURE_MODEL_NAME}")
+    else:
+        print(f"Using default model from .env: {AZURE_MODEL_NAME}")
+
+    assign_job_seeds(jobs, MASTER_SEED)
+    print(f"Seed: {MASTER_SEED} (pass --seed {MASTER_SEED} to reproduce this run's structure)")
+
+    # Concurrent jobs writing into one directory would clobber each other's journal and exports
+    output_dirs = [job['output_directory'] or (load_config(job['config_path']) or {}).get('general_settings', {}).get('output_directory') for job in jobs]
+    if len(jobs) > 1 and len(set(output_dirs)) < len(output_dirs):
+        print("Error: Every job needs its own output directory; set 'output_directory' on jobs that share a config.")
+        exit(1)
+
+    if cli_args.shards:
+        # Every shard gets the same master seed, so the shard seeds line up with --shard K/N runs
+        shard_argv = strip_cli_option(strip_cli_option(sys.argv[1:], '--shards'), '--seed') + ['--seed', str(MASTER_SEED)]
+        try:
+            shards_ok = run_local_shards(shard_argv, cli_args.shards, os.path.join(output_dirs[0], SHARDS_DIRNAME))
+        except KeyboardInterrupt:
+            print("\n!!! Generation interrupted. Re-run with --resume to continue the shards from their journals.")
+            exit(1)
+        if not shards_ok:
+            print("\n!!! Some shards failed. Re-run with --resume to finish them, then merge with --merge-shards.")
+            exit(1)
+
+    if cli_args.shards or cli_args.merge_shards:
+        runs = [merge_shards(job) for job in jobs]
+    else:
+        if shard_spec:
+            jobs = [build_shard_job(job, shard_spec[0], shard_spec[1], output_dir) for job, output_dir in zip(jobs, output_dirs)]
+            print(f"\nGenerating shard {shard_spec[0] + 1} of {shard_spec[1]}.")
+
+        if len(jobs) > 1:
+            print(f"\nRunning {len(jobs)} jobs {'concurrently' if concurrent_jobs else 'back-to-back'}.")
+
+        # The console gets errors (live) or warnings and errors (plain); the rest is in the log file
+        live_progress = cli_args.progress == 'live' or (cli_args.progress == 'auto' and sys.stdout.isatty())
+        log_file = cli_args.log_file or os.path.join(jobs[0]['output_directory'] or output_dirs[0] or '.', LOG_FILENAME)
+        configure_logging(log_file, cli_args.log_level, logging.ERROR if live_progress else logging.WARNING)
+        print(f"Generation log: {os.path.abspath(log_file)} ({cli_args.log_level})")
+        progress_dashboard = ProgressDashboard(sum(job['target_item_count'] for job in jobs), live=live_progress, job_count=len(jobs))
+        progress_dashboard.start()
+
+        try:
+            runs = run_generation_jobs(jobs, cli_args.engine, concurrent_jobs, cli_args.max_inflight, resume=cli_args.resume)
+        except KeyboardInterrupt:
+            print("\n!!! Generation interrupted. Re-run with --resume to continue from the journal.")
+            exit(1)
+        finally:
+            try:
+                progress_dashboard.stop()
+                shutdown_step_executors()
+            except KeyboardInterrupt:
+                # A second Ctrl-C while in-flight requests drain: leave without them. Completed
+                # jobs are journaled, so --resume regenerates only the rest
+                shutdown_step_executors(wait=False)
+                print("\n!!! Stopped without waiting for in-flight requests. Re-run with --resume to continue from the journal.", flush=True)
+                os._exit(1)
+
+    if len(jobs) > 1:
+        print(f"\nCompleted {sum(1 for run in runs if run)} of {len(jobs)} jobs:")
+        for job, run in zip(jobs, runs):
+            status = f"{run['generated_item_count']} items -> {os.path.abspath(run['output_dir'])}" if run else "FAILED"
+            print(f"  - {job['config_path']}: {status}")
+
+    llm_usage = new_run_stats()['llm_usage']
+    for run in runs:
+        if run:
+            merge_run_stats(llm_usage, run['stats'].totals['llm_usage'])
+    if llm_usage['requests']:
+        print(f"\n[6] RUN EFFICIENCY")
+        cached_share = (llm_usage['cached_tokens'] / llm_usage['prompt_tokens'] * 100) if llm_usage['prompt_tokens'] else 0
+        print(f"    LLM Requests:             {llm_usage['requests']} ({llm_usage['prompt_tokens']:,} prompt / {llm_usage['completion_tokens']:,} completion tokens)")
+        print(f"    Prompt Cache:             {llm_usage['cached_tokens']:,} cached prompt tokens ({cached_share:.0f}% of input)")
+        print("="*80)
+    if response_cache:
+        response_cache.close()
@@ -0,0 +1,272 @@
+"""
+Benchmarks for the parts of app.py that run locally (everything except the LLM).
+
+    python benchmark.py                                   # run every benchmark
+    python benchmark.py --only pdf,slack_native_10k       # run a subset
+    python benchmark.py --save-baseline bench_base.json   # keep the results for later
+    python benchmark.py --compare bench_base.json         # compare against them
+
+Each benchmark runs in a fresh process, so the peak RSS it reports is its own. The
+functions print progress lines as they do in a real run; that output is discarded.
+Results are ops/sec, peak RSS and bytes produced (returned or written to disk) per op.
+Baselines are machine-specific: save one before a change and compare after it on the
+same machine.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource  # Peak RSS (Unix only)
+except ImportError:
+    resource = None
+
+import app
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config-acme.yaml')
+SEED = 1234
+
+# --- Fixtures ---
+
+def load_fixtures():
+    """Personnel and a scenario with prompt variables from the master config."""
+    config = app.load_config(CONFIG_PATH)
+    personnel_map = app.build_personnel_map(config['company_profiles'])
+    people = [p for p in config['company_profiles'][0]['personnel']]
+    scenario = next((s for s in config['scenarios'] if 'employee_pool' in s.get('prompt_variables', {})),
+                    next(s for s in config['scenarios'] if s.get('prompt_variables')))
+    return personnel_map, people, scenario
+
+def document_text(paragraphs=12):
+    """About 3 KB of attachment text with headings and a few non-Latin-1 characters."""
+    sentence = "The quarterly review found variances in the regional pricing model that require follow-up — see “Appendix B”. "
+    return "\n\n".join(f"Section {i}\n" + sentence * 3 for i in range(1, paragraphs + 1))
+
+def email_content(people, recipients=3):
+    sender = people[0]
+    return {
+        'subject': "Q3 pricing review",
+        'body': "Hi team,\n\n" + "Please review the attached figures before Thursday's call.\n" * 20 + "\nThanks,",
+        'sender_name': sender['name'], 'sender_email': sender['email'],
+        'recipients': [[p['name'], p['email']] for p in people[1:recipients + 1]],
+    }
+
+def chat_content(people, message_count):
+    return {'messages': [{'sender_name': p['name'], 'sender_email': p['email'], 'body': f"update {i} on the pricing file, can you check?"}
+                         for i, p in ((i, people[i % len(people)]) for i in range(message_count))]}
+
+def build_custodian_tree(path, custodians=20, emails=50):
+    """A small dataset (custodian folders of .eml files) for the container benchmark."""
+    body = ("Subject: status\n\n" + "lorem ipsum dolor sit amet " * 150).encode()
+    for c in range(custodians):
+        folder = os.path.join(path, f"custodian{c:02d}")
+        os.makedirs(folder)
+        for e in range(emails):
+            with open(os.path.join(folder, f"item_{e:03d}.eml"), 'wb') as f:
+                f.write(body)
+
+# --- Benchmarks ---
+# Each entry maps a name to a factory: factory(workdir, fixtures) returns (op, prepare).
+# op(i) runs one operation and may return the number of bytes it produced; files it
+# writes under workdir are counted too. prepare(i), when given, runs untimed before op(i)
+# and the files it creates are not counted (op must then report its output itself).
+
+def bench_email(attachments=False, blast=False):
+    def factory(workdir, fixtures):
+        personnel_map, people, _ = fixtures
+        prepared = None
+        if attachments:
+            prepared = [({'filename': 'Pricing_Review.pdf', 'mime_type': 'application/pdf', 'description': 'review'}, document_text()),
+                        ({'filename': 'Pricing_Review.docx', 'mime_type': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document', 'description': 'review'}, document_text()),
+                        ({'filename': 'Pricing_Review.xlsx', 'mime_type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'description': 'review'}, document_text())]
+        email_date = datetime(2026, 3, 2, 10, 30).astimezone()
+
+        def op(i):
+            content = email_content(people)
+            if blast:
+                app.inject_blast_recipients(content, personnel_map)
+            # The writer fills in 'rendered', so every op renders afresh
+            attachments_copy = [(dict(a), text) for a, text in prepared] if prepared else []
+            app.create_and_save_email(f"bench_{i:06d}", content, workdir, email_date, personnel_map, "Pricing review",
+                                      prepared_attachments=attachments_copy)
+        return op, None
+    return factory
+
+def bench_render(func):
+    def factory(workdir, fixtures):
+        text = document_text()
+        return (lambda i: len(func("Pricing_Review", text))), None
+    return factory
+
+def bench_slack_native(message_count):
+    def factory(workdir, fixtures):
+        personnel_map, people, _ = fixtures
+        content = chat_content(people, message_count)
+
+        def op(i):
+            output_dir = os.path.join(workdir, f"run{i}")
+            app.open_slack_export(output_dir)
+            app.create_and_save_slack_native(f"project-pricing-sync_{i}", content, output_dir, datetime(2026, 3, 2, 9, 0), personnel_map)
+            app.close_slack_export(output_dir)
+        return op, None
+    return factory
+
+def bench_rsmf(message_count):
+    def factory(workdir, fixtures):
+        personnel_map, people, _ = fixtures
+        content = chat_content(people, message_count)
+        return (lambda i: app.create_and_save_rsmf(f"project-pricing-sync_{i}", content, workdir, datetime(2026, 3, 2, 9, 0), personnel_map)), None
+    return factory
+
+def bench_timestamp(workdir, fixtures):
+    base = datetime(2026, 3, 2, 9, 0)
+    return (lambda i: app.generate_realistic_timestamp(base, i % 48, "(S1) Price-fixing discussion", i % 5 == 0)), None
+
+def bench_randomized_prompt(workdir, fixtures):
+    personnel_map, _, scenario = fixtures
+    template = scenario['prompts'][0] if isinstance(scenario['prompts'], list) else scenario['prompts']
+    return (lambda i: app.get_randomized_prompt(template, scenario['prompt_variables'], personnel_map, i % 5 + 1)), None
+
+def bench_nested_containers(workdir, fixtures):
+    source = os.path.join(workdir, 'source')
+    build_custodian_tree(source)
+
+    def prepare(i):
+        # The archive is written next to the custodian folders, so each op gets a fresh copy
+        shutil.copytree(source, os.path.join(workdir, f"run{i}"))
+
+    def op(i):
+        output_dir = os.path.join(workdir, f"run{i}")
+        return os.path.getsize(app.create_nested_containers(output_dir))
+    return op, prepare
+
+BENCHMARKS = {
+    'email_plain': bench_email(),
+    'email_attachments': bench_email(attachments=True),
+    'email_blast': bench_email(blast=True),
+    'pdf': bench_render(app.create_fake_pdf_attachment),
+    'docx': bench_render(app.create_fake_word_doc),
+    'xlsx': bench_render(app.create_fake_excel_sheet),
+    'slack_native_1k': bench_slack_native(1000),
+    'slack_native_10k': bench_slack_native(10000),
+    'rsmf_1k': bench_rsmf(1000),
+    'timestamp': bench_timestamp,
+    'randomized_prompt': bench_randomized_prompt,
+    'nested_containers': bench_nested_containers,
+}
+
+# --- Runner ---
+
+def tree_bytes(path):
+    """Bytes on disk under path, counting hard-linked files once."""
+    seen, total = set(), 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            st = os.stat(os.path.join(root, filename))
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                total += st.st_size
+    return total
+
+def peak_rss_mb():
+    if not resource:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+def run_benchmark(name, min_time=1.0, min_ops=3):
+    """Runs one benchmark until min_time has been spent on at least min_ops operations (child process)."""
+    app.seed_job_rng(SEED)
+    app.REFERENCE_NOW = datetime(2026, 6, 1)
+    workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            op, prepare = BENCHMARKS[name](workdir, load_fixtures())
+            setup_bytes = tree_bytes(workdir)
+            ops, elapsed, returned_bytes = 0, 0.0, 0
+            while ops < min_ops or elapsed < min_time:
+                if prepare:
+                    prepare(ops)
+                start = time.perf_counter()
+                produced = op(ops)
+                elapsed += time.perf_counter() - start
+                returned_bytes += produced if isinstance(produced, int) else 0
+                ops += 1
+        written = 0 if prepare else tree_bytes(workdir) - setup_bytes
+        return {'ops': ops, 'seconds': round(elapsed, 4), 'ops_per_sec': round(ops / elapsed, 2),
+                'peak_rss_mb': peak_rss_mb(), 'bytes_per_op': round((returned_bytes + written) / ops)}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def format_bytes(count):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024 or unit == 'GB':
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024
+
+def format_change(current, baseline):
+    if not baseline or current is None:
+        return ""
+    change = (current - baseline) / baseline * 100
+    return f" ({'+' if change >= 0 else ''}{change:.0f}%)"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the non-LLM hot paths of app.py")
+    parser.add_argument('--only', help=f"Comma-separated benchmarks to run (available: {', '.join(BENCHMARKS)})")
+    parser.add_argument('--min-time', type=float, default=1.0, help="Seconds to spend per benchmark (default: 1.0)")
+    parser.add_argument('--min-ops', type=int, default=3, help="Minimum operations per benchmark (default: 3)")
+    parser.add_argument('--save-baseline', metavar='JSON', help="Write the results to this file")
+    parser.add_argument('--compare', metavar='JSON', help="Compare against a saved baseline")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="With --compare, exit non-zero when ops/sec drops by more than this percentage (default: 10)")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.only.split(',')] if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    print(f"{'Benchmark':<20} {'ops/sec':>12} {'peak RSS':>16} {'bytes/op':>18}")
+    print("-" * 70)
+    results, regressions = {}, []
+    # spawn: every benchmark starts from a clean interpreter, so peak RSS is its own
+    context = multiprocessing.get_context('spawn')
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_benchmark, name, args.min_time, args.min_ops).result()
+        results[name] = result
+        base = baseline.get(name, {})
+        rss = f"{result['peak_rss_mb']:.1f} MB" if result['peak_rss_mb'] is not None else "n/a"
+        print(f"{name:<20} {result['ops_per_sec']:>12,.1f}{format_change(result['ops_per_sec'], base.get('ops_per_sec'))} "
+              f"{rss:>10}{format_change(result['peak_rss_mb'], base.get('peak_rss_mb'))} "
+              f"{format_bytes(result['bytes_per_op']):>10}{format_change(result['bytes_per_op'], base.get('bytes_per_op'))}")
+        if base.get('ops_per_sec') and result['ops_per_sec'] < base['ops_per_sec'] * (1 - args.threshold / 100):
+            regressions.append(name)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                       'platform': platform.platform(), 'results': results}, f, indent=2)
+        print(f"\nBaseline saved: {os.path.abspath(args.save_baseline)}")
+
+    if regressions:
+        print(f"\nSlower than baseline by more than {args.threshold:.0f}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
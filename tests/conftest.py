@@ -0,0 +1,62 @@
+"""Shared helpers: the tests run app.py end to end as a subprocess, the way the CLI is used."""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(REPO_ROOT, 'app.py')
+CONFIG = os.path.join(REPO_ROOT, 'config-acme.yaml')
+# Unit tests import app.py directly
+sys.path.insert(0, REPO_ROOT)
+
+# Run-specific files that legitimately differ between otherwise identical runs
+VOLATILE_FILES = {'generation.log', 'generation_journal.jsonl', 'run_profile.json', 'run_profile.csv'}
+
+
+def app_command(output_dir, count, *extra, backend='mock'):
+    """Command line for a non-interactive run of the acme config."""
+    command = [sys.executable, APP, '--backend', backend, '--config', CONFIG, '--count', str(count),
+               '--output-dir', str(output_dir), '--progress', 'plain']
+    if backend == 'mock':
+        command += ['--mock-latency-ms', '0']
+    return command + [str(arg) for arg in extra]
+
+
+def run_app(output_dir, count, *extra, backend='mock', env=None, timeout=600):
+    """Runs app.py to completion and returns the CompletedProcess (stdout and stderr merged)."""
+    return subprocess.run(app_command(output_dir, count, *extra, backend=backend), env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=timeout)
+
+
+def read_journal(output_dir):
+    """The run's journal records, in order."""
+    with open(os.path.join(output_dir, 'generation_journal.jsonl'), encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def journal_items(output_dir):
+    """Items the journal records as completed."""
+    return sum(record['items'] for record in read_journal(output_dir) if record['type'] == 'complete')
+
+
+def dataset_files(output_dir):
+    """Relative path -> bytes of every generated file, without the run-specific ones."""
+    files = {}
+    for root, _, names in os.walk(output_dir):
+        for name in names:
+            if name in VOLATILE_FILES:
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, output_dir)] = f.read()
+    return files
+
+
+@pytest.fixture
+def in_tmp(tmp_path, monkeypatch):
+    """Runs the test from an empty directory, so output paths can be compared by name."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
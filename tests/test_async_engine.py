@@ -0,0 +1,96 @@
+"""--engine async against a local fake Azure OpenAI endpoint (no credentials or network needed)."""
+import json
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conftest import REPO_ROOT, app_command, journal_items, read_journal, run_app
+
+COUNT = 12
+
+
+class FakeAzureOpenAI(BaseHTTPRequestHandler):
+    """Answers chat completions with one JSON object that satisfies every response kind."""
+    delay = 0.0
+    paths = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        type(self).paths.append(self.path)
+        time.sleep(self.delay)
+        context = "\n".join(message['content'] for message in body['messages'])
+        people = re.findall(r"^- ([^,\n]+), [^\n]*\(([^()\s]+@[^()\s]+)\)$", context, re.MULTILINE)[:3]
+        (sender_name, sender_email), recipients = people[0], [list(person) for person in people[1:]]
+        content = json.dumps({
+            'subject': 'Pricing follow-up', 'body': 'Hi,\n\nFollowing up on the pricing discussion.\n\nThanks,',
+            'sender_name': sender_name, 'sender_email': sender_email, 'recipients': recipients,
+            'summary': 'Pricing sync', 'description': 'Quarterly pricing review.',
+            'organizer_name': sender_name, 'organizer_email': sender_email, 'attendees': recipients,
+            'messages': [{'sender_name': name, 'sender_email': email, 'body': 'checking now'} for name, email in people],
+        })
+        payload = json.dumps({
+            'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': 0, 'model': body.get('model', 'fake'),
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': 1000, 'completion_tokens': 100, 'total_tokens': 1100},
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_endpoint():
+    """Starts the fake endpoint; yields the environment that points app.py at it."""
+    handler = type('Handler', (FakeAzureOpenAI,), {'paths': []})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    env = dict(os.environ, AZURE_ENDPOINT=f"http://127.0.0.1:{server.server_port}",
+               AZURE_API_KEY='test-key', AZURE_API_VERSION='2024-06-01')
+    yield env, handler
+    server.shutdown()
+    server.server_close()
+
+
+def test_async_engine_generates_through_the_azure_client(tmp_path, fake_endpoint):
+    env, handler = fake_endpoint
+    result = run_app(tmp_path / 'out', COUNT, '--engine', 'async', '--model', 'fake-model', '--seed', 1,
+                     backend='azure', env=env)
+
+    assert result.returncode == 0, result.stdout
+    assert handler.paths and all('/openai/deployments/fake-model/chat/completions' in path for path in handler.paths)
+    assert COUNT <= journal_items(tmp_path / 'out') < COUNT + 10
+    assert 'CERTIFICATION REPORT' in result.stdout
+
+
+def test_async_engine_drains_on_ctrl_c(tmp_path, fake_endpoint):
+    env, handler = fake_endpoint
+    handler.delay = 0.3
+    output_dir = tmp_path / 'out'
+    command = app_command(output_dir, 200, '--engine', 'async', '--model', 'fake-model', '--seed', 1, backend='azure')
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    journal = output_dir / 'generation_journal.jsonl'
+    deadline = time.monotonic() + 60
+    while not (journal.exists() and '"complete"' in journal.read_text()) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    process.send_signal(signal.SIGINT)
+    stdout, _ = process.communicate(timeout=120)
+
+    assert process.returncode == 1, stdout
+    assert 'Generation interrupted' in stdout
+    assert 'CERTIFICATION REPORT' not in stdout
+    # In-flight jobs were allowed to finish, so every job that started was journaled as complete
+    records = read_journal(output_dir)
+    started = {record['job'] for record in records if record['type'] == 'start'}
+    completed = {record['job'] for record in records if record['type'] == 'complete'}
+    assert started and started == completed
@@ -0,0 +1,28 @@
+"""Job spec validation (--jobs): bad entries are rejected before anything runs."""
+import pytest
+
+import app
+from conftest import CONFIG
+
+
+def write_spec(tmp_path, **job):
+    spec = tmp_path / 'jobs.yaml'
+    lines = ["jobs:", f"  - config: {CONFIG}", "    count: 5"] + [f"    {key}: {value}" for key, value in job.items()]
+    spec.write_text("\n".join(lines) + "\n")
+    return str(spec)
+
+
+@pytest.mark.parametrize('log_size_mb', ['0', '-5', '2.5', 'big', 'true'])
+def test_rejects_invalid_log_size(tmp_path, capsys, log_size_mb):
+    jobs, settings = app.load_job_spec(write_spec(tmp_path, log_size_mb=log_size_mb))
+
+    assert jobs is None and settings is None
+    assert "Job #1" in capsys.readouterr().out
+
+
+def test_accepts_log_size_and_defaults_it(tmp_path):
+    jobs, _ = app.load_job_spec(write_spec(tmp_path, log_size_mb=5))
+    assert jobs[0]['log_size_mb'] == 5
+
+    jobs, _ = app.load_job_spec(write_spec(tmp_path))
+    assert jobs[0]['log_size_mb'] == 50
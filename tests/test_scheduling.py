@@ -0,0 +1,126 @@
+"""Which scenario jobs a run dispatches: seeded determinism, the count target, resume and shards."""
+import os
+import random
+import shutil
+import signal
+import subprocess
+import time
+
+import pytest
+
+import app
+from conftest import CONFIG, app_command, dataset_files, journal_items, read_journal, run_app
+
+# Most items one acme scenario can produce (its longest thread)
+MOST_PER_SCENARIO = max(app.max_scenario_items(scenario) for scenario in app.load_config(CONFIG)['scenarios'])
+
+SCENARIOS = [
+    {'base_filename': 'thread_long', 'type': 'thread', 'prompts': ['p'] * 9},
+    {'base_filename': 'thread_short', 'type': 'thread', 'prompts': ['p'] * 2},
+    {'base_filename': 'standalone', 'type': 'standalone', 'prompts': ['p']},
+    {'base_filename': 'chat', 'type': 'chat', 'prompts': ['p']},
+]
+
+
+def job_output(scenario, run_counter):
+    """A fixed item count per job, anywhere between a failure (0) and the scenario's most."""
+    return random.Random(f"{scenario['base_filename']}/{run_counter}").randint(0, app.max_scenario_items(scenario))
+
+
+def simulate(target, workers, order_seed, completed=None):
+    """Drives a ScenarioPlan with jobs finishing in a random order; returns (dispatched jobs, committed items)."""
+    plan = app.ScenarioPlan(SCENARIOS, target, seed=3, completed=completed)
+    order = random.Random(order_seed)
+    in_flight, dispatched = [], []
+    while True:
+        while len(in_flight) < workers and (job := plan.next_job()) is not None:
+            in_flight.append(job)
+            dispatched.append((job[0]['base_filename'], job[1], job[2]))
+        if not in_flight:
+            return dispatched, plan.committed
+        job = in_flight.pop(order.randrange(len(in_flight)))
+        plan.finish(job, job_output(job[0], job[1]))
+
+
+@pytest.mark.parametrize('target', [1, 7, 40, 333])
+def test_plan_ignores_completion_order(target):
+    runs = [simulate(target, workers, order_seed) for workers in (1, 3, 16, 200) for order_seed in range(3)]
+
+    assert all(run == runs[0] for run in runs)
+    committed = runs[0][1]
+    assert target <= committed < target + 9
+
+
+def test_plan_replays_completed_jobs_in_place():
+    dispatched, committed = simulate(120, 8, 0)
+    # Pretend the first half of the jobs finished before a crash
+    done = {(name, run_counter): job_output(next(s for s in SCENARIOS if s['base_filename'] == name), run_counter)
+            for name, run_counter, _ in dispatched[:len(dispatched) // 2]}
+    resumed, resumed_committed = simulate(120, 8, 1, completed=done)
+
+    assert resumed == dispatched[len(dispatched) // 2:]
+    assert resumed_committed == committed
+
+
+@pytest.mark.parametrize('count', [5, 40])
+def test_run_meets_the_count_within_one_scenario(tmp_path, count):
+    result = run_app(tmp_path / 'out', count, '--seed', 11)
+
+    assert result.returncode == 0, result.stdout
+    assert count <= journal_items(tmp_path / 'out') < count + MOST_PER_SCENARIO
+
+
+def test_seeded_runs_match_across_engines_and_worker_counts(in_tmp):
+    """Runs write to the same output path (the Slack Team ID derives from it) and are moved aside."""
+    datasets = {}
+    for name, options in [('thread-2', ['--max-workers', 2]), ('thread-12', ['--max-workers', 12]),
+                          ('async', ['--engine', 'async']), ('batch', ['--engine', 'batch'])]:
+        result = run_app('out', 30, '--seed', 5, '--chat-format', 'all', *options)
+        assert result.returncode == 0, result.stdout
+        datasets[name] = dataset_files('out')
+        shutil.rmtree('out')
+
+    reference = datasets.pop('thread-2')
+    assert reference
+    for name, files in datasets.items():
+        assert sorted(files) == sorted(reference), name
+        assert [path for path in reference if files[path] != reference[path]] == [], name
+
+
+def test_resume_after_kill_matches_uninterrupted_run(in_tmp):
+    options = ['--seed', 9, '--mock-latency-ms', 100]
+    assert run_app('out', 60, *options).returncode == 0
+    uninterrupted = dataset_files('out')
+    shutil.rmtree('out')
+
+    process = subprocess.Popen(app_command('out', 60, *options), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline and not (os.path.exists('out/generation_journal.jsonl') and
+                                               sum(r['type'] == 'complete' for r in read_journal('out')) >= 5):
+        time.sleep(0.05)
+    process.send_signal(signal.SIGKILL)
+    process.wait()
+    assert journal_items('out') < 60, "the run finished before it could be interrupted"
+
+    result = run_app('out', 60, '--resume', *options)
+
+    assert result.returncode == 0, result.stdout
+    resumed = dataset_files('out')
+    assert sorted(resumed) == sorted(uninterrupted)
+    assert [path for path in uninterrupted if resumed[path] != uninterrupted[path]] == []
+
+
+def test_shards_merge_into_one_dataset(tmp_path):
+    output_dir = tmp_path / 'out'
+    result = run_app(output_dir, 24, '--seed', 2, '--shards', 3)
+
+    assert result.returncode == 0, result.stdout
+    shard_dirs = sorted((output_dir / 'shards').glob('shard-*-of-003'))
+    assert len(shard_dirs) == 3
+    shard_items = [journal_items(shard_dir) for shard_dir in shard_dirs]
+    # Each shard meets its share (24 / 3) within one scenario's output
+    assert all(8 <= items < 8 + MOST_PER_SCENARIO for items in shard_items)
+    assert 'CERTIFICATION REPORT' in result.stdout
+    # Items were moved out of the shards into the final directory
+    assert any(path.endswith('.eml') for path in dataset_files(output_dir))
+    assert not any(path.endswith('.eml') for shard_dir in shard_dirs for path in dataset_files(shard_dir))
@@ -0,0 +1,76 @@
+"""Sized PDF/DOCX/XLSX stress attachments: the targets are met and the files open."""
+import io
+import re
+import zipfile
+
+import pytest
+from docx import Document
+
+import app
+
+SEED_TEXT = ("The pricing committee reviewed the quarterly distributor margins and agreed on next steps.\n\n"
+             "Regional leads will circulate revised rate cards before the Thursday call.")
+
+
+def sized(mime_type, filename, **size):
+    out = io.BytesIO()
+    app.write_sized_attachment(out, {'size': size, 'filename': filename, 'mime_type': mime_type, 'seed': 7}, SEED_TEXT)
+    return out.getvalue()
+
+
+def pdf_page_count(data):
+    """Page count from the page tree, cross-checked with pypdf when it is installed."""
+    count = int(re.search(rb"/Type/Pages/Count (\d+)", data).group(1))
+    try:
+        import pypdf
+    except ImportError:
+        return count
+    assert len(pypdf.PdfReader(io.BytesIO(data)).pages) == count
+    return count
+
+
+@pytest.mark.parametrize('pages', [1, 2, 7, 300])
+def test_pdf_has_exactly_the_target_pages(pages):
+    data = sized(app.PDF_MIME, 'binder.pdf', pages=pages)
+
+    assert data.startswith(b"%PDF-1.4") and data.rstrip().endswith(b"%%EOF")
+    assert pdf_page_count(data) == pages
+
+
+def test_pdf_mb_target_is_a_minimum():
+    data = sized(app.PDF_MIME, 'binder.pdf', pages=2, mb=1)
+
+    assert len(data) >= 1024 * 1024
+    assert pdf_page_count(data) > 2
+
+
+def test_docx_opens_and_meets_its_targets():
+    data = sized(app.DOCX_MIME, 'memo.docx', pages=20, mb=1)
+
+    assert len(data) >= 1024 * 1024
+    paragraphs = [p for p in Document(io.BytesIO(data)).paragraphs if p.text.strip()]
+    assert len(paragraphs) >= 20 * app.DOCX_PARAGRAPHS_PER_PAGE
+
+
+def test_xlsx_has_the_target_rows():
+    data = sized(app.XLSX_MIME, 'ledger.xlsx', rows=2500)
+
+    with zipfile.ZipFile(io.BytesIO(data)) as package:
+        assert package.testzip() is None
+        sheet = package.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        core = package.read('docProps/core.xml').decode('utf-8')
+    assert len(re.findall(r">REC-\d+<", sheet)) == 2500
+    assert '<dc:creator>synth-data</dc:creator>' in core
+    try:
+        import openpyxl
+    except ImportError:
+        return
+    rows = list(openpyxl.load_workbook(io.BytesIO(data), read_only=True).active.values)
+    assert sum(1 for row in rows if row and str(row[0]).startswith('REC-')) == 2500
+
+
+def test_sized_documents_are_reproducible(monkeypatch):
+    # Seeded runs pin "now", which dates the XLSX records and the document properties
+    monkeypatch.setattr(app, 'REFERENCE_NOW', app.datetime(2026, 1, 5))
+    for mime_type, filename in [(app.PDF_MIME, 'a.pdf'), (app.DOCX_MIME, 'a.docx'), (app.XLSX_MIME, 'a.xlsx')]:
+        assert sized(mime_type, filename, pages=3, rows=50) == sized(mime_type, filename, pages=3, rows=50)